@@ -0,0 +1,142 @@
+"""
+Бенчмарк записи в bank_buffer и bank_analysis: построчный INSERT и
+execute_values против COPY (FORMAT binary).
+
+Каждый вариант выполняется в отдельной транзакции, которая затем
+откатывается, поэтому данные в БД не остаются. Нужна БД со схемой из
+src/app/pgvector/init и хотя бы одним банком и продуктом.
+
+Запуск из корня репозитория:
+    python -m benchmarks.db_writers --rows 20000 --raw-rows 2000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timezone
+
+from src.app.agents.web_search_agent.tools import (
+    content_hash,
+    write_processed_rows,
+    write_raw_rows,
+)
+from src.app.domain.models import (
+    CriterionWithEmbedding,
+    WebSearchItem,
+    WebSearchResult,
+)
+from src.app.infra.db.connection import create_connection
+from src.app.infra.db.reference_cache import reference_cache
+
+
+def make_criteria(count: int, bank_id: int, product_id: int, dim: int = 384):
+    ts = datetime.now(timezone.utc)
+    return [
+        CriterionWithEmbedding(
+            bank_id=bank_id,
+            product_id=product_id,
+            criterion=f"критерий {i % 500}",
+            criterion_embed=[random.random() for _ in range(dim)],
+            source=f"https://example.com/page/{i % 50}",
+            data=f"{i} рублей",
+            ts=ts,
+        )
+        for i in range(count)
+    ]
+
+
+def make_results(count: int, bank_id: int, product_id: int, size: int = 10000):
+    items = [
+        WebSearchItem(
+            source=f"https://example.com/bench/{i}",
+            content=f"{i} " + "текст страницы " * (size // 15),
+        )
+        for i in range(count)
+    ]
+    return [WebSearchResult(bank_id=bank_id, product_id=product_id, items=items)]
+
+
+def timed(conn, label: str, rows: int, func):
+    with conn.cursor() as cursor:
+        start = time.perf_counter()
+        func(cursor)
+        elapsed = time.perf_counter() - start
+    conn.rollback()
+    print(f"{label:<40} {elapsed:8.3f} s  {rows / elapsed:12.0f} rows/s")
+
+
+def insert_raw_row_by_row(cursor, results, ts):
+    for result in results:
+        for item in result.items:
+            cursor.execute(
+                """
+                INSERT INTO raw_pages (source, content_hash, raw_data, first_seen, last_seen)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (source, content_hash)
+                DO UPDATE SET last_seen = EXCLUDED.last_seen
+                RETURNING id
+                """,
+                (item.source, content_hash(item.content), item.content, ts, ts),
+            )
+            page_id = cursor.fetchone()[0]
+            cursor.execute(
+                """
+                INSERT INTO bank_buffer (bank_id, product_id, page_id, source, ts)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (bank_id, product_id, page_id) DO NOTHING
+                """,
+                (result.bank_id, result.product_id, page_id, item.source, ts),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--raw-rows", type=int, default=2000)
+    parser.add_argument("--flush-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    reference = reference_cache.get()
+    bank_id = min(reference.banks)
+    product_id = min(reference.products)
+
+    conn = create_connection()
+    try:
+        criteria = make_criteria(args.rows, bank_id, product_id)
+        print(f"bank_analysis, {args.rows} rows x 384 dims")
+        timed(
+            conn,
+            "execute_values (текущий путь)",
+            args.rows,
+            lambda cursor: write_processed_rows(cursor, criteria, mode="insert"),
+        )
+        timed(
+            conn,
+            f"COPY binary (flush {args.flush_size})",
+            args.rows,
+            lambda cursor: write_processed_rows(
+                cursor, criteria, mode="copy", flush_size=args.flush_size
+            ),
+        )
+
+        results = make_results(args.raw_rows, bank_id, product_id)
+        ts = datetime.utcnow()
+        print(f"\nbank_buffer/raw_pages, {args.raw_rows} pages x ~10 KB")
+        timed(
+            conn,
+            "INSERT per item (текущий путь)",
+            args.raw_rows,
+            lambda cursor: insert_raw_row_by_row(cursor, results, ts),
+        )
+        timed(
+            conn,
+            f"COPY binary + staging (flush {args.flush_size})",
+            args.raw_rows,
+            lambda cursor: write_raw_rows(cursor, results, ts, args.flush_size),
+        )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Бенчмарк движков извлечения текста из HTML на сохранённых страницах.
+
+Сравнивает прежний парсер WebContentFetcher (BeautifulSoup + html.parser,
+вырезание не-ASCII символов) с движками из src.app.tools.html_extractor:
+время на страницу, размер результата и долю кириллицы в нём.
+
+Запуск из корня репозитория:
+    python -m benchmarks.html_extractors --repeat 50
+"""
+
+import argparse
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+from src.app.tools.html_extractor import EXTRACTORS, get_extractor
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "html"
+# Крупная страница: фикстуры, склеенные несколько раз подряд
+LARGE_PAGE_COPIES = 20
+
+
+def legacy_extract(html: str) -> str:
+    """Извлечение текста в том виде, в каком оно было в WebContentFetcher"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    for element in soup(
+        [
+            "script",
+            "style",
+            "nav",
+            "header",
+            "footer",
+            "iframe",
+            "noscript",
+            "aside",
+            "form",
+        ]
+    ):
+        element.decompose()
+
+    main_content = (
+        soup.find("main")
+        or soup.find("article")
+        or soup.find(id=re.compile("content|main|article", re.I))
+        or soup.find(class_=re.compile("content|main|article", re.I))
+        or soup.body
+    )
+
+    if main_content:
+        text = main_content.get_text(separator=" ", strip=True)
+    else:
+        text = soup.get_text(separator=" ", strip=True)
+
+    text = re.sub(r"\s+", " ", text).strip()
+    text = re.sub(r"[^\x00-\x7F]+", " ", text)
+    return text
+
+
+def load_pages() -> Dict[str, str]:
+    pages = {
+        path.stem: path.read_text(encoding="utf-8")
+        for path in sorted(FIXTURES_DIR.glob("*.html"))
+    }
+    bodies = "".join(
+        re.search(r"<body[^>]*>(.*)</body>", html, re.S).group(1)
+        for html in pages.values()
+    )
+    pages["large"] = f"<html><body>{bodies * LARGE_PAGE_COPIES}</body></html>"
+    return pages
+
+
+def cyrillic_share(text: str) -> float:
+    letters = [char for char in text if char.isalpha()]
+    if not letters:
+        return 0.0
+    return sum("а" <= char.lower() <= "я" or char in "ёЁ" for char in letters) / len(
+        letters
+    )
+
+
+def bench(extract: Callable[[str], str], html: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = extract(html)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument(
+        "--show", action="store_true", help="печатать извлечённый текст"
+    )
+    args = parser.parse_args()
+
+    extractors: Dict[str, Callable[[str], str]] = {"legacy": legacy_extract}
+    for name in EXTRACTORS:
+        try:
+            extractors[name] = get_extractor(name).extract
+        except ImportError as e:
+            print(f"Skipping {name}: {str(e)}")
+
+    print(
+        f"{'page':<12} {'html KB':>8} {'extractor':<8} {'ms/page':>9} "
+        f"{'chars':>8} {'cyrillic':>9}"
+    )
+    for page, html in load_pages().items():
+        size_kb = len(html.encode("utf-8")) / 1024
+        repeat = max(1, args.repeat // LARGE_PAGE_COPIES) if page == "large" else args.repeat
+        for name, extract in extractors.items():
+            elapsed_ms, text = bench(extract, html, repeat)
+            print(
+                f"{page:<12} {size_kb:>8.1f} {name:<8} {elapsed_ms:>9.2f} "
+                f"{len(text):>8} {cyrillic_share(text):>9.0%}"
+            )
+            if args.show and page != "large":
+                print(text, end="\n\n")
+
+
+if __name__ == "__main__":
+    main()
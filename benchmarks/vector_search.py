@@ -0,0 +1,250 @@
+"""
+Бенчмарк ANN-индексов pgvector: задержка, recall@k и доля пустых ответов.
+
+Замеры идут для набора значений hnsw.ef_search и ivfflat.probes.
+
+--filter pair (по умолчанию) повторяет предикат рабочего запроса
+(bank_id AND product_id, см. TOPK_QUERY): именно при таком узком фильтре
+HNSW теряет recall, поэтому рекомендации ef_search/probes стоит брать из
+этого режима. --iterative-scan задаёт hnsw/ivfflat.iterative_scan так же,
+как apply_search_settings (ANN_ITERATIVE_SCAN).
+
+Данные синтетические, но кластеризованные (смесь гауссиан вокруг
+"критериев"), как и реальные эмбеддинги критериев. Таблица bench_vectors
+создаётся заново для каждого размера и удаляется в конце.
+
+Запуск из корня репозитория:
+    python -m benchmarks.vector_search --rows 100000 1000000 --queries 100
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.app.infra.db.connection import create_connection
+from src.app.infra.db.copy import copy_rows
+from src.app.infra.db.migrations import ITERATIVE_SCAN_MODES, ivfflat_lists
+from src.app.infra.embedder.client import EMBEDDING_DIM
+
+TABLE = "bench_vectors"
+PRODUCTS = 20
+BANKS = 50
+CLUSTERS = 2000
+LOAD_CHUNK = 50_000
+
+FILTERS = {
+    "none": "",
+    "product": "WHERE product_id = %(product_id)s",
+    "pair": "WHERE bank_id = %(bank_id)s AND product_id = %(product_id)s",
+}
+
+EF_SEARCH_VALUES = [10, 20, 40, 80, 160, 320]
+PROBES_VALUES = [1, 2, 5, 10, 20, 50]
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def to_literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{x:.6f}" for x in vector) + "]"
+
+
+def load_table(cursor, rows: int, dim: int, rng: np.random.Generator):
+    centers = unit(rng.normal(size=(CLUSTERS, dim))).astype(np.float32)
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(
+        f"""
+        CREATE TABLE {TABLE} (
+            id         SERIAL PRIMARY KEY,
+            bank_id    INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            embed      vector({dim}) NOT NULL
+        )
+        """
+    )
+
+    for start in range(0, rows, LOAD_CHUNK):
+        size = min(LOAD_CHUNK, rows - start)
+        cluster = rng.integers(0, CLUSTERS, size=size)
+        vectors = unit(
+            centers[cluster] + rng.normal(scale=0.08, size=(size, dim))
+        ).astype(np.float32)
+        banks = rng.integers(1, BANKS + 1, size=size)
+        copy_rows(
+            cursor,
+            TABLE,
+            ["bank_id", "product_id", "embed"],
+            ["int4", "int4", "vector"],
+            [
+                (int(bank), int(c % PRODUCTS) + 1, vector.tolist())
+                for bank, c, vector in zip(banks, cluster, vectors)
+            ],
+        )
+    cursor.execute(f"ANALYZE {TABLE}")
+    return centers
+
+
+def make_queries(centers: np.ndarray, count: int, rng: np.random.Generator):
+    cluster = rng.integers(0, CLUSTERS, size=count)
+    banks = rng.integers(1, BANKS + 1, size=count)
+    vectors = unit(
+        centers[cluster] + rng.normal(scale=0.1, size=(count, centers.shape[1]))
+    )
+    return [
+        (to_literal(vector), int(bank), int(c % PRODUCTS) + 1)
+        for vector, bank, c in zip(vectors, banks, cluster)
+    ]
+
+
+def run_queries(cursor, queries, k: int, filter_mode: str, settings: Dict[str, str]):
+    results, timings = [], []
+    where = FILTERS[filter_mode]
+    sql = (
+        f"SELECT id FROM {TABLE} {where} "
+        f"ORDER BY embed <=> %(vector)s::vector LIMIT %(k)s"
+    )
+    for name, value in settings.items():
+        cursor.execute(f"SET {name} = {value}")
+    for vector, bank_id, product_id in queries:
+        start = time.perf_counter()
+        cursor.execute(
+            sql,
+            {"vector": vector, "bank_id": bank_id, "product_id": product_id, "k": k},
+        )
+        ids = {row[0] for row in cursor.fetchall()}
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    return results, timings
+
+
+def recall(found: List[set], truth: List[set]) -> float:
+    return statistics.mean(
+        len(f & t) / len(t) if t else 1.0 for f, t in zip(found, truth)
+    )
+
+
+def empty_rate(found: List[set], truth: List[set]) -> float:
+    """Доля запросов без ответа, хотя в паре есть строки"""
+    return statistics.mean(1.0 if t and not f else 0.0 for f, t in zip(found, truth))
+
+
+def report(
+    label: str,
+    timings: List[float],
+    value: Optional[float],
+    empty: Optional[float] = None,
+):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+    recall_text = f"{value:7.3f}" if value is not None else "      -"
+    empty_text = f"{empty:6.1%}" if empty is not None else "     -"
+    print(
+        f"  {label:<22} p50 {statistics.median(timings):8.2f} ms   "
+        f"p95 {p95:8.2f} ms   recall {recall_text}   empty {empty_text}"
+    )
+
+
+def bench_size(conn, rows: int, args, rng: np.random.Generator):
+    print(
+        f"\n=== {rows} rows, dim {args.dim}, filter: {args.filter}, "
+        f"iterative_scan: {args.iterative_scan} ==="
+    )
+    with conn.cursor() as cursor:
+        start = time.perf_counter()
+        centers = load_table(cursor, rows, args.dim, rng)
+        print(f"Loaded in {time.perf_counter() - start:.1f} s")
+
+        queries = make_queries(centers, args.queries, rng)
+
+        truth, timings = run_queries(
+            cursor, queries, args.k, args.filter, {"enable_indexscan": "off"}
+        )
+        report("exact scan", timings, None)
+        cursor.execute("RESET enable_indexscan")
+
+        cursor.execute(f"SET maintenance_work_mem = '{args.maintenance_work_mem}'")
+        for index_type in args.index:
+            cursor.execute(f"DROP INDEX IF EXISTS {TABLE}_ann")
+            if index_type == "hnsw":
+                ddl = (
+                    f"CREATE INDEX {TABLE}_ann ON {TABLE} USING hnsw "
+                    f"(embed vector_cosine_ops) WITH (m = {args.m}, "
+                    f"ef_construction = {args.ef_construction})"
+                )
+                knob, values = "hnsw.ef_search", EF_SEARCH_VALUES
+                iterative_scan = args.iterative_scan
+            else:
+                ddl = (
+                    f"CREATE INDEX {TABLE}_ann ON {TABLE} USING ivfflat "
+                    f"(embed vector_cosine_ops) WITH (lists = {ivfflat_lists(rows)})"
+                )
+                knob, values = "ivfflat.probes", PROBES_VALUES
+                # ivfflat поддерживает только off и relaxed_order
+                iterative_scan = (
+                    "relaxed_order"
+                    if args.iterative_scan == "strict_order"
+                    else args.iterative_scan
+                )
+
+            start = time.perf_counter()
+            cursor.execute(ddl)
+            print(f"{index_type}: built in {time.perf_counter() - start:.1f} s")
+
+            for value in values:
+                found, timings = run_queries(
+                    cursor,
+                    queries,
+                    args.k,
+                    args.filter,
+                    {
+                        knob: str(value),
+                        f"{index_type}.iterative_scan": iterative_scan,
+                    },
+                )
+                report(
+                    f"{knob}={value}",
+                    timings,
+                    recall(found, truth),
+                    empty_rate(found, truth),
+                )
+
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument(
+        "--index", nargs="+", choices=["hnsw", "ivfflat"], default=["hnsw", "ivfflat"]
+    )
+    parser.add_argument("--filter", choices=list(FILTERS), default="pair")
+    parser.add_argument(
+        "--iterative-scan", choices=ITERATIVE_SCAN_MODES, default="relaxed_order"
+    )
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    conn = create_connection()
+    conn.autocommit = True
+    try:
+        for rows in args.rows:
+            bench_size(conn, rows, args, rng)
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import traceback
+from os import getenv
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from src.app.agents.web_search_agent.tools import save_raw_data
+from src.app.domain.models import WebSearchItem, WebSearchResult
+from src.app.infra.db.reference_cache import reference_cache
+from src.app.infra.llm.client import light_llm
+from src.app.tools.web_search_tools import SearchResult, fetcher, searcher
+
+
+class RelevantResults(BaseModel):
+    numbers: List[int] = Field(
+        description="Номера результатов, относящихся к продукту указанного банка"
+    )
+
+
+def build_search_query(bank_name: str, product_name: str) -> str:
+    """Поисковый запрос для пары банк-продукт"""
+    return f"{product_name} {bank_name} условия тарифы"
+
+
+def filter_relevant_results(
+    results: List[SearchResult], bank_name: str, product_name: str
+) -> List[SearchResult]:
+    """
+    Отбирает результаты, относящиеся к паре банк-продукт, по заголовкам и
+    сниппетам одним запросом к лёгкой модели. При ошибке модели выдача
+    возвращается без изменений.
+    """
+    if not results:
+        return results
+
+    listing = "\n".join(
+        f"{result.position}. {result.title}\n   {result.link}\n   {result.snippet}"
+        for result in results
+    )
+    prompt = (
+        f"Ниже результаты поиска по запросу о продукте «{product_name}» "
+        f"банка «{bank_name}».\n\n{listing}\n\n"
+        f"Верни номера результатов, которые описывают условия именно этого "
+        f"продукта именно этого банка (официальный сайт банка, банковские "
+        f"агрегаторы). Новости, форумы и страницы других банков не включай."
+    )
+
+    try:
+        answer: RelevantResults = light_llm.with_structured_output(
+            RelevantResults
+        ).invoke(prompt)
+    except Exception as e:
+        print(f"Relevance filter failed, keeping all results: {str(e)}")
+        return results
+
+    numbers = set(answer.numbers)
+    return [result for result in results if result.position in numbers]
+
+
+def collect_pair_direct(query: Dict[str, Dict[str, int]]) -> bool:
+    """
+    Собирает сырые данные для пары банк-продукт без агента: поиск через
+    SerperSearcher, загрузка страниц через WebContentFetcher и запись в
+    bank_buffer через save_raw_data.
+
+    Args:
+        query: Словарь вида {prompt: {"bank_id": bank_id, "product_id": product_id}}
+            (как в get_bank_and_products; prompt не используется)
+
+    Returns:
+        bool: True если данные по паре были сохранены
+    """
+    metadata = list(query.values())[0]
+    bank_id = metadata["bank_id"]
+    product_id = metadata["product_id"]
+
+    if searcher is None:
+        print("Search service is not available, check SERPER_API_KEY")
+        return False
+
+    max_results = int(getenv("COLLECTION_MAX_RESULTS", "5"))
+    min_chars = int(getenv("COLLECTION_MIN_CHARS", "200"))
+    use_filter = getenv("COLLECTION_LLM_FILTER", "0") == "1"
+
+    try:
+        bank_name = reference_cache.bank_name(bank_id)
+        product_name = reference_cache.product_name(product_id)
+        search_query = build_search_query(bank_name, product_name)
+        print(
+            f"\nDirect collection for bank_id={bank_id}, product_id={product_id}: {search_query}"
+        )
+
+        results = searcher.search(search_query, max_results)
+        if use_filter:
+            relevant = filter_relevant_results(results, bank_name, product_name)
+            print(f"Relevance filter kept {len(relevant)} of {len(results)} results")
+            results = relevant
+
+        items: List[WebSearchItem] = []
+        seen_links = set()
+        for result in results:
+            if not result.link or result.link in seen_links:
+                continue
+            seen_links.add(result.link)
+
+            content = fetcher.fetch_and_parse(result.link)
+            if content.startswith("Error:") or len(content) < min_chars:
+                print(f"Skipping {result.link}: {content[:100]}")
+                continue
+
+            try:
+                items.append(WebSearchItem(source=result.link, content=content))
+            except ValidationError as ve:
+                print(f"Validation error for {result.link}: {ve}")
+
+        if not items:
+            print(f"No valid results for bank_id={bank_id}, product_id={product_id}")
+            return False
+
+        result = WebSearchResult(bank_id=bank_id, product_id=product_id, items=items)
+        return save_raw_data(result)
+
+    except Exception as e:
+        print(
+            f"Error collecting data for bank_id={bank_id}, product_id={product_id}: {str(e)}"
+        )
+        traceback.print_exc()
+        return False
+
+
+def get_collection_mode(mode: Optional[str] = None) -> str:
+    """Режим сбора сырых данных: agent (через web_search_agent) или direct"""
+    mode = mode or getenv("COLLECTION_MODE", "agent")
+    if mode not in ("agent", "direct"):
+        raise ValueError(f"Unknown collection mode: {mode}")
+    return mode
@@ -1,11 +1,18 @@
 import json
 import re
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Union
+from os import getenv
+from typing import Any, Dict, List, Optional, Union
 
 from pydantic import ValidationError
 
+from src.app.agents.web_search_agent.collector import (
+    collect_pair_direct,
+    get_collection_mode,
+)
 from src.app.agents.web_search_agent.run import (
     process_todays_data,
     run_web_search_agent,
@@ -15,7 +22,9 @@ from src.app.agents.web_search_agent.tools import (
     save_raw_data,
 )
 from src.app.domain.models import WebSearchItem, WebSearchResult
+from src.app.infra.db.pool import get_pool
 from src.app.tools.data_processor import DataProcessor
+from src.app.tools.web_search_tools import fetcher, searcher
 
 
 def normalize_agent_response(raw_response: Any) -> List[Dict[str, str]]:
@@ -127,65 +136,126 @@ def process_search_results(
     return WebSearchResult(bank_id=bank_id, product_id=product_id, items=items)
 
 
-def get_raw_data():
-    """Основная функция для получения и сохранения сырых данных"""
-    queries = get_bank_and_products()
+def collect_pair(query: Dict[str, Dict[str, int]]) -> bool:
+    """
+    Собирает и сохраняет сырые данные для одной пары банк-продукт
 
-    if not queries:
-        print("No queries to process")
-        return
+    Args:
+        query: Словарь вида {prompt: {"bank_id": bank_id, "product_id": product_id}}
 
-    print(f"Processing {len(queries)} search queries...")
-    any_data_saved = False
+    Returns:
+        bool: True если данные по паре были сохранены
+    """
+    prompt = list(query.keys())[0]
+    metadata = list(query.values())[0]
 
-    for query in queries:
-        try:
-            prompt = list(query.keys())[0]
-            metadata = list(query.values())[0]
+    bank_id = metadata["bank_id"]
+    product_id = metadata["product_id"]
 
-            bank_id = metadata["bank_id"]
-            product_id = metadata["product_id"]
+    try:
+        print(f"\nProcessing search for bank_id={bank_id}, product_id={product_id}")
+        print(f"Search query: {prompt[:100]}...")
 
+        messages = [{"role": "user", "content": prompt}]
+        raw_response = run_web_search_agent({"messages": messages})
 
-            print(f"\nProcessing search for bank_id={bank_id}, product_id={product_id}")
-            print(f"Search query: {prompt[:100]}...")
+        print("Raw agent response received")
+        print(f"Response type: {type(raw_response)}")
+        if isinstance(raw_response, str) and len(raw_response) > 200:
+            print(f"Response preview: {raw_response[:200]}...")
+        else:
+            print(f"Response: {raw_response}")
 
-            messages = [{"role": "user", "content": prompt}]
-            raw_response = run_web_search_agent({"messages": messages})
+        result = process_search_results(query, raw_response)
 
-            print("Raw agent response received")
-            print(f"Response type: {type(raw_response)}")
-            if isinstance(raw_response, str) and len(raw_response) > 200:
-                print(f"Response preview: {raw_response[:200]}...")
-            else:
-                print(f"Response: {raw_response}")
+        if not result:
+            print(f"No valid results for bank_id={bank_id}, product_id={product_id}")
+            return False
 
-            result = process_search_results(query, raw_response)
+        success = save_raw_data(result)
 
-            if not result:
-                print(
-                    f"No valid results for bank_id={bank_id}, product_id={product_id}"
-                )
-                continue
+        if success:
+            print(
+                f"Successfully processed {len(result.items)} sources for bank_id={bank_id}, product_id={product_id}"
+            )
+        else:
+            print(
+                f"Failed to save results for bank_id={bank_id}, product_id={product_id}"
+            )
+        return success
 
-            success = save_raw_data(result)
+    except Exception as e:
+        print(
+            f"Error processing query for bank_id={bank_id}, product_id={product_id}: {str(e)}"
+        )
+        traceback.print_exc()
+        return False
 
-            if success:
-                any_data_saved = True
-                print(
-                    f"Successfully processed {len(result.items)} sources for bank_id={bank_id}, product_id={product_id}"
-                )
-            else:
-                print(
-                    f"Failed to save results for bank_id={bank_id}, product_id={product_id}"
-                )
 
-        except Exception as e:
-            print(
-                f"Error processing query for bank_id={bank_id}, product_id={product_id}: {str(e)}"
-            )
-            traceback.print_exc()
-            continue
+def get_raw_data(workers: Optional[int] = None, mode: Optional[str] = None):
+    """
+    Основная функция для получения и сохранения сырых данных
+
+    Args:
+        workers: Количество параллельно обрабатываемых пар банк-продукт.
+            По умолчанию берётся из CRON_WORKERS (1 - последовательный режим).
+            Не больше DB_POOL_MAX: каждый поток берёт своё соединение из
+            пула, общие RateLimiter и кеши поиска/страниц потокобезопасны
+        mode: agent - сбор через web_search_agent, direct - прямые вызовы
+            поиска и загрузки страниц без LLM. По умолчанию COLLECTION_MODE
+    """
+    queries = get_bank_and_products()
+
+    if not queries:
+        print("No queries to process")
+        return
+
+    if workers is None:
+        workers = int(getenv("CRON_WORKERS", "1"))
+    pool_size = get_pool().maxconn
+    if workers > pool_size:
+        print(
+            f"CRON_WORKERS={workers} exceeds DB_POOL_MAX={pool_size}, "
+            f"using {pool_size} worker(s)"
+        )
+    workers = max(1, min(workers, len(queries), pool_size))
+
+    mode = get_collection_mode(mode)
+    collect = collect_pair_direct if mode == "direct" else collect_pair
+
+    print(
+        f"Processing {len(queries)} search queries with {workers} worker(s) in {mode} mode..."
+    )
+    run_start = time.monotonic()
+
+    if workers == 1:
+        outcomes = [collect(query) for query in queries]
+    else:
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="web-search"
+        ) as executor:
+            outcomes = list(executor.map(collect, queries))
+
+    elapsed = time.monotonic() - run_start
+    saved_pairs = sum(1 for outcome in outcomes if outcome)
+    pairs_per_minute = len(queries) / (elapsed / 60) if elapsed > 0 else 0.0
+
+    print("\n" + "=" * 50)
+    print("RAW DATA COLLECTION SUMMARY")
+    print(
+        f"Pairs processed: {len(queries)} "
+        f"(saved: {saved_pairs}, failed/empty: {len(queries) - saved_pairs})"
+    )
+    print(f"Workers: {workers}, mode: {mode}")
+    print(f"Elapsed: {elapsed:.2f} seconds")
+    print(f"Throughput: {pairs_per_minute:.2f} pairs/minute")
+    if searcher is not None and searcher.cache is not None:
+        print(f"Search cache: {searcher.cache.stats()}")
+    if fetcher.cache is not None:
+        print(f"Fetch cache: {fetcher.cache.stats()}")
+    print("=" * 50)
+
+    any_data_saved = saved_pairs > 0
 
     if any_data_saved:
         print("\n" + "=" * 50)
@@ -1,44 +1,26 @@
-import os
+import hashlib
 from datetime import datetime
-from functools import lru_cache
 from os import getenv
-from typing import Dict, List
-from urllib.parse import urljoin
+from typing import Dict, List, Optional, Tuple
 
-import httpx
-import psycopg2
 from dotenv import load_dotenv
 from psycopg2.extras import execute_values
 from pydantic import ValidationError
 
 from src.app.domain.models import CriterionWithEmbedding, WebSearchItem, WebSearchResult
+from src.app.infra.db.copy import copy_rows
+from src.app.infra.db.criterion_canon import criterion_canonicalizer
+from src.app.infra.db.pool import connection
+from src.app.infra.db.reference_cache import reference_cache
+from src.app.infra.db.vector_snapshot import vector_snapshot
 
 load_dotenv()
 
 
-@lru_cache(maxsize=1)
-def get_connection():
-    """Создаёт и кеширует соединение с БД (один инстанс на процесс)."""
-    try:
-        conn = psycopg2.connect(
-            host=getenv("DATABASE_HOST"),
-            port=getenv("DATABASE_PORT"),
-            database=getenv("DATABASE"),
-            user=getenv("DATABASE_LOGIN"),
-            password=getenv("DATABASE_PASSWORD"),
-        )
-        conn.autocommit = False
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {str(e)}")
-        raise
-
-
 def get_data_list(table: str, column: str) -> Dict[int, str]:
     """Получает список записей из указанной таблицы"""
-    conn = get_connection()
     try:
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(f"SELECT id, {column} FROM {table};")
             rows = cursor.fetchall()
             return {row[0]: row[1] for row in rows}
@@ -79,8 +61,14 @@ def prepare_query(
 
 def get_bank_and_products() -> List[Dict[str, Dict[str, int]]]:
     """Получает все банки и продукты для веб-поиска"""
-    banks = get_data_list("banks", "bank")
-    products = get_data_list("products", "product")
+    try:
+        reference = reference_cache.get()
+    except Exception as e:
+        print(f"Error fetching reference data: {str(e)}")
+        return []
+
+    banks = reference.banks
+    products = reference.products
 
     if not banks or not products:
         print("Warning: No banks or products found for search")
@@ -89,35 +77,75 @@ def get_bank_and_products() -> List[Dict[str, Dict[str, int]]]:
     return prepare_query(banks, products)
 
 
+def content_hash(content: str) -> str:
+    """sha256 содержимого страницы - ключ дедупликации в raw_pages"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
 def save_raw_data(result: WebSearchResult) -> bool:
-    """Сохраняет валидированные результаты поиска в таблицу bank_buffer"""
-    conn = get_connection()
+    """
+    Сохраняет валидированные результаты поиска в bank_buffer
+
+    Текст страницы хранится один раз в raw_pages по ключу (source, content_hash),
+    а bank_buffer лишь связывает страницу с парой банк-продукт. Если пара уже
+    ссылается на такую же страницу, новая запись (и повторное извлечение
+    критериев) не создаётся.
+    """
+    if get_write_mode() == "copy":
+        return save_raw_data_bulk([result])
+
     ts = datetime.utcnow()
-    success = False
+    linked = 0
+    duplicates = 0
+    seen = set()
 
     try:
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             for item in result.items:
                 try:
-   
                     validated_item = WebSearchItem(
                         source=item.source, content=item.content
                     )
+                    page_key = (
+                        validated_item.source,
+                        content_hash(validated_item.content),
+                    )
+                    if page_key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(page_key)
 
-           
                     cursor.execute(
                         """
-                        INSERT INTO bank_buffer (bank_id, product_id, raw_data, source, ts)
+                        INSERT INTO raw_pages (
+                            source, content_hash, raw_data, first_seen, last_seen
+                        ) VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (source, content_hash)
+                        DO UPDATE SET last_seen = EXCLUDED.last_seen
+                        RETURNING id
+                        """,
+                        (*page_key, validated_item.content, ts, ts),
+                    )
+                    page_id = cursor.fetchone()[0]
+
+                    cursor.execute(
+                        """
+                        INSERT INTO bank_buffer (bank_id, product_id, page_id, source, ts)
                         VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (bank_id, product_id, page_id) DO NOTHING
                         """,
                         (
                             result.bank_id,
                             result.product_id,
-                            validated_item.content,
+                            page_id,
                             validated_item.source,
                             ts,
                         ),
                     )
+                    if cursor.rowcount:
+                        linked += 1
+                    else:
+                        duplicates += 1
                 except ValidationError as ve:
                     print(f"Validation error for item: {ve}")
                     continue
@@ -125,81 +153,215 @@ def save_raw_data(result: WebSearchResult) -> bool:
                     print(f"Error saving item: {str(e)}")
                     continue
 
-        conn.commit()
-        success = True
         print(
-            f"Successfully saved {len(result.items)} items for bank_id={result.bank_id}, product_id={result.product_id}"
+            f"Successfully saved {linked} items ({duplicates} duplicates skipped) for bank_id={result.bank_id}, product_id={result.product_id}"
         )
+        return True
 
     except Exception as e:
-        conn.rollback()
         print(f"Database error: {str(e)}")
-    finally:
-        return success
+        return False
 
 
-def get_embedding(text: str) -> List[float]:
-    """Получает эмбеддинг для текста через внешний сервис"""
-    embedding_url = os.getenv("EMBEDDING_SERVICE_URL")
-    if not embedding_url:
-        raise ValueError("EMBEDDING_SERVICE_URL is not set in environment variables")
+RAW_STAGE_COLUMNS = ["bank_id", "product_id", "source", "content_hash", "raw_data", "ts"]
+RAW_STAGE_TYPES = ["int4", "int4", "text", "text", "text", "timestamptz"]
 
+
+def write_raw_rows(
+    cursor,
+    results: List[WebSearchResult],
+    ts: datetime,
+    flush_size: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Записывает результаты поиска через COPY во временную таблицу и переносит
+    их в raw_pages/bank_buffer с дедупликацией по (source, content_hash)
+
+    Returns:
+        Tuple[int, int]: (число новых связей в bank_buffer, число пропущенных дублей)
+    """
+    rows = []
+    for result in results:
+        for item in result.items:
+            try:
+                validated_item = WebSearchItem(source=item.source, content=item.content)
+            except ValidationError as ve:
+                print(f"Validation error for item: {ve}")
+                continue
+            rows.append(
+                (
+                    result.bank_id,
+                    result.product_id,
+                    validated_item.source,
+                    content_hash(validated_item.content),
+                    validated_item.content,
+                    ts,
+                )
+            )
+
+    if not rows:
+        return 0, 0
+
+    cursor.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS bank_buffer_stage (
+            bank_id      INTEGER,
+            product_id   INTEGER,
+            source       TEXT,
+            content_hash TEXT,
+            raw_data     TEXT,
+            ts           TIMESTAMPTZ
+        ) ON COMMIT DELETE ROWS
+        """
+    )
+    copy_rows(
+        cursor,
+        "bank_buffer_stage",
+        RAW_STAGE_COLUMNS,
+        RAW_STAGE_TYPES,
+        rows,
+        flush_size=flush_size or get_copy_flush_size(),
+    )
+    cursor.execute(
+        """
+        INSERT INTO raw_pages (source, content_hash, raw_data, first_seen, last_seen)
+        SELECT DISTINCT ON (source, content_hash)
+               source, content_hash, raw_data, ts, ts
+        FROM bank_buffer_stage
+        ON CONFLICT (source, content_hash)
+        DO UPDATE SET last_seen = EXCLUDED.last_seen
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO bank_buffer (bank_id, product_id, page_id, source, ts)
+        SELECT DISTINCT ON (s.bank_id, s.product_id, rp.id)
+               s.bank_id, s.product_id, rp.id, s.source, s.ts
+        FROM bank_buffer_stage s
+        JOIN raw_pages rp
+          ON rp.source = s.source AND rp.content_hash = s.content_hash
+        ON CONFLICT (bank_id, product_id, page_id) DO NOTHING
+        """
+    )
+    linked = cursor.rowcount
+    cursor.execute("TRUNCATE bank_buffer_stage")
+    return linked, len(rows) - linked
+
+
+def save_raw_data_bulk(
+    results: List[WebSearchResult], flush_size: Optional[int] = None
+) -> bool:
+    """Сохраняет результаты поиска по нескольким парам банк-продукт одним COPY"""
     try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                urljoin(
-                    embedding_url,
-                    "/dialog/nlp/embedding/paraphrase-multilingual-MiniLM-L12-v2",
-                ),
-                json={"text": text},
-                headers={"Content-Type": "application/json"},
+        with connection() as conn, conn.cursor() as cursor:
+            linked, duplicates = write_raw_rows(
+                cursor, results, datetime.utcnow(), flush_size
             )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("embedding", [])
+        print(
+            f"Successfully saved {linked} items ({duplicates} duplicates skipped) for {len(results)} bank/product pairs"
+        )
+        return True
+
     except Exception as e:
-        print(f"Error getting embedding: {str(e)}")
+        print(f"Database error: {str(e)}")
+        return False
 
-        return [0.0] * 384
+
+BANK_ANALYSIS_COLUMNS = [
+    "bank_id",
+    "product_id",
+    "criterion",
+    "criterion_embed",
+    "source",
+    "data",
+    "ts",
+    "canonical_id",
+]
+BANK_ANALYSIS_TYPES = [
+    "int4",
+    "int4",
+    "text",
+    "vector",
+    "text",
+    "text",
+    "timestamptz",
+    "int8",
+]
+
+
+def get_write_mode() -> str:
+    """Способ массовой записи: copy (COPY FORMAT binary) или insert"""
+    return getenv("DB_WRITE_MODE", "copy")
+
+
+def get_copy_flush_size() -> int:
+    return int(getenv("DB_COPY_FLUSH_SIZE", "5000"))
+
+
+def write_processed_rows(
+    cursor,
+    criteria_with_embeddings: List[CriterionWithEmbedding],
+    mode: Optional[str] = None,
+    flush_size: Optional[int] = None,
+    table: str = "bank_analysis",
+) -> int:
+    """Записывает критерии в bank_analysis в рамках переданного курсора"""
+    values = [
+        (
+            criterion.bank_id,
+            criterion.product_id,
+            criterion.criterion,
+            criterion.criterion_embed,
+            criterion.source,
+            criterion.data,
+            criterion.ts,
+            criterion.canonical_id,
+        )
+        for criterion in criteria_with_embeddings
+    ]
+
+    if (mode or get_write_mode()) == "copy":
+        return copy_rows(
+            cursor,
+            table,
+            BANK_ANALYSIS_COLUMNS,
+            BANK_ANALYSIS_TYPES,
+            values,
+            flush_size=flush_size or get_copy_flush_size(),
+        )
+
+    execute_values(
+        cursor,
+        f"""
+        INSERT INTO {table} (
+            bank_id, product_id, criterion, criterion_embed, source, data, ts,
+            canonical_id
+        ) VALUES %s
+        """,
+        values,
+    )
+    return len(values)
 
 
 def save_processed_data(criteria_with_embeddings: List[CriterionWithEmbedding]) -> bool:
     """Сохраняет обработанные данные в таблицу bank_analysis"""
-    conn = get_connection()
+    if criterion_canonicalizer.enabled:
+        try:
+            criterion_canonicalizer.assign_criteria(criteria_with_embeddings)
+        except Exception as e:
+            # Без канонических id критерии всё равно пригодны для поиска
+            print(f"Error canonicalizing criteria: {str(e)}")
 
     try:
-        with conn.cursor() as cursor:
-
-            values = [
-                (
-                    criterion.bank_id,
-                    criterion.product_id,
-                    criterion.criterion,
-                    criterion.criterion_embed,
-                    criterion.source,
-                    criterion.data,
-                    criterion.ts,
-                )
-                for criterion in criteria_with_embeddings
-            ]
-
-            execute_values(
-                cursor,
-                """
-                INSERT INTO bank_analysis (
-                    bank_id, product_id, criterion, criterion_embed, source, data, ts
-                ) VALUES %s
-                """,
-                values,
-            )
+        with connection() as conn, conn.cursor() as cursor:
+            write_processed_rows(cursor, criteria_with_embeddings)
+        vector_snapshot.add(criteria_with_embeddings)
 
-        conn.commit()
         print(
             f"Successfully saved {len(criteria_with_embeddings)} criteria to bank_analysis"
         )
         return True
 
     except Exception as e:
-        conn.rollback()
         print(f"Error saving processed data: {str(e)}")
         return False
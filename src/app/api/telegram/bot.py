@@ -9,6 +9,7 @@ from aiogram.types import FSInputFile
 from aiogram.filters import CommandStart
 
 from src.app.agents.user_requests_agent.run import run_agent
+from src.app.infra.db.vector_snapshot import vector_snapshot
 
 load_dotenv()
 
@@ -82,6 +83,7 @@ async def handle_user_message(message: types.Message):
 
 
 async def main():
+    await asyncio.to_thread(vector_snapshot.warm_up)
     logger.info("Бот запущен...")
     await dp.start_polling(bot)
 
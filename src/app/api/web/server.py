@@ -1,6 +1,8 @@
+import asyncio
 import base64
 import csv
 import json
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional
 
@@ -10,6 +12,7 @@ from fastapi.responses import FileResponse
 from pydantic import BaseModel
 
 from src.app.agents.user_requests_agent.run import run_agent
+from src.app.infra.db.vector_snapshot import vector_snapshot
 
 
 BASE_DIR = Path(__file__).resolve().parents[2]
@@ -40,7 +43,14 @@ class ChatResponse(BaseModel):
     png: Optional[PNGPayload] = None
 
 
-app = FastAPI(title="Hihiton Web API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(vector_snapshot.warm_up)
+    yield
+    await asyncio.to_thread(vector_snapshot.stop, 5)
+
+
+app = FastAPI(title="Hihiton Web API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
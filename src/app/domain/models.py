@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, Field, field_validator
 
@@ -49,3 +49,4 @@ class CriterionWithEmbedding(BaseModel):
     source: str
     data: str
     ts: datetime
+    canonical_id: Optional[int] = None
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from os import getenv
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.app.infra.cache.sqlite_store import SqliteStore
+
+load_dotenv()
+
+
+@dataclass
+class CachedPage:
+    """Извлечённый текст страницы и валидаторы для условного запроса"""
+
+    url: str
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    extractor: str = ""
+    checked_at: float = 0.0
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class FetchCache:
+    """
+    Персистентный кеш загруженных страниц по URL.
+
+    Хранит уже очищенный текст вместе с ETag/Last-Modified. Запись, проверенная
+    не раньше чем fresh_seconds назад, отдаётся без запроса; более старая
+    перепроверяется условным запросом, и при 304 страница не парсится заново.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        fresh_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.fresh_seconds = fresh_seconds if fresh_seconds is not None else float(
+            getenv("FETCH_CACHE_FRESH_SECONDS", "3600")
+        )
+        self.store = SqliteStore(
+            path or getenv("FETCH_CACHE_PATH", ".cache/pages.sqlite3"),
+            table="pages",
+            max_entries=max_entries
+            or int(getenv("FETCH_CACHE_MAX_ENTRIES", "100000")),
+        )
+        self._lock = threading.Lock()
+
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        entry = self.store.get(url)
+        if entry is None:
+            return None
+        return CachedPage(**json.loads(entry[0]))
+
+    def put(self, page: CachedPage):
+        page.checked_at = time.time()
+        self.store.set(page.url, json.dumps(asdict(page)).encode("utf-8"))
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return time.time() - page.checked_at < self.fresh_seconds
+
+    def record(self, outcome: str):
+        """Учитывает исход обращения: fresh_hits, revalidated или misses"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.fresh_hits + self.revalidated + self.misses
+            return {
+                "fresh_hits": self.fresh_hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_rate": (
+                    (self.fresh_hits + self.revalidated) / total if total else 0.0
+                ),
+            }
+
+
+def get_fetch_cache() -> Optional[FetchCache]:
+    """Кеш страниц (None, если выключен через FETCH_CACHE_ENABLED=0)"""
+    if getenv("FETCH_CACHE_ENABLED", "1") == "0":
+        return None
+    return FetchCache()
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+import time
+from os import getenv
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.app.infra.cache.sqlite_store import SqliteStore
+from src.app.infra.embedder.cache import normalize_text
+
+load_dotenv()
+
+
+class SearchCache:
+    """
+    Персистентный кеш результатов веб-поиска с TTL.
+
+    Ключ - нормализованный запрос и max_results, поэтому запросы, которые
+    отличаются только регистром или пробелами, попадают в одну запись.
+    Записи старше ttl секунд считаются устаревшими.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.ttl = ttl if ttl is not None else float(
+            getenv("SEARCH_CACHE_TTL", "86400")
+        )
+        self.store = SqliteStore(
+            path or getenv("SEARCH_CACHE_PATH", ".cache/search.sqlite3"),
+            table="searches",
+            max_entries=max_entries
+            or int(getenv("SEARCH_CACHE_MAX_ENTRIES", "50000")),
+        )
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, query: str, max_results: int) -> str:
+        payload = f"{max_results}\n{normalize_text(query)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, query: str, max_results: int) -> Optional[List[Dict[str, Any]]]:
+        entry = self.store.get(self.key(query, max_results))
+        hit = entry is not None and time.time() - entry[1] < self.ttl
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return json.loads(entry[0]) if hit else None
+
+    def set(self, query: str, max_results: int, results: List[Dict[str, Any]]):
+        self.store.set(
+            self.key(query, max_results),
+            json.dumps(results, ensure_ascii=False).encode("utf-8"),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """Кеш поиска (None, если выключен через SEARCH_CACHE_ENABLED=0)"""
+    if getenv("SEARCH_CACHE_ENABLED", "1") == "0":
+        return None
+    return SearchCache()
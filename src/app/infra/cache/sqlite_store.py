@@ -0,0 +1,193 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Отметки last_used копятся в памяти и пишутся пачкой: при таком числе
+# ключей, раз в TOUCH_FLUSH_SECONDS или вместе с ближайшей записью
+TOUCH_BATCH = 1000
+TOUCH_FLUSH_SECONDS = 60.0
+# Вытеснение освобождает долю max_entries сверх переполнения, чтобы не
+# удалять по нескольку строк на каждую запись
+EVICT_SLACK = 0.01
+
+
+class SqliteStore:
+    """
+    Простое персистентное key-value хранилище поверх SQLite.
+
+    Используется как дисковый уровень локальных кешей (эмбеддинги, страницы,
+    результаты поиска). Для каждой записи хранится время последнего
+    обращения: при превышении max_entries вытесняются самые давние записи.
+
+    Число строк хранится в памяти (COUNT(*) выполняется только при открытии
+    и перед вытеснением, на случай записи из другого процесса), а last_used
+    обновляется пачками, поэтому чтение не делает запись и commit.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: Optional[int] = None):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._touched_at = time.monotonic()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Для кеша достаточно: в WAL-режиме без fsync на каждый commit
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key       TEXT PRIMARY KEY,
+                    value     BLOB NOT NULL,
+                    created   REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table} (last_used)"
+            )
+            self._conn.commit()
+            self._count = self._count_rows()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Возвращает (value, created) или None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[bytes, float]]:
+        """Возвращает найденные записи в виде {key: (value, created)}"""
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite ограничивает число параметров в одном запросе
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM {self.table} "
+                    f"WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                found.update({key: (value, created) for key, value, created in rows})
+
+            for key in found:
+                self._touched[key] = now
+            if (
+                len(self._touched) >= TOUCH_BATCH
+                or time.monotonic() - self._touched_at >= TOUCH_FLUSH_SECONDS
+            ):
+                self._flush_touched()
+                self._conn.commit()
+        return found
+
+    def flush(self):
+        """Записывает накопленные отметки last_used"""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def set(self, key: str, value: bytes):
+        self.set_many([(key, value)])
+
+    def set_many(self, items: List[Tuple[str, bytes]]):
+        if not items:
+            return
+
+        now = time.time()
+        items = list(dict(items).items())
+        with self._lock:
+            self._flush_touched()
+            existing = 0
+            for start in range(0, len(items), 500):
+                chunk = [key for key, _ in items[start : start + 500]]
+                placeholders = ",".join("?" * len(chunk))
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM {self.table} WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchone()[0]
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, last_used) "
+                f"VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items],
+            )
+            self._count += len(items) - existing
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ?", (key,)
+            )
+            self._touched.pop(key, None)
+            self._count -= cursor.rowcount
+            self._conn.commit()
+
+    def delete_older_than(self, max_age_seconds: float) -> int:
+        """Удаляет записи, созданные раньше чем max_age_seconds назад"""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created < ?",
+                (time.time() - max_age_seconds,),
+            )
+            self._count -= cursor.rowcount
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._touched.clear()
+            self._count = 0
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def _count_rows(self) -> int:
+        return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touched_at = time.monotonic()
+
+    def _evict(self):
+        """Вытесняет самые давно использованные записи сверх max_entries"""
+        if not self.max_entries or self._count <= self.max_entries:
+            return
+
+        # Другой процесс мог писать в тот же файл
+        self._count = self._count_rows()
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            overflow += int(self.max_entries * EVICT_SLACK)
+            cursor = self._conn.execute(
+                f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY last_used LIMIT ?
+                )
+                """,
+                (overflow,),
+            )
+            self._count -= cursor.rowcount
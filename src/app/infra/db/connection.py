@@ -0,0 +1,24 @@
+from os import getenv
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def create_connection():
+    """Открывает новое соединение с БД (закрывать должен вызывающий)."""
+    try:
+        conn = psycopg2.connect(
+            host=getenv("DATABASE_HOST"),
+            port=getenv("DATABASE_PORT"),
+            database=getenv("DATABASE"),
+            user=getenv("DATABASE_LOGIN"),
+            password=getenv("DATABASE_PASSWORD"),
+        )
+        conn.autocommit = False
+        return conn
+    except Exception as e:
+        print(f"Database connection error: {str(e)}")
+        raise
+
@@ -0,0 +1,96 @@
+import io
+import struct
+from datetime import datetime, timezone
+from typing import Any, Iterable, List, Sequence
+
+# Формат COPY ... (FORMAT binary): заголовок, кортежи и маркер конца
+_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_BINARY_TRAILER = struct.pack(">h", -1)
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def _encode_int4(value: int) -> bytes:
+    return struct.pack(">i", value)
+
+
+def _encode_int8(value: int) -> bytes:
+    return struct.pack(">q", value)
+
+
+def _encode_text(value: str) -> bytes:
+    return value.encode("utf-8")
+
+
+def _encode_timestamptz(value: datetime) -> bytes:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return struct.pack(">q", micros)
+
+
+def _encode_vector(value: Sequence[float]) -> bytes:
+    # Бинарное представление pgvector: int16 размерность, int16 резерв, float4[]
+    return struct.pack(f">hh{len(value)}f", len(value), 0, *value)
+
+
+_ENCODERS = {
+    "int4": _encode_int4,
+    "int8": _encode_int8,
+    "text": _encode_text,
+    "timestamptz": _encode_timestamptz,
+    "vector": _encode_vector,
+}
+
+
+def encode_binary_copy(rows: Iterable[Sequence[Any]], types: List[str]) -> io.BytesIO:
+    """
+    Кодирует строки в поток для COPY ... FROM STDIN (FORMAT binary)
+
+    Args:
+        rows: Строки таблицы (значения в порядке колонок)
+        types: Типы колонок: int4, int8, text, timestamptz, vector
+
+    Returns:
+        io.BytesIO: Готовый к передаче в copy_expert буфер
+    """
+    encoders = [_ENCODERS[column_type] for column_type in types]
+    field_count = struct.pack(">h", len(encoders))
+
+    buffer = io.BytesIO()
+    buffer.write(_BINARY_HEADER)
+    for row in rows:
+        buffer.write(field_count)
+        for encode, value in zip(encoders, row):
+            if value is None:
+                buffer.write(struct.pack(">i", -1))
+            else:
+                data = encode(value)
+                buffer.write(struct.pack(">i", len(data)))
+                buffer.write(data)
+    buffer.write(_BINARY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(
+    cursor,
+    table: str,
+    columns: List[str],
+    types: List[str],
+    rows: Sequence[Sequence[Any]],
+    flush_size: int = 5000,
+) -> int:
+    """
+    Записывает строки в таблицу через COPY (FORMAT binary) порциями по flush_size
+
+    Returns:
+        int: Число записанных строк
+    """
+    statement = (
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)"
+    )
+    for start in range(0, len(rows), flush_size):
+        chunk = rows[start : start + flush_size]
+        cursor.copy_expert(statement, encode_binary_copy(chunk, types))
+    return len(rows)
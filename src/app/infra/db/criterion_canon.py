@@ -0,0 +1,302 @@
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from src.app.domain.models import CriterionWithEmbedding
+from src.app.infra.db.pool import connection
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+def to_vector_literal(embedding: Sequence[float]) -> str:
+    return "[" + ",".join(str(x) for x in embedding) + "]"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Нормирует строки матрицы на единичную длину (нулевые строки не трогает)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+@dataclass
+class ProductCanon:
+    """Канонические критерии одного продукта: id и нормированные эмбеддинги"""
+
+    ids: List[int] = field(default_factory=list)
+    vectors: Optional[np.ndarray] = None
+    loaded_at: float = 0.0
+
+    def best_match(self, vector: np.ndarray) -> Optional[tuple]:
+        """Возвращает (индекс, косинусная близость) ближайшего критерия"""
+        if self.vectors is None or not len(self.ids):
+            return None
+        if self.vectors.shape[1] != vector.shape[0]:
+            return None
+        similarities = self.vectors @ vector
+        best = int(np.argmax(similarities))
+        return best, float(similarities[best])
+
+    def add(self, canonical_id: int, vector: np.ndarray):
+        self.ids.append(canonical_id)
+        row = vector.reshape(1, -1)
+        self.vectors = row if self.vectors is None else np.vstack([self.vectors, row])
+
+
+class CriterionCanonicalizer:
+    """
+    Сводит формулировки критериев к каноническим в рамках продукта.
+
+    Критерий получает id существующего канонического критерия, если
+    косинусная близость их эмбеддингов не ниже threshold; иначе он сам
+    становится каноническим. Словарь хранится в таблице criterion_canon и
+    кешируется в памяти на CRITERION_CANON_TTL секунд.
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        query_threshold: Optional[float] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.enabled = getenv("CRITERION_CANON_ENABLED", "1") == "1"
+        self.threshold = threshold if threshold is not None else float(
+            getenv("CRITERION_CANON_THRESHOLD", "0.9")
+        )
+        self.query_threshold = (
+            query_threshold
+            if query_threshold is not None
+            else float(getenv("CRITERION_CANON_QUERY_THRESHOLD", "0.8"))
+        )
+        self.ttl = ttl if ttl is not None else float(
+            getenv("CRITERION_CANON_TTL", "600")
+        )
+        self._products: Dict[int, ProductCanon] = {}
+        self._lock = threading.RLock()
+
+    def invalidate(self, product_id: Optional[int] = None):
+        with self._lock:
+            if product_id is None:
+                self._products.clear()
+            else:
+                self._products.pop(product_id, None)
+
+    def _get(self, product_id: int) -> ProductCanon:
+        canon = self._products.get(product_id)
+        if canon is not None and time.monotonic() - canon.loaded_at < self.ttl:
+            return canon
+
+        with self._lock:
+            canon = self._products.get(product_id)
+            if canon is None or time.monotonic() - canon.loaded_at >= self.ttl:
+                canon = self._load(product_id)
+                self._products[product_id] = canon
+            return canon
+
+    def _load(self, product_id: int) -> ProductCanon:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, embed::text
+                FROM criterion_canon
+                WHERE product_id = %s
+                ORDER BY id
+                """,
+                (product_id,),
+            )
+            rows = cursor.fetchall()
+
+        canon = ProductCanon(loaded_at=time.monotonic())
+        if rows:
+            canon.ids = [row[0] for row in rows]
+            canon.vectors = normalize_rows(
+                np.array([json.loads(row[1]) for row in rows], dtype=np.float32)
+            )
+        return canon
+
+    def match(
+        self,
+        product_id: int,
+        embedding: Sequence[float],
+        threshold: Optional[float] = None,
+    ) -> Optional[int]:
+        """
+        Находит канонический критерий для эмбеддинга (например, критерия из
+        запроса пользователя). По умолчанию используется query_threshold.
+        """
+        threshold = self.query_threshold if threshold is None else threshold
+        vector = normalize_rows(np.asarray([embedding], dtype=np.float32))[0]
+        canon = self._get(product_id)
+        found = canon.best_match(vector)
+        if found is None or found[1] < threshold:
+            return None
+        return canon.ids[found[0]]
+
+    def assign(
+        self,
+        product_id: int,
+        names: List[str],
+        embeddings: List[List[float]],
+    ) -> List[int]:
+        """
+        Возвращает канонические id для критериев одного продукта, заводя в
+        criterion_canon новые записи для критериев без близкого соответствия
+        """
+        if not names:
+            return []
+
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            canon = self._get(product_id)
+            # Новые критерии сравниваются и друг с другом: до вставки в БД
+            # им выдаются временные отрицательные id
+            assigned: List[int] = []
+            new_names: Dict[int, str] = {}
+            new_vectors: Dict[int, List[float]] = {}
+            pending = ProductCanon(ids=list(canon.ids), vectors=canon.vectors)
+
+            for name, embedding, vector in zip(names, embeddings, vectors):
+                found = pending.best_match(vector)
+                if found is not None and found[1] >= self.threshold:
+                    assigned.append(pending.ids[found[0]])
+                    continue
+
+                temp_id = -(len(new_names) + 1)
+                new_names[temp_id] = name
+                new_vectors[temp_id] = embedding
+                pending.add(temp_id, vector)
+                assigned.append(temp_id)
+
+            if new_names:
+                created = self._insert(product_id, new_names, new_vectors)
+                assigned = [created.get(cid, cid) for cid in assigned]
+                # Снимок заменяется целиком, чтобы match() без блокировки
+                # не увидел рассогласованные ids и vectors
+                self._products[product_id] = ProductCanon(
+                    ids=[created.get(cid, cid) for cid in pending.ids],
+                    vectors=pending.vectors,
+                    loaded_at=canon.loaded_at,
+                )
+
+        return assigned
+
+    def _insert(
+        self,
+        product_id: int,
+        names: Dict[int, str],
+        embeddings: Dict[int, List[float]],
+    ) -> Dict[int, int]:
+        """Сохраняет новые канонические критерии: {временный id: id в БД}"""
+        with connection() as conn, conn.cursor() as cursor:
+            rows = execute_values(
+                cursor,
+                """
+                INSERT INTO criterion_canon (product_id, name, embed)
+                VALUES %s
+                ON CONFLICT (product_id, name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id, name
+                """,
+                [
+                    (product_id, name, to_vector_literal(embeddings[temp_id]))
+                    for temp_id, name in names.items()
+                ],
+                template="(%s, %s, %s::vector)",
+                fetch=True,
+            )
+
+        ids_by_name = {name: canonical_id for canonical_id, name in rows}
+        logger.info(
+            f"Added {len(ids_by_name)} canonical criteria for product_id={product_id}"
+        )
+        return {temp_id: ids_by_name[name] for temp_id, name in names.items()}
+
+    def assign_criteria(self, criteria: List[CriterionWithEmbedding]):
+        """Проставляет canonical_id критериям перед записью в bank_analysis"""
+        by_product: Dict[int, List[CriterionWithEmbedding]] = {}
+        for criterion in criteria:
+            by_product.setdefault(criterion.product_id, []).append(criterion)
+
+        for product_id, group in by_product.items():
+            canonical_ids = self.assign(
+                product_id,
+                [criterion.criterion for criterion in group],
+                [criterion.criterion_embed for criterion in group],
+            )
+            for criterion, canonical_id in zip(group, canonical_ids):
+                criterion.canonical_id = canonical_id
+
+    def backfill(self, product_id: Optional[int] = None) -> int:
+        """
+        Кластеризует уже сохранённые критерии и проставляет им canonical_id.
+
+        Формулировки обрабатываются по убыванию частоты, поэтому кластер
+        открывает самый распространённый вариант названия.
+        """
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT product_id, criterion, (array_agg(criterion_embed::text))[1]
+                FROM bank_analysis
+                WHERE canonical_id IS NULL
+                  AND (%(product_id)s::int IS NULL OR product_id = %(product_id)s)
+                GROUP BY product_id, criterion
+                ORDER BY product_id, count(*) DESC, criterion
+                """,
+                {"product_id": product_id},
+            )
+            rows = cursor.fetchall()
+
+        by_product: Dict[int, List[tuple]] = {}
+        for row_product_id, criterion, embed in rows:
+            by_product.setdefault(row_product_id, []).append(
+                (criterion, json.loads(embed))
+            )
+
+        updated = 0
+        for row_product_id, items in by_product.items():
+            names = [name for name, _ in items]
+            canonical_ids = self.assign(
+                row_product_id, names, [embed for _, embed in items]
+            )
+            with connection() as conn, conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    """
+                    UPDATE bank_analysis ba
+                    SET canonical_id = m.canonical_id
+                    FROM (VALUES %s) AS m(product_id, criterion, canonical_id)
+                    WHERE ba.product_id = m.product_id
+                      AND ba.criterion = m.criterion
+                      AND ba.canonical_id IS NULL
+                    """,
+                    [
+                        (row_product_id, name, canonical_id)
+                        for name, canonical_id in zip(names, canonical_ids)
+                    ],
+                    page_size=len(names),
+                )
+                updated += cursor.rowcount
+            logger.info(
+                f"Backfilled product_id={row_product_id}: {len(names)} criteria -> "
+                f"{len(set(canonical_ids))} canonical"
+            )
+        return updated
+
+
+criterion_canonicalizer = CriterionCanonicalizer()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Updated {criterion_canonicalizer.backfill()} bank_analysis rows")
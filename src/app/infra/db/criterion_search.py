@@ -0,0 +1,211 @@
+import threading
+from os import getenv
+from typing import Any, List, Optional, Sequence, Set, Tuple
+
+from dotenv import load_dotenv
+
+from src.app.infra.db.criterion_canon import to_vector_literal
+from src.app.infra.db.migrations import apply_search_settings
+from src.app.infra.db.pool import connection
+
+load_dotenv()
+
+STATEMENT_NAME = "criterion_topk"
+
+# $1 - векторы критериев запроса, $2..$5 - параллельные массивы троек
+# (номер критерия в $1, bank_id, product_id, canonical_id), $6 - k,
+# $7 - порог косинусного расстояния, $8 - во сколько раз больше k берётся
+# ближайших строк при выборе ключей-кандидатов
+#
+# Сначала выбираются ключи (criterion, source): по canonical_id через btree
+# idx_bank_analysis_canonical и по ближайшим строкам пары из ANN-индекса
+# (ORDER BY criterion_embed <=> вектор LIMIT k * overfetch, с iterative_scan
+# из apply_search_settings). Затем для каждого ключа берётся последняя
+# строка по idx_bank_analysis_latest, и порог с canonical_id проверяются
+# уже на ней. Ежедневные повторы одного критерия совпадают по расстоянию,
+# поэтому последнее значение нельзя выбирать среди строк после LIMIT
+TOPK_QUERY = """
+    SELECT
+        item.criterion_no - 1,
+        b.bank AS bank_name,
+        p.product AS product_name,
+        top.criterion,
+        top.data,
+        top."source",
+        top.ts
+    FROM unnest($2::int[], $3::int[], $4::int[], $5::bigint[])
+        WITH ORDINALITY AS item(criterion_no, bank_id, product_id, canonical_id, position)
+    LEFT JOIN LATERAL (
+        SELECT latest.*
+        FROM (
+            SELECT DISTINCT candidate.criterion, candidate."source"
+            FROM (
+                -- Все формулировки канонического критерия
+                SELECT ba.criterion, ba."source"
+                FROM public.bank_analysis ba
+                WHERE item.canonical_id IS NOT NULL
+                  AND ba.bank_id = item.bank_id
+                  AND ba.product_id = item.product_id
+                  AND ba.canonical_id = item.canonical_id
+                UNION ALL
+                -- Ближайшие по вектору (для строк без canonical_id - и при
+                -- известном canonical_id запроса)
+                SELECT nearest.criterion, nearest."source"
+                FROM (
+                    SELECT ba.criterion, ba."source", ba.canonical_id
+                    FROM public.bank_analysis ba
+                    WHERE ba.bank_id = item.bank_id
+                      AND ba.product_id = item.product_id
+                    ORDER BY ba.criterion_embed <=> ($1)[item.criterion_no]
+                    LIMIT $6 * $8
+                ) nearest
+                WHERE item.canonical_id IS NULL OR nearest.canonical_id IS NULL
+            ) candidate
+        ) candidate_key
+        CROSS JOIN LATERAL (
+            -- Последнее значение ключа
+            SELECT
+                ba.criterion,
+                ba.data,
+                ba."source",
+                ba.ts,
+                ba.canonical_id,
+                ba.criterion_embed <=> ($1)[item.criterion_no] AS distance
+            FROM public.bank_analysis ba
+            WHERE ba.bank_id = item.bank_id
+              AND ba.product_id = item.product_id
+              AND ba.criterion = candidate_key.criterion
+              AND ba."source" = candidate_key."source"
+            ORDER BY ba.ts DESC
+            LIMIT 1
+        ) latest
+        -- Строки без canonical_id (не прошедшие backfill или сохранённые
+        -- при сбое канонизации) отбираются по порогу и при известном
+        -- canonical_id запроса
+        WHERE latest.canonical_id = item.canonical_id
+           OR (
+               (item.canonical_id IS NULL OR latest.canonical_id IS NULL)
+               AND latest.distance < $7
+           )
+        ORDER BY latest.distance
+        LIMIT $6
+    ) top ON true
+    LEFT JOIN public.banks b ON b.id = item.bank_id
+    LEFT JOIN public.products p ON p.id = item.product_id
+    ORDER BY item.position, top.distance
+"""
+
+
+class CriterionSearchEngine:
+    """
+    Поиск top-k значений критериев по набору пар банк-продукт одним запросом.
+
+    Каждый вектор передаётся один раз в массиве-параметре подготовленного
+    выражения (PREPARE выполняется один раз на соединение), тройки
+    (критерий, банк, продукт) ссылаются на него по номеру. Для каждой тройки
+    индексы дают ключи (критерий, источник) - по canonical_id и по k *
+    overfetch ближайшим векторам, - и по каждому ключу читается только его
+    последняя строка, поэтому время запроса не растёт с накоплением истории.
+    """
+
+    def __init__(
+        self,
+        k: Optional[int] = None,
+        max_distance: Optional[float] = None,
+        overfetch: Optional[int] = None,
+    ):
+        self.k = k if k is not None else int(getenv("CRITERION_TOP_K", "5"))
+        self.overfetch = (
+            overfetch
+            if overfetch is not None
+            else int(getenv("CRITERION_OVERFETCH", "4"))
+        )
+        self.max_distance = (
+            max_distance
+            if max_distance is not None
+            else float(getenv("CRITERION_MAX_DISTANCE", "0.4"))
+        )
+        # Соединения (id объекта, pid бэкенда), где выражение уже подготовлено
+        self._prepared: Set[Tuple[int, int]] = set()
+        self._lock = threading.Lock()
+
+    def _ensure_prepared(self, conn, cursor):
+        key = (id(conn), conn.info.backend_pid)
+        with self._lock:
+            if key in self._prepared:
+                return
+        cursor.execute(
+            f"PREPARE {STATEMENT_NAME} "
+            "(vector[], int[], int[], int[], bigint[], int, float8, int) AS "
+            + TOPK_QUERY
+        )
+        with self._lock:
+            self._prepared.add(key)
+
+    def search_many(
+        self,
+        embeddings: List[Sequence[float]],
+        items: List[Tuple[int, int, int]],
+        canonical_ids: Optional[List[Optional[int]]] = None,
+        k: Optional[int] = None,
+    ) -> List[Tuple[Any, ...]]:
+        """
+        Args:
+            embeddings: Эмбеддинги различных критериев запроса
+            items: Тройки (номер критерия в embeddings, bank_id, product_id)
+            canonical_ids: Канонический критерий для каждой тройки (или None -
+                тогда отбор идёт по порогу расстояния; строки без
+                canonical_id отбираются по порогу в любом случае)
+            k: Сколько строк вернуть на тройку
+
+        Returns:
+            Строки (номер критерия, bank_name, product_name, criterion, data,
+            source, ts) в порядке троек; для тройки без данных - одна строка
+            с None в полях критерия
+        """
+        if not items:
+            return []
+        canonical_ids = canonical_ids or [None] * len(items)
+
+        with connection() as conn, conn.cursor() as cursor:
+            # ef_search/probes действуют до конца этой транзакции
+            apply_search_settings(cursor)
+            self._ensure_prepared(conn, cursor)
+            cursor.execute(
+                f"EXECUTE {STATEMENT_NAME} "
+                "(%s::vector[], %s::int[], %s::int[], %s::int[], %s::bigint[], "
+                "%s, %s, %s)",
+                (
+                    [to_vector_literal(embedding) for embedding in embeddings],
+                    [criterion_no + 1 for criterion_no, _, _ in items],
+                    [bank_id for _, bank_id, _ in items],
+                    [product_id for _, _, product_id in items],
+                    canonical_ids,
+                    k or self.k,
+                    self.max_distance,
+                    max(self.overfetch, 1),
+                ),
+            )
+            return cursor.fetchall()
+
+    def search(
+        self,
+        embedding: Sequence[float],
+        pairs: List[Tuple[int, int]],
+        canonical_ids: Optional[List[Optional[int]]] = None,
+        k: Optional[int] = None,
+    ) -> List[Tuple[Any, ...]]:
+        """
+        Один критерий по парам (bank_id, product_id): строки (bank_name,
+        product_name, criterion, data, source, ts)
+        """
+        rows = self.search_many(
+            [embedding],
+            [(0, bank_id, product_id) for bank_id, product_id in pairs],
+            canonical_ids,
+            k,
+        )
+        return [row[1:] for row in rows]
+
+
+criterion_search = CriterionSearchEngine()
@@ -0,0 +1,279 @@
+"""
+Миграции схемы и управление ANN-индексами bank_analysis.criterion_embed.
+
+Запуск из корня репозитория:
+    python -m src.app.infra.db.migrations            # SQL-миграции + индексы
+    python -m src.app.infra.db.migrations --index ivfflat
+    python -m src.app.infra.db.migrations --status
+"""
+
+import argparse
+import logging
+import math
+from os import getenv
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+
+from src.app.infra.db.pool import connection, get_pool
+from src.app.infra.embedder.client import EMBEDDING_DIM
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+INIT_DIR = Path(__file__).resolve().parents[2] / "pgvector" / "init"
+# 01_schema.sql создаёт таблицы без IF NOT EXISTS и выполняется только
+# при инициализации контейнера; остальные файлы идемпотентны
+BASE_SCHEMA = "01_schema.sql"
+
+ANN_INDEX_TYPES = ("hnsw", "ivfflat", "none")
+ANN_INDEX_NAMES = {
+    "hnsw": "idx_bank_analysis_embed_hnsw",
+    "ivfflat": "idx_bank_analysis_embed_ivfflat",
+}
+PAIR_TS_INDEX = "idx_bank_analysis_bank_product_ts"
+LATEST_INDEX = "idx_bank_analysis_latest"
+
+
+def get_index_type() -> str:
+    index_type = getenv("ANN_INDEX_TYPE", "hnsw")
+    if index_type not in ANN_INDEX_TYPES:
+        raise ValueError(f"Unknown ANN index type: {index_type}")
+    return index_type
+
+
+# ivfflat поддерживает только off и relaxed_order
+ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+
+
+def get_search_settings() -> Dict[str, Union[int, str]]:
+    """
+    Параметры поиска по ANN-индексу (применяются на уровне транзакции).
+
+    iterative_scan (pgvector >= 0.8) продолжает обход индекса, пока фильтр
+    по bank_id/product_id не наберёт LIMIT строк; без него HNSW отдаёт не
+    больше ef_search кандидатов по всей таблице и узкие пары остаются без
+    результата. ANN_ITERATIVE_SCAN=off отключает его для старых версий.
+    """
+    iterative_scan = getenv("ANN_ITERATIVE_SCAN", "relaxed_order")
+    if iterative_scan not in ITERATIVE_SCAN_MODES:
+        raise ValueError(f"Unknown iterative scan mode: {iterative_scan}")
+    return {
+        "hnsw.ef_search": int(getenv("HNSW_EF_SEARCH", "40")),
+        "hnsw.iterative_scan": iterative_scan,
+        "ivfflat.probes": int(getenv("IVFFLAT_PROBES", "10")),
+        "ivfflat.iterative_scan": (
+            "relaxed_order" if iterative_scan == "strict_order" else iterative_scan
+        ),
+    }
+
+
+def apply_search_settings(
+    cursor, settings: Optional[Dict[str, Union[int, str]]] = None
+):
+    """
+    Выставляет ef_search/probes и iterative_scan для текущей транзакции
+    (SET LOCAL), чтобы настройки не переходили к следующему владельцу
+    соединения из пула
+    """
+    settings = settings or get_search_settings()
+    index_type = get_index_type()
+    for name, value in settings.items():
+        if name.split(".")[0] != index_type:
+            continue
+        if name.endswith(".iterative_scan"):
+            if value not in ITERATIVE_SCAN_MODES:
+                raise ValueError(f"Unknown iterative scan mode: {value}")
+            cursor.execute(f"SET LOCAL {name} = {value}")
+        else:
+            cursor.execute(f"SET LOCAL {name} = {int(value)}")
+
+
+def ivfflat_lists(rows: int) -> int:
+    """Рекомендация pgvector: rows / 1000 до 1M строк, sqrt(rows) после"""
+    if rows <= 1_000_000:
+        return max(rows // 1000, 10)
+    return int(math.sqrt(rows))
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name       TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT (timezone('utc', now()))
+        )
+        """
+    )
+
+
+def apply_sql_migrations() -> List[str]:
+    """Применяет ещё не применённые SQL-файлы из pgvector/init по порядку"""
+    applied = []
+    with connection() as conn, conn.cursor() as cursor:
+        ensure_migrations_table(cursor)
+        cursor.execute("SELECT name FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+
+    for path in sorted(INIT_DIR.glob("*.sql")):
+        if path.name == BASE_SCHEMA or path.name in done:
+            continue
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(path.read_text(encoding="utf-8"))
+            cursor.execute(
+                "INSERT INTO schema_migrations (name) VALUES (%s)", (path.name,)
+            )
+        logger.info(f"Applied migration {path.name}")
+        applied.append(path.name)
+    return applied
+
+
+def ensure_vector_dimension(dim: int = EMBEDDING_DIM):
+    """
+    Фиксирует размерность criterion_embed: ANN-индексы pgvector строятся
+    только по столбцам с заданной размерностью
+    """
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = 'bank_analysis'::regclass
+              AND attname = 'criterion_embed'
+            """
+        )
+        current = cursor.fetchone()[0]
+        if current == f"vector({dim})":
+            return
+        cursor.execute(
+            f"ALTER TABLE bank_analysis "
+            f"ALTER COLUMN criterion_embed TYPE vector({int(dim)})"
+        )
+    logger.info(f"criterion_embed type changed from {current} to vector({dim})")
+
+
+def _run_autocommit(statements: List[str]):
+    """CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for statement in statements:
+                logger.info(statement.strip().splitlines()[0])
+                cursor.execute(statement)
+    finally:
+        conn.autocommit = False
+        pool.putconn(conn)
+
+
+def ensure_pair_ts_index():
+    """
+    btree для выборок по паре банк-продукт с сортировкой по времени и для
+    DISTINCT ON (bank_id, product_id, criterion, source) при загрузке
+    снимка последних значений (vector_snapshot)
+    """
+    _run_autocommit(
+        [
+            f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {PAIR_TS_INDEX}
+                ON bank_analysis (bank_id, product_id, ts DESC)
+            """,
+            f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {LATEST_INDEX}
+                ON bank_analysis (bank_id, product_id, criterion, "source", ts DESC)
+            """,
+        ]
+    )
+
+
+def ensure_ann_index(index_type: Optional[str] = None, rebuild: bool = False):
+    """
+    Создаёт ANN-индекс выбранного типа и удаляет индекс другого типа.
+
+    HNSW: параметры HNSW_M и HNSW_EF_CONSTRUCTION.
+    IVFFlat: IVFFLAT_LISTS, по умолчанию считается от числа строк; индекс
+    стоит перестраивать (rebuild=True) после заметного роста таблицы.
+    """
+    index_type = index_type or get_index_type()
+    statements = [
+        f"DROP INDEX CONCURRENTLY IF EXISTS {name}"
+        for kind, name in ANN_INDEX_NAMES.items()
+        if kind != index_type or rebuild
+    ]
+
+    if index_type == "hnsw":
+        statements.append(
+            f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {ANN_INDEX_NAMES['hnsw']}
+                ON bank_analysis USING hnsw (criterion_embed vector_cosine_ops)
+                WITH (
+                    m = {int(getenv('HNSW_M', '16'))},
+                    ef_construction = {int(getenv('HNSW_EF_CONSTRUCTION', '64'))}
+                )
+            """
+        )
+    elif index_type == "ivfflat":
+        lists = getenv("IVFFLAT_LISTS")
+        if not lists:
+            with connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM bank_analysis")
+                lists = ivfflat_lists(cursor.fetchone()[0])
+        statements.append(
+            f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {ANN_INDEX_NAMES['ivfflat']}
+                ON bank_analysis USING ivfflat (criterion_embed vector_cosine_ops)
+                WITH (lists = {int(lists)})
+            """
+        )
+
+    _run_autocommit(statements)
+
+
+def index_status() -> List[Dict[str, str]]:
+    """Индексы bank_analysis с размерами и определениями"""
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT i.indexname,
+                   pg_size_pretty(pg_relation_size(
+                       (quote_ident(i.schemaname) || '.' || quote_ident(i.indexname))::regclass
+                   )),
+                   i.indexdef
+            FROM pg_indexes i
+            WHERE i.tablename = 'bank_analysis'
+            ORDER BY i.indexname
+            """
+        )
+        return [
+            {"name": name, "size": size, "definition": definition}
+            for name, size, definition in cursor.fetchall()
+        ]
+
+
+def migrate(index_type: Optional[str] = None, rebuild: bool = False):
+    """Полный цикл: SQL-миграции, размерность вектора, btree и ANN-индекс"""
+    apply_sql_migrations()
+    ensure_vector_dimension()
+    ensure_pair_ts_index()
+    ensure_ann_index(index_type, rebuild=rebuild)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы bank_analysis")
+    parser.add_argument("--index", choices=ANN_INDEX_TYPES, default=None)
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--status", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    if not args.status:
+        migrate(args.index, rebuild=args.rebuild)
+    for index in index_status():
+        print(f"{index['name']:<45} {index['size']:>10}  {index['definition']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from os import getenv
+from typing import Dict, Iterator, List, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+from src.app.infra.db.connection import create_connection
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений psycopg2.
+
+    Держит от DB_POOL_MIN до DB_POOL_MAX соединений. При выдаче соединение
+    проверяется: закрытое пересоздаётся, а простаивавшее дольше
+    DB_POOL_CHECK_INTERVAL секунд пингуется через SELECT 1. Соединения,
+    на которых случилась ошибка связи, в пул не возвращаются.
+    """
+
+    def __init__(
+        self,
+        minconn: Optional[int] = None,
+        maxconn: Optional[int] = None,
+        timeout: Optional[float] = None,
+        check_interval: Optional[float] = None,
+    ):
+        self.minconn = minconn if minconn is not None else int(
+            getenv("DB_POOL_MIN", "1")
+        )
+        self.maxconn = maxconn if maxconn is not None else int(
+            getenv("DB_POOL_MAX", "10")
+        )
+        self.timeout = timeout if timeout is not None else float(
+            getenv("DB_POOL_TIMEOUT", "30")
+        )
+        self.check_interval = check_interval if check_interval is not None else float(
+            getenv("DB_POOL_CHECK_INTERVAL", "30")
+        )
+        if self.maxconn < 1 or self.minconn > self.maxconn:
+            raise ValueError(
+                f"Invalid pool size: min={self.minconn}, max={self.maxconn}"
+            )
+
+        self._idle: List = []
+        self._last_used: Dict[int, float] = {}
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.checkouts = 0
+        self.reconnects = 0
+        self.waits = 0
+
+        for _ in range(self.minconn):
+            self._idle.append(self._open())
+
+    def _open(self):
+        conn = create_connection()
+        self._size += 1
+        self._last_used[id(conn)] = time.monotonic()
+        return conn
+
+    def _drop(self, conn):
+        self._size -= 1
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+
+        status = conn.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            # Предыдущий владелец оставил открытую транзакцию
+            conn.rollback()
+
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for < self.check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Выдаёт проверенное соединение, при необходимости открывая новое"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    conn = self._open()
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"No free database connection after {self.timeout}s "
+                        f"(pool size {self.maxconn})"
+                    )
+                self.waits += 1
+                self._cond.wait(remaining)
+
+            self.checkouts += 1
+
+        # Проверка идёт вне блокировки, чтобы не задерживать остальные потоки
+        try:
+            healthy = self._is_healthy(conn)
+        except psycopg2.Error:
+            healthy = False
+
+        if not healthy:
+            logger.warning("Dropping broken database connection, reconnecting")
+            with self._cond:
+                self._drop(conn)
+                self.reconnects += 1
+                try:
+                    conn = self._open()
+                except Exception:
+                    self._cond.notify()
+                    raise
+
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Возвращает соединение в пул; discard=True закрывает его"""
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if self._closed or discard or conn.closed:
+                self._drop(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator:
+        """
+        Выдаёт соединение на время блока with.
+
+        Транзакция коммитится при успешном выходе и откатывается при
+        исключении; соединение с ошибкой связи закрывается и не попадает
+        обратно в пул.
+        """
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            discard = isinstance(
+                e, (psycopg2.OperationalError, psycopg2.InterfaceError)
+            )
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self):
+        """Закрывает все простаивающие соединения и запрещает новые выдачи"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._drop(self._idle.pop())
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "checkouts": self.checkouts,
+                "reconnects": self.reconnects,
+                "waits": self.waits,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_pool() -> ConnectionPool:
+    """Общий на процесс пул соединений"""
+    return ConnectionPool()
+
+
+def connection(timeout: Optional[float] = None):
+    """Сокращение для get_pool().connection()"""
+    return get_pool().connection(timeout)
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.app.infra.db.pool import connection
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+@dataclass
+class ReferenceData:
+    """Снимок справочников банков и продуктов"""
+
+    banks: Dict[int, str] = field(default_factory=dict)
+    products: Dict[int, str] = field(default_factory=dict)
+    loaded_at: float = 0.0
+
+    @property
+    def bank_ids_by_name(self) -> Dict[str, int]:
+        return {name: bank_id for bank_id, name in self.banks.items()}
+
+    @property
+    def product_ids_by_name(self) -> Dict[str, int]:
+        # Названия продуктов не уникальны (например "рефинансирование"),
+        # как и раньше, побеждает запись с большим id
+        return {name: product_id for product_id, name in self.products.items()}
+
+
+class ReferenceCache:
+    """
+    Общий на процесс кеш справочников banks и products.
+
+    Оба справочника читаются одним запросом и живут REFERENCE_CACHE_TTL
+    секунд; после изменения таблиц кеш можно сбросить через invalidate().
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else float(
+            getenv("REFERENCE_CACHE_TTL", "3600")
+        )
+        self._data: Optional[ReferenceData] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ReferenceData:
+        """Возвращает снимок справочников, перечитывая их по истечении TTL"""
+        data = self._data
+        if data is not None and time.monotonic() - data.loaded_at < self.ttl:
+            return data
+
+        with self._lock:
+            data = self._data
+            if data is None or time.monotonic() - data.loaded_at >= self.ttl:
+                data = self._load()
+                self._data = data
+            return data
+
+    def invalidate(self):
+        """Сбрасывает кеш: следующий вызов get() перечитает справочники"""
+        with self._lock:
+            self._data = None
+
+    def bank_name(self, bank_id: int) -> str:
+        return self.get().banks.get(bank_id, f"bank_{bank_id}")
+
+    def product_name(self, product_id: int) -> str:
+        return self.get().products.get(product_id, f"product_{product_id}")
+
+    def _load(self) -> ReferenceData:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT 'bank' AS kind, id, bank FROM banks
+                UNION ALL
+                SELECT 'product' AS kind, id, product FROM products
+                ORDER BY kind, id
+                """
+            )
+            rows = cursor.fetchall()
+
+        data = ReferenceData(loaded_at=time.monotonic())
+        for kind, row_id, name in rows:
+            if kind == "bank":
+                data.banks[row_id] = name
+            else:
+                data.products[row_id] = name
+
+        logger.info(
+            f"Loaded reference data: {len(data.banks)} banks, "
+            f"{len(data.products)} products"
+        )
+        return data
+
+
+reference_cache = ReferenceCache()
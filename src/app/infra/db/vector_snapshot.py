@@ -0,0 +1,382 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from os import getenv
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.app.domain.models import CriterionWithEmbedding
+from src.app.infra.db.criterion_canon import normalize_rows
+from src.app.infra.db.pool import connection
+from src.app.infra.db.reference_cache import reference_cache
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Критерий, источник, значение, время, канонический id
+SnapshotRow = Tuple[str, str, str, datetime, Optional[int]]
+
+# Вектор читается в бинарном формате pgvector (vector_send): uint16 размерность,
+# uint16 (не используется), затем float4 big-endian - без разбора текста
+SELECT_COLUMNS = """
+    id, bank_id, product_id, criterion, "source", data, ts, canonical_id,
+    vector_send(criterion_embed)
+"""
+
+
+def parse_vector(value: bytes) -> np.ndarray:
+    dim = int.from_bytes(value[:2], "big")
+    return np.frombuffer(value, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+
+def as_utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+@dataclass(frozen=True)
+class PairIndex:
+    """
+    Последние значения критериев одной пары банк-продукт.
+
+    Объект не изменяется: обновление собирает новый индекс, поэтому поиск
+    идёт без блокировок.
+    """
+
+    rows: Tuple[SnapshotRow, ...] = ()
+    vectors: np.ndarray = field(
+        default_factory=lambda: np.empty((0, 0), dtype=np.float32)
+    )
+    canonical_ids: np.ndarray = field(
+        default_factory=lambda: np.empty(0, dtype=np.int64)
+    )
+
+    def upsert(self, items: List[Tuple[SnapshotRow, np.ndarray]]) -> "PairIndex":
+        """Новый индекс, где для каждого (критерий, источник) оставлено последнее значение"""
+        rows = list(self.rows)
+        vectors = list(self.vectors)
+        positions = {(row[0], row[1]): i for i, row in enumerate(rows)}
+        dim = self.vectors.shape[1] if rows else items[0][1].shape[0]
+
+        for row, vector in items:
+            if vector.shape[0] != dim:
+                # Строки старой размерности (до ensure_vector_dimension)
+                continue
+            key = (row[0], row[1])
+            position = positions.get(key)
+            if position is None:
+                positions[key] = len(rows)
+                rows.append(row)
+                vectors.append(vector)
+            elif row[3] >= rows[position][3]:
+                rows[position] = row
+                vectors[position] = vector
+
+        return PairIndex(
+            rows=tuple(rows),
+            vectors=normalize_rows(np.vstack(vectors).astype(np.float32)),
+            canonical_ids=np.array(
+                [-1 if row[4] is None else row[4] for row in rows], dtype=np.int64
+            ),
+        )
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int,
+        max_distance: float,
+        canonical_id: Optional[int] = None,
+    ) -> List[SnapshotRow]:
+        """Те же условия, что и в criterion_search: canonical_id или порог расстояния"""
+        if not self.rows or self.vectors.shape[1] != vector.shape[0]:
+            return []
+
+        distances = 1.0 - self.vectors @ vector
+        mask = distances < max_distance
+        if canonical_id is not None:
+            # Строки без canonical_id (-1) остаются доступны по порогу
+            mask = (self.canonical_ids == canonical_id) | (
+                (self.canonical_ids == -1) & mask
+            )
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > k:
+            nearest = np.argpartition(distances[candidates], k - 1)[:k]
+            candidates = candidates[nearest]
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [self.rows[i] for i in candidates]
+
+
+class VectorSnapshot:
+    """
+    Снимок последних значений bank_analysis в памяти процесса для поиска
+    в чате без обращения к БД.
+
+    Загружается при старте (warm_up), после чего фоновый поток дочитывает
+    новые строки по id раз в VECTOR_SNAPSHOT_REFRESH секунд и полностью
+    перечитывает снимок раз в VECTOR_SNAPSHOT_RELOAD секунд: строки из
+    транзакций, завершившихся не в порядке выдачи id, инкрементальное чтение
+    может пропустить. Новый снимок подменяет старый целиком, поэтому поиск
+    не ждёт обновления. Записи, сохранённые в этом же процессе, попадают в
+    снимок сразу (add).
+    """
+
+    def __init__(
+        self,
+        k: Optional[int] = None,
+        max_distance: Optional[float] = None,
+        refresh_interval: Optional[float] = None,
+        reload_interval: Optional[float] = None,
+    ):
+        self.enabled = getenv("VECTOR_SNAPSHOT_ENABLED", "0") == "1"
+        self.k = k if k is not None else int(getenv("CRITERION_TOP_K", "5"))
+        self.max_distance = (
+            max_distance
+            if max_distance is not None
+            else float(getenv("CRITERION_MAX_DISTANCE", "0.4"))
+        )
+        self.refresh_interval = (
+            refresh_interval
+            if refresh_interval is not None
+            else float(getenv("VECTOR_SNAPSHOT_REFRESH", "60"))
+        )
+        self.reload_interval = (
+            reload_interval
+            if reload_interval is not None
+            else float(getenv("VECTOR_SNAPSHOT_RELOAD", "3600"))
+        )
+        self._pairs: Dict[Tuple[int, int], PairIndex] = {}
+        self._last_id = 0
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def warm_up(self):
+        """
+        Загрузка при старте сервиса и запуск фонового обновления; при ошибке
+        загрузки поиск идёт через БД, а фоновый поток повторит загрузку
+        """
+        if not self.enabled:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Failed to load vector snapshot: {e}")
+        self.start()
+
+    def start(self):
+        """Запускает фоновый поток обновления (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="vector-snapshot", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def load(self):
+        """Полная загрузка: последнее значение на (пара, критерий, источник)"""
+        start = time.perf_counter()
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT coalesce(max(id), 0) FROM bank_analysis")
+            last_id = cursor.fetchone()[0]
+            cursor.execute(
+                f"""
+                SELECT DISTINCT ON (bank_id, product_id, criterion, "source")
+                    {SELECT_COLUMNS}
+                FROM bank_analysis
+                WHERE id <= %s
+                ORDER BY bank_id, product_id, criterion, "source", ts DESC
+                """,
+                (last_id,),
+            )
+            rows = cursor.fetchall()
+
+        pairs = self._build(rows, {})
+        with self._lock:
+            self._pairs = pairs
+            self._last_id = last_id
+            self._loaded_at = self._refreshed_at = time.monotonic()
+            self._loaded = True
+
+        logger.info(
+            f"Loaded vector snapshot: {len(rows)} rows, {len(pairs)} pairs "
+            f"in {time.perf_counter() - start:.2f} s"
+        )
+
+    def refresh(self):
+        """Дочитывает строки, добавленные после последней загрузки"""
+        with self._lock:
+            last_id = self._last_id
+            self._refreshed_at = time.monotonic()
+
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT {SELECT_COLUMNS}
+                FROM bank_analysis
+                WHERE id > %s
+                ORDER BY id
+                """,
+                (last_id,),
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            return
+
+        with self._lock:
+            self._pairs = self._build(rows, self._pairs)
+            self._last_id = max(self._last_id, rows[-1][0])
+        logger.info(f"Vector snapshot refreshed with {len(rows)} rows")
+
+    def _run(self):
+        interval = min(self.refresh_interval, self.reload_interval)
+        while not self._stop.wait(interval):
+            self.update()
+
+    def update(self):
+        """Перезагрузка или дочитывание снимка, если подошёл срок"""
+        now = time.monotonic()
+        try:
+            if not self._loaded or now - self._loaded_at >= self.reload_interval:
+                self.load()
+            elif now - self._refreshed_at >= self.refresh_interval:
+                self.refresh()
+        except Exception as e:
+            # Поиск продолжает работать по устаревшему снимку
+            logger.error(f"Failed to refresh vector snapshot: {e}")
+
+    @staticmethod
+    def _build(
+        rows: Sequence[Tuple[Any, ...]], pairs: Dict[Tuple[int, int], PairIndex]
+    ) -> Dict[Tuple[int, int], PairIndex]:
+        by_pair: Dict[Tuple[int, int], List[Tuple[SnapshotRow, np.ndarray]]] = {}
+        for (
+            _,
+            bank_id,
+            product_id,
+            criterion,
+            source,
+            data,
+            ts,
+            canonical_id,
+            embed,
+        ) in rows:
+            by_pair.setdefault((bank_id, product_id), []).append(
+                (
+                    (criterion, source, data, as_utc(ts), canonical_id),
+                    parse_vector(embed),
+                )
+            )
+
+        updated = dict(pairs)
+        for pair, items in by_pair.items():
+            updated[pair] = updated.get(pair, PairIndex()).upsert(items)
+        return updated
+
+    def add(self, criteria: List[CriterionWithEmbedding]):
+        """Добавляет только что сохранённые критерии (если снимок загружен)"""
+        if not self._loaded or not criteria:
+            return
+
+        by_pair: Dict[Tuple[int, int], List[Tuple[SnapshotRow, np.ndarray]]] = {}
+        for criterion in criteria:
+            by_pair.setdefault((criterion.bank_id, criterion.product_id), []).append(
+                (
+                    (
+                        criterion.criterion,
+                        criterion.source,
+                        criterion.data,
+                        as_utc(criterion.ts),
+                        criterion.canonical_id,
+                    ),
+                    np.asarray(criterion.criterion_embed, dtype=np.float32),
+                )
+            )
+
+        with self._lock:
+            pairs = dict(self._pairs)
+            for pair, items in by_pair.items():
+                pairs[pair] = pairs.get(pair, PairIndex()).upsert(items)
+            self._pairs = pairs
+
+    def search_many(
+        self,
+        embeddings: List[Sequence[float]],
+        items: List[Tuple[int, int, int]],
+        canonical_ids: Optional[List[Optional[int]]] = None,
+        k: Optional[int] = None,
+    ) -> List[Tuple[Any, ...]]:
+        """
+        Аналог CriterionSearchEngine.search_many по снимку в памяти: строки
+        (номер критерия, bank_name, product_name, criterion, data, source, ts)
+        в порядке троек
+        """
+        canonical_ids = canonical_ids or [None] * len(items)
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        reference = reference_cache.get()
+        snapshot = self._pairs
+
+        result = []
+        for (criterion_no, bank_id, product_id), canonical_id in zip(
+            items, canonical_ids
+        ):
+            bank_name = reference.banks.get(bank_id)
+            product_name = reference.products.get(product_id)
+            found = snapshot.get((bank_id, product_id), PairIndex()).search(
+                vectors[criterion_no], k or self.k, self.max_distance, canonical_id
+            )
+            if not found:
+                # Как LEFT JOIN LATERAL: тройка без данных остаётся в ответе
+                result.append(
+                    (criterion_no, bank_name, product_name, None, None, None, None)
+                )
+            for criterion, source, data, ts, _ in found:
+                result.append(
+                    (criterion_no, bank_name, product_name, criterion, data, source, ts)
+                )
+        return result
+
+    def search(
+        self,
+        embedding: Sequence[float],
+        pairs: List[Tuple[int, int]],
+        canonical_ids: Optional[List[Optional[int]]] = None,
+        k: Optional[int] = None,
+    ) -> List[Tuple[Any, ...]]:
+        """Аналог CriterionSearchEngine.search по снимку в памяти"""
+        rows = self.search_many(
+            [embedding],
+            [(0, bank_id, product_id) for bank_id, product_id in pairs],
+            canonical_ids,
+            k,
+        )
+        return [row[1:] for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        snapshot = self._pairs
+        return {
+            "pairs": len(snapshot),
+            "rows": sum(len(index.rows) for index in snapshot.values()),
+            "last_id": self._last_id,
+        }
+
+
+vector_snapshot = VectorSnapshot()
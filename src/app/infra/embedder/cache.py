@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from os import getenv
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.app.infra.cache.sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+def normalize_text(text: str) -> str:
+    """Нормализует текст перед хешированием: NFKC, регистр, пробелы"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class EmbeddingCache:
+    """
+    Кеш эмбеддингов с адресацией по содержимому.
+
+    Ключ - sha256 от имени модели и нормализованного текста, поэтому один и тот
+    же критерий из разных банков, дней и перезапусков векторизуется один раз.
+    Перед дисковым хранилищем (SQLite) стоит LRU в памяти процесса.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        path: Optional[str] = None,
+        memory_size: Optional[int] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.model = model
+        self.memory_size = memory_size or int(
+            getenv("EMBEDDING_CACHE_MEMORY_SIZE", "10000")
+        )
+        self.store = SqliteStore(
+            path or getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3"),
+            table="embeddings",
+            max_entries=max_entries
+            or int(getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000")),
+        )
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model}\n{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, texts: List[str]) -> Dict[str, List[float]]:
+        """Возвращает {text: embedding} для найденных в кеше текстов"""
+        keys = {text: self.key(text) for text in texts}
+        found: Dict[str, List[float]] = {}
+        missing_keys = {}
+
+        with self._lock:
+            for text, key in keys.items():
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    self._memory.move_to_end(key)
+                    found[text] = embedding
+                    self.memory_hits += 1
+                else:
+                    missing_keys.setdefault(key, []).append(text)
+
+        if missing_keys:
+            stored = self.store.get_many(missing_keys.keys())
+            with self._lock:
+                for key, text_group in missing_keys.items():
+                    if key in stored:
+                        embedding = array("f", stored[key][0]).tolist()
+                        self._remember(key, embedding)
+                        for text in text_group:
+                            found[text] = embedding
+                        self.disk_hits += len(text_group)
+                    else:
+                        self.misses += len(text_group)
+
+        return found
+
+    def put_many(self, embeddings: Dict[str, List[float]]):
+        items = []
+        with self._lock:
+            for text, embedding in embeddings.items():
+                key = self.key(text)
+                self._remember(key, embedding)
+                items.append((key, array("f", embedding).tobytes()))
+        self.store.set_many(items)
+
+    def get_or_compute(
+        self,
+        texts: List[str],
+        compute: Callable[[List[str]], List[List[float]]],
+    ) -> List[List[float]]:
+        """
+        Возвращает эмбеддинги для texts, вызывая compute только для промахов
+
+        compute должен вернуть список эмбеддингов той же длины. Нулевые векторы
+        (признак ошибки сервиса) в кеш не попадают.
+        """
+        found = self.get_many(texts)
+        missing = self._group_missing(texts, found)
+        if missing:
+            representatives = [group[0] for group in missing.values()]
+            self._fill(found, missing, compute(representatives))
+        return [found[text] for text in texts]
+
+    async def aget_or_compute(
+        self,
+        texts: List[str],
+        compute: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        """То же, что get_or_compute, для асинхронного compute"""
+        found = self.get_many(texts)
+        missing = self._group_missing(texts, found)
+        if missing:
+            representatives = [group[0] for group in missing.values()]
+            self._fill(found, missing, await compute(representatives))
+        return [found[text] for text in texts]
+
+    def _group_missing(
+        self, texts: List[str], found: Dict[str, List[float]]
+    ) -> Dict[str, List[str]]:
+        """Промахи по ключу: совпадающие после нормализации тексты - в одной группе"""
+        missing: Dict[str, List[str]] = {}
+        for text in dict.fromkeys(texts):
+            if text not in found:
+                missing.setdefault(self.key(text), []).append(text)
+        return missing
+
+    def _fill(
+        self,
+        found: Dict[str, List[float]],
+        missing: Dict[str, List[str]],
+        embeddings: List[List[float]],
+    ):
+        """Раскладывает результат compute по текстам и сохраняет ненулевые векторы"""
+        if len(embeddings) != len(missing):
+            raise ValueError(
+                f"Expected {len(missing)} embeddings, got {len(embeddings)}"
+            )
+
+        computed = {}
+        for group, embedding in zip(missing.values(), embeddings):
+            computed[group[0]] = embedding
+            for text in group:
+                found[text] = embedding
+        self.put_many(
+            {
+                text: embedding
+                for text, embedding in computed.items()
+                if embedding and any(embedding)
+            }
+        )
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            ),
+            "memory_entries": len(self._memory),
+        }
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model: str) -> Optional[EmbeddingCache]:
+    """
+    Возвращает общий на процесс кеш для модели
+    (None, если кеш выключен через EMBEDDING_CACHE_ENABLED=0)
+    """
+    if getenv("EMBEDDING_CACHE_ENABLED", "1") == "0":
+        return None
+
+    with _caches_lock:
+        if model not in _caches:
+            _caches[model] = EmbeddingCache(model)
+        return _caches[model]
@@ -0,0 +1,410 @@
+import asyncio
+import bisect
+import logging
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from os import getenv
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from src.app.infra.embedder.cache import EmbeddingCache, get_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DEFAULT_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_DIM = 384
+
+# Статусы, при которых считаем, что пакетного эндпоинта у сервиса нет
+_BATCH_UNSUPPORTED_STATUSES = (404, 405, 501)
+_RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class EmbedderError(Exception):
+    """Сервис эмбеддингов не вернул корректный ответ после всех попыток"""
+
+
+class LatencyHistogram:
+    """Потокобезопасная гистограмма задержек с фиксированными корзинами (мс)"""
+
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self._total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            self._counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+            self._total_ms += ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Оценка перцентиля сверху - граница корзины, в которую он попал"""
+        with self._lock:
+            total = sum(self._counts)
+            if not total:
+                return None
+            threshold = q * total
+            running = 0
+            for bound, count in zip(self.BUCKETS_MS + (float("inf"),), self._counts):
+                running += count
+                if running >= threshold:
+                    return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            count = sum(self._counts)
+            buckets = {
+                f"<={bound}ms": value
+                for bound, value in zip(self.BUCKETS_MS, self._counts)
+            }
+            buckets[f">{self.BUCKETS_MS[-1]}ms"] = self._counts[-1]
+            mean = self._total_ms / count if count else None
+        return {
+            "count": count,
+            "mean_ms": mean,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": buckets,
+        }
+
+
+def _resolve_service() -> Tuple[str, str]:
+    """
+    Определяет базовый URL сервиса и модель.
+
+    Основная настройка - EMBEDDING_SERVICE_URL + EMBEDDING_MODEL. Для
+    совместимости поддерживается EMBEDDER_URL с полным путём вида
+    .../dialog/nlp/embedding/<model>.
+    """
+    base_url = getenv("EMBEDDING_SERVICE_URL")
+    model = getenv("EMBEDDING_MODEL")
+
+    if not base_url:
+        legacy_url = getenv("EMBEDDER_URL")
+        if not legacy_url:
+            raise ValueError(
+                "EMBEDDING_SERVICE_URL is not set in environment variables"
+            )
+        match = re.match(r"^(.*?)/dialog/nlp/embedding/([^/]+)/?$", legacy_url)
+        if match:
+            base_url = match.group(1)
+            model = model or match.group(2)
+        else:
+            base_url = legacy_url
+
+    return base_url.rstrip("/"), model or DEFAULT_EMBEDDING_MODEL
+
+
+class EmbedderClient:
+    """
+    Единый клиент сервиса эмбеддингов.
+
+    Держит долгоживущие httpx-клиенты (sync и async) с keep-alive и HTTP/2,
+    повторяет запросы при сетевых ошибках и 5xx, ходит пакетами через
+    /dialog/nlp/embeddings/<model> с откатом на поштучные запросы и пишет
+    задержки в гистограмму. Все эмбеддинги приложения (ingestion и запросы
+    пользователей) должны получаться через него, чтобы векторы гарантированно
+    были из одного пространства.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        http2: Optional[bool] = None,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        if base_url is None or model is None:
+            resolved_url, resolved_model = _resolve_service()
+            base_url = base_url or resolved_url
+            model = model or resolved_model
+
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout or float(getenv("EMBEDDING_TIMEOUT", "30"))
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(getenv("EMBEDDING_MAX_RETRIES", "3"))
+        )
+        self.batch_size = batch_size or int(getenv("EMBEDDING_BATCH_SIZE", "64"))
+        self.http2 = (
+            http2 if http2 is not None else getenv("EMBEDDING_HTTP2", "1") == "1"
+        )
+        self.cache = cache if cache is not None else get_embedding_cache(model)
+
+        self.single_path = f"/dialog/nlp/embedding/{model}"
+        self.batch_path = f"/dialog/nlp/embeddings/{model}"
+        self.batch_supported = True
+
+        self.request_latency = LatencyHistogram()
+        self.errors = 0
+        self.retries = 0
+
+        self._client: Optional[httpx.Client] = None
+        self._async_clients: Dict[
+            int, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]
+        ] = {}
+        self._lock = threading.Lock()
+
+    # --- клиенты ---------------------------------------------------------
+
+    def _client_kwargs(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "timeout": httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+            "headers": {"Content-Type": "application/json"},
+            "limits": httpx.Limits(
+                max_connections=32, max_keepalive_connections=16, keepalive_expiry=60
+            ),
+            "http2": self.http2,
+        }
+
+    def _get_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._client_kwargs())
+            return self._client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # AsyncClient привязан к циклу событий, поэтому держим по клиенту на цикл;
+        # закрывать его нужно до завершения цикла (aclose / async_embedder_session)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            stale = [
+                key
+                for key, (client_loop, client) in self._async_clients.items()
+                if client_loop.is_closed()
+            ]
+            for key in stale:
+                _, client = self._async_clients.pop(key)
+                if not client.is_closed:
+                    logger.warning(
+                        "Async embedding client outlived its event loop without "
+                        "aclose(); wrap the run in async_embedder_session()"
+                    )
+            entry = self._async_clients.get(id(loop))
+            if entry is None or entry[0] is not loop or entry[1].is_closed:
+                entry = (loop, httpx.AsyncClient(**self._client_kwargs()))
+                self._async_clients[id(loop)] = entry
+            return entry[1]
+
+    async def aclose(self):
+        """Закрывает AsyncClient текущего цикла событий и его соединения"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._async_clients.pop(id(loop), None)
+        if entry is not None and entry[0] is loop:
+            await entry[1].aclose()
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            self._async_clients.clear()
+
+    # --- HTTP с повторами --------------------------------------------------
+
+    def _backoff(self, attempt: int) -> float:
+        return min(0.25 * 2**attempt, 5.0)
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in _RETRYABLE_STATUSES
+        return isinstance(error, httpx.TransportError)
+
+    def _post(self, path: str, payload: dict) -> httpx.Response:
+        client = self._get_client()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = client.post(path, json=payload)
+                if response.status_code not in _BATCH_UNSUPPORTED_STATUSES:
+                    response.raise_for_status()
+                return response
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                error = e
+            finally:
+                self.request_latency.observe(time.perf_counter() - start)
+
+            if not self._should_retry(attempt, error):
+                self.errors += 1
+                raise EmbedderError(f"Embedding request failed: {error}") from error
+            self.retries += 1
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _apost(self, path: str, payload: dict) -> httpx.Response:
+        client = self._get_async_client()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                if response.status_code not in _BATCH_UNSUPPORTED_STATUSES:
+                    response.raise_for_status()
+                return response
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                error = e
+            finally:
+                self.request_latency.observe(time.perf_counter() - start)
+
+            if not self._should_retry(attempt, error):
+                self.errors += 1
+                raise EmbedderError(f"Embedding request failed: {error}") from error
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    # --- разбор ответов ----------------------------------------------------
+
+    def _parse_single(self, response: httpx.Response) -> List[float]:
+        if response.status_code in _BATCH_UNSUPPORTED_STATUSES:
+            raise EmbedderError(
+                f"Embedding endpoint returned {response.status_code}: {response.text}"
+            )
+        embedding = response.json().get("embedding")
+        if not embedding:
+            raise EmbedderError("Embedding service returned an empty embedding")
+        return embedding
+
+    def _parse_batch(
+        self, response: httpx.Response, chunk: List[str]
+    ) -> Optional[List[List[float]]]:
+        """Возвращает эмбеддинги пакета или None, если пакетного эндпоинта нет"""
+        if response.status_code in _BATCH_UNSUPPORTED_STATUSES:
+            logger.warning(
+                "Batch embedding endpoint is not available, "
+                "falling back to per-item requests"
+            )
+            self.batch_supported = False
+            return None
+        embeddings = response.json().get("embeddings", [])
+        if len(embeddings) != len(chunk):
+            raise EmbedderError(
+                f"Expected {len(chunk)} embeddings, got {len(embeddings)}"
+            )
+        return embeddings
+
+    def _chunks(self, texts: List[str]):
+        for start in range(0, len(texts), self.batch_size):
+            yield texts[start : start + self.batch_size]
+
+    # --- запросы к сервису -------------------------------------------------
+
+    def _request_one(self, text: str) -> List[float]:
+        return self._parse_single(self._post(self.single_path, {"text": text}))
+
+    def _request_many(self, texts: List[str]) -> List[List[float]]:
+        embeddings: List[List[float]] = []
+        for chunk in self._chunks(texts):
+            if self.batch_supported:
+                response = self._post(self.batch_path, {"texts": chunk})
+                batch = self._parse_batch(response, chunk)
+                if batch is not None:
+                    embeddings.extend(batch)
+                    continue
+            embeddings.extend(self._request_one(text) for text in chunk)
+        return embeddings
+
+    async def _arequest_one(self, text: str) -> List[float]:
+        response = await self._apost(self.single_path, {"text": text})
+        return self._parse_single(response)
+
+    async def _arequest_many(self, texts: List[str]) -> List[List[float]]:
+        embeddings: List[List[float]] = []
+        for chunk in self._chunks(texts):
+            if self.batch_supported:
+                response = await self._apost(self.batch_path, {"texts": chunk})
+                batch = self._parse_batch(response, chunk)
+                if batch is not None:
+                    embeddings.extend(batch)
+                    continue
+            embeddings.extend(
+                await asyncio.gather(*(self._arequest_one(text) for text in chunk))
+            )
+        return embeddings
+
+    # --- публичный API -----------------------------------------------------
+
+    def embed(self, text: str) -> List[float]:
+        """Эмбеддинг одного текста"""
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Эмбеддинги списка текстов в исходном порядке (через кеш)"""
+        if not texts:
+            return []
+        if self.cache is None:
+            unique = list(dict.fromkeys(texts))
+            by_text = dict(zip(unique, self._request_many(unique)))
+            return [by_text[text] for text in texts]
+        return self.cache.get_or_compute(texts, self._request_many)
+
+    async def aembed(self, text: str) -> List[float]:
+        return (await self.aembed_many([text]))[0]
+
+    async def aembed_many(self, texts: List[str]) -> List[List[float]]:
+        """Асинхронный embed_many: та же дедупликация и проверки через кеш"""
+        if not texts:
+            return []
+        if self.cache is None:
+            unique = list(dict.fromkeys(texts))
+            by_text = dict(zip(unique, await self._arequest_many(unique)))
+            return [by_text[text] for text in texts]
+        return await self.cache.aget_or_compute(texts, self._arequest_many)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "model": self.model,
+            "errors": self.errors,
+            "retries": self.retries,
+            "batch_supported": self.batch_supported,
+            "latency": self.request_latency.snapshot(),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+_embedder: Optional[EmbedderClient] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> EmbedderClient:
+    """Возвращает общий на процесс клиент сервиса эмбеддингов"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = EmbedderClient()
+        return _embedder
+
+
+@asynccontextmanager
+async def async_embedder_session() -> AsyncIterator[None]:
+    """
+    Область жизни асинхронного клиента эмбеддингов внутри одного asyncio.run:
+    на выходе его HTTP/2-соединения закрываются, пока цикл событий ещё жив
+    """
+    try:
+        yield
+    finally:
+        with _embedder_lock:
+            embedder = _embedder
+        if embedder is not None:
+            await embedder.aclose()
@@ -1,13 +1,9 @@
-import requests
-from os import getenv
-from dotenv import load_dotenv
 from typing import List
 import logging
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from src.app.infra.embedder.client import get_embedder
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 
 def get_embedding(text: str) -> List[float]:
@@ -21,26 +17,36 @@ def get_embedding(text: str) -> List[float]:
         List[float]: Список чисел с плавающей точкой — embedding.
 
     Raises:
-        ValueError: Если EMBEDDER_URL не задан или ответ сервера некорректен.
-        requests.RequestException: При ошибках сети или HTTP.
+        ValueError: Если текст пустой или адрес сервиса не задан.
+        EmbedderError: Если сервис не ответил корректно после всех попыток.
     """
     if not text:
         raise ValueError("Input text cannot be empty")
 
-    embedder_url = getenv("EMBEDDER_URL")
+    return get_embedder().embed(text)
+
+
+def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Получает embeddings для списка текстов пакетными запросами.
+
+    Args:
+        texts (List[str]): Тексты для векторизации.
 
-    try:
-        response = requests.post(embedder_url, json={"text": text}, timeout=30)
-        response.raise_for_status()
+    Returns:
+        List[List[float]]: Embeddings в том же порядке, что и texts.
+    """
+    return get_embedder().embed_many(texts)
+
+
+async def aget_embedding(text: str) -> List[float]:
+    """Асинхронная версия get_embedding"""
+    if not text:
+        raise ValueError("Input text cannot be empty")
 
-        data = response.json()
-        embedding = data.get("embedding")
+    return await get_embedder().aembed(text)
 
-        return embedding
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request failed: {e}")
-        raise
-    except ValueError as e:
-        logger.error(f"Invalid response format: {e}")
-        raise
+async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+    """Асинхронная версия get_embeddings"""
+    return await get_embedder().aembed_many(texts)
@@ -0,0 +1,73 @@
+"""
+Локальная заглушка сервиса эмбеддингов для тестов и бенчмарков.
+
+Повторяет API боевого сервиса:
+    POST /dialog/nlp/embedding/{model}   {"text": "..."}      -> {"embedding": [...]}
+    POST /dialog/nlp/embeddings/{model}  {"texts": ["..."]}   -> {"embeddings": [[...], ...]}
+
+Векторы детерминированы (строятся из sha256 текста) и нормированы, так что
+одинаковые тексты всегда получают одинаковые эмбеддинги.
+
+Запуск:
+    uvicorn src.app.infra.embedder.stub_server:app --port 8090
+
+EMBEDDER_STUB_NO_BATCH=1 отключает пакетный эндпоинт (для проверки отката
+на поштучные запросы), EMBEDDER_STUB_DELAY_MS добавляет задержку на запрос.
+"""
+
+import asyncio
+import hashlib
+import math
+import struct
+from os import getenv
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+EMBEDDING_DIM = 384
+
+app = FastAPI(title="Embedder stub")
+
+
+class EmbeddingRequest(BaseModel):
+    text: str
+
+
+class BatchEmbeddingRequest(BaseModel):
+    texts: List[str]
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Строит детерминированный единичный вектор по тексту"""
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(
+            (value / 2**31) - 1.0 for value in struct.unpack(">8I", digest)
+        )
+        counter += 1
+    values = values[:dim]
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [value / norm for value in values]
+
+
+async def _simulate_latency():
+    delay_ms = float(getenv("EMBEDDER_STUB_DELAY_MS", "0"))
+    if delay_ms > 0:
+        await asyncio.sleep(delay_ms / 1000)
+
+
+@app.post("/dialog/nlp/embedding/{model}")
+async def embed(model: str, request: EmbeddingRequest):
+    await _simulate_latency()
+    return {"embedding": fake_embedding(request.text)}
+
+
+@app.post("/dialog/nlp/embeddings/{model}")
+async def embed_batch(model: str, request: BatchEmbeddingRequest):
+    if getenv("EMBEDDER_STUB_NO_BATCH") == "1":
+        raise HTTPException(status_code=404, detail="Not Found")
+    await _simulate_latency()
+    return {"embeddings": [fake_embedding(text) for text in request.texts]}
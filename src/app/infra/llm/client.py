@@ -16,3 +16,12 @@ llm = ChatOpenAI(
     model=getenv("MODEL"),
     api_key="EMPTY",
 )
+
+# Лёгкая модель для вспомогательных задач (например, фильтрации поисковой
+# выдачи); если LIGHT_MODEL не задана, используется основная модель
+light_llm = ChatOpenAI(
+    base_url=getenv("LIGHT_MODEL_API_BASE") or getenv("MODEL_API_BASE"),
+    model=getenv("LIGHT_MODEL") or getenv("MODEL"),
+    api_key="EMPTY",
+    temperature=0,
+)
@@ -0,0 +1,9 @@
+-- Отметка об обработке сырых данных: каждая запись bank_buffer извлекается
+-- LLM ровно один раз. Скрипт идемпотентен и подходит для уже созданной БД.
+ALTER TABLE bank_buffer
+    ADD COLUMN IF NOT EXISTS processed_at TIMESTAMPTZ;
+
+-- Частичный индекс: выборка необработанных записей не сканирует обработанные
+CREATE INDEX IF NOT EXISTS idx_bank_buffer_unprocessed
+    ON bank_buffer (ts)
+    WHERE processed_at IS NULL;
@@ -0,0 +1,38 @@
+-- Дедупликация сырых страниц по содержимому. Текст страницы хранится один раз
+-- на (source, content_hash), а bank_buffer связывает её с парами банк-продукт.
+-- Скрипт идемпотентен и подходит для уже созданной БД.
+CREATE TABLE IF NOT EXISTS raw_pages (
+    id           BIGSERIAL PRIMARY KEY,
+    source       TEXT NOT NULL,
+    content_hash TEXT NOT NULL,             -- sha256 текста страницы (hex)
+    raw_data     TEXT NOT NULL,
+    first_seen   TIMESTAMPTZ NOT NULL DEFAULT (timezone('utc', now())),
+    last_seen    TIMESTAMPTZ NOT NULL DEFAULT (timezone('utc', now())),
+    CONSTRAINT raw_pages_source_hash_unique UNIQUE (source, content_hash)
+);
+
+ALTER TABLE bank_buffer
+    ADD COLUMN IF NOT EXISTS page_id BIGINT REFERENCES raw_pages(id) ON DELETE CASCADE;
+
+-- Новые записи хранят текст в raw_pages, старые - в raw_data
+ALTER TABLE bank_buffer
+    ALTER COLUMN raw_data DROP NOT NULL;
+
+-- Пара банк-продукт ссылается на одну и ту же страницу не более одного раза
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bank_buffer_pair_page
+    ON bank_buffer (bank_id, product_id, page_id);
+
+-- Очистка: кроме старых записей bank_buffer удаляем страницы,
+-- на которые больше никто не ссылается
+CREATE OR REPLACE FUNCTION bank_buffer_cleanup()
+RETURNS trigger AS $$
+BEGIN
+    DELETE FROM bank_buffer
+    WHERE ts < (timezone('utc', now()) - INTERVAL '7 days');
+
+    DELETE FROM raw_pages rp
+    WHERE rp.last_seen < (timezone('utc', now()) - INTERVAL '7 days')
+      AND NOT EXISTS (SELECT 1 FROM bank_buffer bb WHERE bb.page_id = rp.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
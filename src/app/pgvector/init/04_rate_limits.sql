@@ -0,0 +1,48 @@
+-- Общие для всех процессов token bucket-лимиты (Serper, загрузка страниц).
+-- Строка на лимит; токены пересчитываются при каждом обращении, поэтому
+-- фоновая задача пополнения не нужна. Скрипт идемпотентен.
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name       TEXT PRIMARY KEY,
+    tokens     DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+-- Пытается взять один токен из корзины p_name.
+-- Возвращает 0, если токен получен, иначе - сколько секунд подождать
+-- до следующей попытки. Строка блокируется только на время вызова.
+CREATE OR REPLACE FUNCTION rate_limit_acquire(
+    p_name     TEXT,
+    p_rate     DOUBLE PRECISION,  -- токенов в секунду
+    p_capacity DOUBLE PRECISION   -- максимальный размер всплеска
+)
+RETURNS DOUBLE PRECISION AS $$
+DECLARE
+    now_ts    TIMESTAMPTZ := clock_timestamp();
+    available DOUBLE PRECISION;
+BEGIN
+    INSERT INTO rate_limits (name, tokens, updated_at)
+    VALUES (p_name, p_capacity, now_ts)
+    ON CONFLICT (name) DO NOTHING;
+
+    SELECT LEAST(
+               p_capacity,
+               tokens + GREATEST(EXTRACT(EPOCH FROM now_ts - updated_at), 0) * p_rate
+           )
+    INTO available
+    FROM rate_limits
+    WHERE name = p_name
+    FOR UPDATE;
+
+    IF available >= 1 THEN
+        UPDATE rate_limits
+        SET tokens = available - 1, updated_at = now_ts
+        WHERE name = p_name;
+        RETURN 0;
+    END IF;
+
+    UPDATE rate_limits
+    SET tokens = available, updated_at = now_ts
+    WHERE name = p_name;
+    RETURN (1 - available) / p_rate;
+END;
+$$ LANGUAGE plpgsql;
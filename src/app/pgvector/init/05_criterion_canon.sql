@@ -0,0 +1,19 @@
+-- Канонические критерии: близкие по смыслу формулировки одного критерия
+-- ("ставка по накопительному счету" / "...счёту") сводятся к одной записи
+-- в рамках продукта. Скрипт идемпотентен и подходит для уже созданной БД.
+CREATE TABLE IF NOT EXISTS criterion_canon (
+    id         BIGSERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    name       TEXT    NOT NULL,            -- формулировка, открывшая кластер
+    embed      VECTOR  NOT NULL,            -- эмбеддинг этой формулировки
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (timezone('utc', now())),
+    CONSTRAINT criterion_canon_product_name_unique UNIQUE (product_id, name)
+);
+
+ALTER TABLE bank_analysis
+    ADD COLUMN IF NOT EXISTS canonical_id BIGINT
+    REFERENCES criterion_canon(id) ON DELETE SET NULL;
+
+-- Поиск значений критерия по паре банк-продукт без сканирования векторов
+CREATE INDEX IF NOT EXISTS idx_bank_analysis_canonical
+    ON bank_analysis (bank_id, product_id, canonical_id);
@@ -1,9 +1,7 @@
 import logging
-from datetime import datetime, timezone
 from typing import List, Optional
 
 from langchain_core.tools import tool
-from src.app.agents.web_search_agent.tools import get_connection
 
 from src.app.tools.data_processor import DataProcessor
 
@@ -16,21 +14,24 @@ def process_raw_data_for_criteria(
     product_id: Optional[int] = None,
     criteria_list: Optional[List[str]] = None,
     force_today: bool = True,
+    reprocess: bool = False,
 ) -> str:
     """
     Обрабатывает сырые данные из bank_buffer и извлекает указанные критерии.
 
     Этот инструмент:
-    1. Выбирает сырые данные из bank_buffer за сегодня (или все данные если force_today=False)
+    1. Выбирает ещё не обработанные сырые данные из bank_buffer за сегодня (или все данные если force_today=False)
     2. Фильтрует по bank_id и product_id если указаны
     3. Извлекает указанные критерии из текста
     4. Генерирует эмбеддинги и сохраняет в bank_analysis
+    5. Помечает записи обработанными, чтобы повторные вызовы их не трогали
 
     Args:
         bank_id: ID банка для фильтрации (необязательно)
         product_id: ID продукта для фильтрации (необязательно)
         criteria_list: Список конкретных критериев для извлечения (необязательно)
         force_today: Обрабатывать только сегодняшние данные (по умолчанию True)
+        reprocess: Повторно обработать уже обработанные записи, например для backfill (по умолчанию False)
 
     Returns:
         str: Статус обработки с количеством обработанных записей
@@ -38,70 +39,16 @@ def process_raw_data_for_criteria(
     try:
         processor = DataProcessor()
 
-        today_date = datetime.now(timezone.utc).date() if force_today else None
+        processed_records, total_criteria = processor.process_filtered_records(
+            bank_id=bank_id,
+            product_id=product_id,
+            criteria_list=criteria_list,
+            force_today=force_today,
+            reprocess=reprocess,
+        )
 
-        conn = get_connection()
-        processed_records = 0
-        total_criteria = 0
-
-        with conn.cursor() as cursor:
-            query = """
-                SELECT id, bank_id, product_id, raw_data, source, ts
-                FROM bank_buffer
-                WHERE 1=1
-            """
-            params = []
-
-            if today_date:
-                today_start = datetime.combine(
-                    today_date, datetime.min.time(), tzinfo=timezone.utc
-                )
-                today_end = datetime.combine(
-                    today_date, datetime.max.time(), tzinfo=timezone.utc
-                )
-                query += " AND ts >= %s AND ts <= %s"
-                params.extend([today_start, today_end])
-
-            if bank_id is not None:
-                query += " AND bank_id = %s"
-                params.append(bank_id)
-
-            if product_id is not None:
-                query += " AND product_id = %s"
-                params.append(product_id)
-
-            query += " ORDER BY bank_id, product_id, id"
-
-            cursor.execute(query, params)
-            records = cursor.fetchall()
-
-            if not records:
-                return f"Не найдено сырых данных для обработки. Параметры: bank_id={bank_id}, product_id={product_id}, today_only={force_today}"
-
-            logger.info(f"Найдено {len(records)} записей для обработки")
-
-            for record in records:
-                record_data = {
-                    "id": record[0],
-                    "bank_id": record[1],
-                    "product_id": record[2],
-                    "raw_data": record[3],
-                    "source": record[4],
-                    "ts": record[5],
-                }
-
-                processed_criteria = processor.process_single_record_with_criteria(
-                    record_data, criteria_list
-                )
-
-                if processed_criteria:
-                    success = processor.save_criteria_to_db(processed_criteria)
-                    if success:
-                        processed_records += 1
-                        total_criteria += len(processed_criteria)
-                        logger.info(
-                            f"Обработано {len(processed_criteria)} критериев для записи ID {record[0]}"
-                        )
+        if not processed_records:
+            return f"Не найдено необработанных сырых данных. Параметры: bank_id={bank_id}, product_id={product_id}, today_only={force_today}, reprocess={reprocess}"
 
         result = f"Успешно обработано {processed_records} записей с {total_criteria} критериями"
         if bank_id or product_id or criteria_list:
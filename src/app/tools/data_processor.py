@@ -1,19 +1,21 @@
+import asyncio
 import json
 import logging
 import re
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from os import getenv
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, Tuple, TypeVar
 
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from pydantic import BaseModel, Field, ValidationError, validator
-from src.app.agents.web_search_agent.tools import (
-    get_connection,
-    get_embedding,
-    save_processed_data,
-)
+from src.app.agents.web_search_agent.tools import save_processed_data
 
 from src.app.domain.models import CriterionWithEmbedding
+from src.app.infra.db.pool import connection
+from src.app.infra.db.reference_cache import reference_cache
+from src.app.infra.embedder.client import async_embedder_session, get_embedder
+from src.app.infra.embedder.get_embedding import aget_embeddings, get_embeddings
 from src.app.infra.llm.client import llm
 
 
@@ -22,6 +24,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 load_dotenv()
 
 
@@ -48,89 +52,25 @@ class CriteriaExtractionResult(BaseModel):
     )
 
 
-class DataProcessor:
-    def __init__(self):
-        self.llm = llm
-        self.today_date = datetime.now(timezone.utc).date()
+class PackedRecordCriteria(BaseModel):
+    id: int = Field(..., description="ID записи bank_buffer")
+    criteria: List[ExtractedCriterion] = Field(
+        default_factory=list, description="Критерии, извлеченные из записи"
+    )
 
-    def get_today_raw_data(self) -> List[Dict[str, Any]]:
-        """Получает сырые данные за сегодняшнее число из bank_buffer"""
-        conn = get_connection()
-        try:
-            with conn.cursor() as cursor:
-                today_start = datetime.combine(
-                    self.today_date, datetime.min.time(), tzinfo=timezone.utc
-                )
-                today_end = datetime.combine(
-                    self.today_date, datetime.max.time(), tzinfo=timezone.utc
-                )
 
-                cursor.execute(
-                    """
-                    SELECT id, bank_id, product_id, raw_data, source, ts
-                    FROM bank_buffer
-                    WHERE ts >= %s AND ts <= %s
-                    ORDER BY bank_id, product_id, id
-                """,
-                    (today_start, today_end),
-                )
+class PackedExtractionResult(BaseModel):
+    records: List[PackedRecordCriteria] = Field(
+        ..., description="Критерии по каждой записи пакета"
+    )
 
-                rows = cursor.fetchall()
-                results = []
-                for row in rows:
-                    results.append(
-                        {
-                            "id": row[0],
-                            "bank_id": row[1],
-                            "product_id": row[2],
-                            "raw_data": row[3],
-                            "source": row[4],
-                            "ts": row[5],
-                        }
-                    )
 
-                logger.info(
-                    f"Found {len(results)} raw data records for today ({self.today_date})"
-                )
-                return results
+# Системный промпт для структурирования данных
+class CriteriaParseError(Exception):
+    """Ответ LLM не удалось разобрать как список критериев"""
 
-        except Exception as e:
-            logger.error(f"Error fetching raw data from bank_buffer: {str(e)}")
-            raise
 
-    def get_bank_and_product_names(
-        self, bank_id: int, product_id: int
-    ) -> Tuple[str, str]:
-        """Получает названия банка и продукта по их ID"""
-        conn = get_connection()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT bank FROM banks WHERE id = %s", (bank_id,))
-                bank_row = cursor.fetchone()
-                bank_name = bank_row[0] if bank_row else f"bank_{bank_id}"
-
-                cursor.execute(
-                    "SELECT product FROM products WHERE id = %s", (product_id,)
-                )
-                product_row = cursor.fetchone()
-                product_name = (
-                    product_row[0] if product_row else f"product_{product_id}"
-                )
-
-                return bank_name, product_name
-        except Exception as e:
-            logger.error(f"Error getting bank/product names: {str(e)}")
-            return f"bank_{bank_id}", f"product_{product_id}"
-
-    def extract_criteria_from_text(
-        self, raw_str, bank_name: str, product_name: str
-    ) -> List[ExtractedCriterion]:
-        """
-        Извлекает атомарные критерии из сырого текста с помощью LLM
-        """
-        try:
-            # Системный промпт для структурирования данных
-            system_prompt = """Вы - эксперт по анализу банковских продуктов. Ваша задача - извлечь из неструктурированного текста атомарные критерии для сравнения банковских продуктов. Критерии должны соответствовать следующим требованиям:
+CRITERIA_SYSTEM_PROMPT = """Вы - эксперт по анализу банковских продуктов. Ваша задача - извлечь из неструктурированного текста атомарные критерии для сравнения банковских продуктов. Критерии должны соответствовать следующим требованиям:
 
 1. Конкретные и измеримые параметры
 2. Представлены в формате "название критерия" и "значение"
@@ -159,9 +99,250 @@ class DataProcessor:
 - "требования": "подтверждение дохода, возраст от 21 года"
 
 ВАЖНО: Верните ТОЛЬКО валидный JSON в строго указанном формате без дополнительных комментариев или пояснений.
-            """
+"""
+
+
+_CHUNK_SEPARATORS = (r"\n\s*\n", r"\n", r"(?<=[.!?;])\s+", r"\s+")
+
+
+def split_text_into_chunks(text: str, max_chars: int) -> List[str]:
+    """
+    Делит текст на фрагменты не длиннее max_chars по структурным границам:
+    сначала абзацы, затем строки, предложения и, в крайнем случае, слова.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+
+    def split(piece: str, level: int) -> List[str]:
+        if len(piece) <= max_chars:
+            return [piece]
+        if level >= len(_CHUNK_SEPARATORS):
+            return [
+                piece[start : start + max_chars]
+                for start in range(0, len(piece), max_chars)
+            ]
+        parts = [p for p in re.split(_CHUNK_SEPARATORS[level], piece) if p.strip()]
+        if len(parts) == 1:
+            return split(piece, level + 1)
+        return [sub for part in parts for sub in split(part, level + 1)]
+
+    chunks = []
+    current = ""
+    for part in split(text, 0):
+        if current and len(current) + 1 + len(part) > max_chars:
+            chunks.append(current)
+            current = part
+        else:
+            current = f"{current}\n{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def normalize_criterion_name(name: str) -> str:
+    """Ключ для сравнения названий критериев: регистр, ё/е, пробелы"""
+    return re.sub(r"\s+", " ", name.casefold().replace("ё", "е")).strip()
+
+
+def merge_criteria(
+    chunk_criteria: List[List[ExtractedCriterion]],
+) -> List[ExtractedCriterion]:
+    """Объединяет критерии фрагментов, оставляя первое вхождение каждого названия"""
+    merged: Dict[str, ExtractedCriterion] = {}
+    for criteria in chunk_criteria:
+        for criterion in criteria:
+            merged.setdefault(normalize_criterion_name(criterion.criterion), criterion)
+    return list(merged.values())
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: ~3 символа русского текста на токен"""
+    return len(text) // 3 + 1
+
 
-            user_prompt = f"""
+class DataProcessor:
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.llm = llm
+        self.today_date = datetime.now(timezone.utc).date()
+        # Сколько запросов к LLM держим одновременно в полёте
+        self.max_concurrency = max(
+            1, max_concurrency or int(getenv("LLM_MAX_CONCURRENCY", "16"))
+        )
+        # Максимальный размер фрагмента текста для одного запроса к LLM
+        # (0 - отправлять текст целиком)
+        self.chunk_chars = int(getenv("EXTRACTION_CHUNK_CHARS", "4000"))
+        # Бюджет токенов на пакет коротких записей одной пары банк-продукт
+        # (0 - не упаковывать записи в общий запрос)
+        self.pack_tokens = int(getenv("EXTRACTION_PACK_TOKENS", "3000"))
+        # Сколько записей bank_buffer читаем с сервера и обрабатываем за раз
+        self.read_batch_size = int(getenv("RAW_DATA_BATCH_SIZE", "200"))
+
+    def _raw_records_query(
+        self,
+        bank_id: Optional[int] = None,
+        product_id: Optional[int] = None,
+        force_today: bool = True,
+        reprocess: bool = False,
+    ) -> Tuple[str, List[Any]]:
+        """Строит запрос выборки записей bank_buffer для обработки"""
+        # Текст новых записей лежит в raw_pages, старых - в самом bank_buffer
+        query = """
+            SELECT bb.id, bb.bank_id, bb.product_id,
+                   COALESCE(rp.raw_data, bb.raw_data), bb.source, bb.ts
+            FROM bank_buffer bb
+            LEFT JOIN raw_pages rp ON rp.id = bb.page_id
+            WHERE 1=1
+        """
+        params = []
+
+        if not reprocess:
+            query += " AND bb.processed_at IS NULL"
+
+        if force_today:
+            today_start = datetime.combine(
+                self.today_date, datetime.min.time(), tzinfo=timezone.utc
+            )
+            today_end = datetime.combine(
+                self.today_date, datetime.max.time(), tzinfo=timezone.utc
+            )
+            query += " AND bb.ts >= %s AND bb.ts <= %s"
+            params.extend([today_start, today_end])
+
+        if bank_id is not None:
+            query += " AND bb.bank_id = %s"
+            params.append(bank_id)
+
+        if product_id is not None:
+            query += " AND bb.product_id = %s"
+            params.append(product_id)
+
+        query += " ORDER BY bb.bank_id, bb.product_id, bb.id"
+        return query, params
+
+    def iter_raw_records(
+        self,
+        bank_id: Optional[int] = None,
+        product_id: Optional[int] = None,
+        force_today: bool = True,
+        reprocess: bool = False,
+        batch_size: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Лениво читает записи bank_buffer через именованный (серверный) курсор
+
+        Строки приходят с сервера порциями по batch_size, поэтому потребление
+        памяти не зависит от объёма буфера. Чтение занимает отдельное
+        соединение из пула: коммиты при сохранении результатов не закрывают курсор.
+
+        По умолчанию возвращает только записи, которые ещё не были обработаны
+        (processed_at IS NULL); reprocess=True снимает это ограничение.
+        """
+        query, params = self._raw_records_query(
+            bank_id=bank_id,
+            product_id=product_id,
+            force_today=force_today,
+            reprocess=reprocess,
+        )
+
+        try:
+            with connection() as conn, conn.cursor(
+                name="bank_buffer_stream"
+            ) as cursor:
+                cursor.itersize = batch_size or self.read_batch_size
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield {
+                        "id": row[0],
+                        "bank_id": row[1],
+                        "product_id": row[2],
+                        "raw_data": row[3],
+                        "source": row[4],
+                        "ts": row[5],
+                    }
+        except Exception as e:
+            logger.error(f"Error streaming raw data from bank_buffer: {str(e)}")
+            raise
+
+    def iter_raw_record_batches(
+        self, batch_size: Optional[int] = None, **filters
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Группирует поток iter_raw_records в списки по batch_size записей"""
+        batch_size = batch_size or self.read_batch_size
+        batch: List[Dict[str, Any]] = []
+        for record in self.iter_raw_records(batch_size=batch_size, **filters):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def fetch_raw_records(
+        self,
+        bank_id: Optional[int] = None,
+        product_id: Optional[int] = None,
+        force_today: bool = True,
+        reprocess: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Выбирает все записи bank_buffer для обработки одним списком"""
+        results = list(
+            self.iter_raw_records(
+                bank_id=bank_id,
+                product_id=product_id,
+                force_today=force_today,
+                reprocess=reprocess,
+            )
+        )
+        logger.info(f"Found {len(results)} raw data records for processing")
+        return results
+
+    def get_today_raw_data(self, reprocess: bool = False) -> List[Dict[str, Any]]:
+        """Получает необработанные сырые данные за сегодняшнее число из bank_buffer"""
+        return self.fetch_raw_records(force_today=True, reprocess=reprocess)
+
+    def mark_records_processed(self, record_ids: List[int]):
+        """Помечает записи bank_buffer как обработанные"""
+        if not record_ids:
+            return
+
+        try:
+            with connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE bank_buffer
+                    SET processed_at = timezone('utc', now())
+                    WHERE id = ANY(%s)
+                    """,
+                    (list(record_ids),),
+                )
+            logger.info(f"Marked {len(record_ids)} bank_buffer records as processed")
+        except Exception as e:
+            logger.error(f"Error marking records as processed: {str(e)}")
+            raise
+
+    def get_bank_and_product_names(
+        self, bank_id: int, product_id: int
+    ) -> Tuple[str, str]:
+        """Получает названия банка и продукта по их ID (из кеша справочников)"""
+        try:
+            return (
+                reference_cache.bank_name(bank_id),
+                reference_cache.product_name(product_id),
+            )
+        except Exception as e:
+            logger.error(f"Error getting bank/product names: {str(e)}")
+            return f"bank_{bank_id}", f"product_{product_id}"
+
+    def build_criteria_messages(
+        self, raw_str, bank_name: str, product_name: str
+    ) -> List[BaseMessage]:
+        """Собирает промпт для извлечения всех атомарных критериев"""
+        system_prompt = CRITERIA_SYSTEM_PROMPT
+
+        user_prompt = f"""
 БАНК: {bank_name}
 ПРОДУКТ: {product_name}
 
@@ -186,42 +367,190 @@ class DataProcessor:
 - Максимально детализируйте параметры (разделяйте диапазоны на отдельные критерии)
 - Используйте точные формулировки из примеров корректных критериев
 - Если в тексте нет измеримых параметров, верните пустой массив criteria
-            """
+        """
+
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt),
+        ]
+
+    def build_specific_criteria_messages(
+        self, raw_str, bank_name: str, product_name: str, criteria_list: List[str]
+    ) -> List[BaseMessage]:
+        """Собирает промпт для извлечения только указанных критериев"""
+        criteria_str = "\n".join([f"- {criterion}" for criterion in criteria_list])
+
+        system_prompt = f"""Вы - эксперт по анализу банковских продуктов. Ваша задача - извлечь ИЗ СПИСКА УКАЗАННЫХ КРИТЕРИЕВ те, которые присутствуют в тексте.
+        
+        СПИСОК КРИТЕРИЕВ ДЛЯ ПОИСКА:
+        {criteria_str}
+        
+        Правила:
+        - Извлекайте ТОЛЬКО критерии из указанного списка
+        - Если критерий из списка отсутствует в тексте - не включайте его в результат
+        - Значение должно быть точным и соответствовать тексту
+        - Все критерии должны быть на русском языке
+        - Верните ТОЛЬКО валидный JSON в формате {{"criteria": [{{"criterion": "название", "value": "значение"}}, ...]}}
+        - Если ни один критерий из списка не найден, верните пустой массив criteria
+        """
 
-            # Создаем промпт
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt),
+        user_prompt = f"""
+        БАНК: {bank_name}
+        ПРОДУКТ: {product_name}
+        
+        ТЕКСТ ДЛЯ АНАЛИЗА:
+        {raw_str}
+        
+        ИЗВЛЕКАЙТЕ ТОЛЬКО КРИТЕРИИ ИЗ УКАЗАННОГО ВЫШЕ СПИСКА.
+        """
+
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt),
+        ]
+
+    def build_packed_criteria_messages(
+        self, records: List[Dict[str, Any]], bank_name: str, product_name: str
+    ) -> List[BaseMessage]:
+        """Собирает один промпт для нескольких коротких записей одной пары"""
+        records_str = "\n\n".join(
+            f"=== ЗАПИСЬ id={record['id']} ===\n{record['raw_data']}"
+            for record in records
+        )
+
+        user_prompt = f"""
+БАНК: {bank_name}
+ПРОДУКТ: {product_name}
+
+НИЖЕ НЕСКОЛЬКО НЕЗАВИСИМЫХ ЗАПИСЕЙ С СЫРЫМИ ДАННЫМИ. У КАЖДОЙ ЗАПИСИ СВОЙ id:
+
+{records_str}
+
+ЗАДАЧА: Для КАЖДОЙ записи отдельно извлеките ВСЕ возможные атомарные критерии только из её текста. Верните результат ТОЛЬКО в формате JSON:
+
+{{
+    "records": [
+        {{
+            "id": id записи,
+            "criteria": [
+                {{
+                    "criterion": "название критерия",
+                    "value": "значение критерия"
+                }},
+                ...
             ]
+        }},
+        ...
+    ]
+}}
 
-      
-            response = self.llm.invoke(messages)
-            response_text = response.content.strip()
+ТРЕБОВАНИЯ К ФОРМАТУ:
+- Верните ТОЛЬКО валидный JSON без дополнительного текста
+- Верните элемент для каждой записи, используя её id; если в записи нет измеримых параметров, верните для неё пустой массив criteria
+- Не переносите критерии из одной записи в другую
+- Все критерии должны быть на русском языке
+- Максимально детализируйте параметры (разделяйте диапазоны на отдельные критерии)
+        """
 
-            json_match = re.search(r"```json\s*({.*?})\s*```", response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-            
-                json_str = re.sub(r"^[^{]*", "", response_text, flags=re.DOTALL)
-                json_str = re.sub(r"[^}]*$", "", json_str, flags=re.DOTALL)
-
-            try:
-                parsed_data = json.loads(json_str)
-                validation_result = CriteriaExtractionResult(**parsed_data)
-                logger.info(
-                    f"Successfully extracted {len(validation_result.criteria)} criteria"
+        return [
+            SystemMessage(content=CRITERIA_SYSTEM_PROMPT),
+            HumanMessage(content=user_prompt),
+        ]
+
+    def parse_packed_criteria_response(
+        self, response_text: str, record_ids: List[int]
+    ) -> Optional[Dict[int, Optional[List[ExtractedCriterion]]]]:
+        """
+        Разбирает ответ на упакованный промпт в {id записи: критерии}.
+        Записи, которых нет в ответе, получают None - их нужно извлечь
+        отдельно. Возвращает None, если ответ не удалось разобрать
+        """
+        json_match = re.search(r"```json\s*({.*?})\s*```", response_text, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(1)
+        else:
+            json_str = re.sub(r"^[^{]*", "", response_text, flags=re.DOTALL)
+            json_str = re.sub(r"[^}]*$", "", json_str, flags=re.DOTALL)
+
+        try:
+            validation_result = PackedExtractionResult(**json.loads(json_str))
+        except (json.JSONDecodeError, ValidationError) as e:
+            logger.error(f"Error parsing packed LLM response: {str(e)}")
+            logger.error(f"Raw response: {response_text}")
+            return None
+
+        by_id: Dict[int, Optional[List[ExtractedCriterion]]] = {
+            record_id: None for record_id in record_ids
+        }
+        for packed_record in validation_result.records:
+            if packed_record.id not in by_id:
+                logger.warning(
+                    f"Packed LLM response contains unknown record id {packed_record.id}"
                 )
-                return validation_result.criteria
-            except (json.JSONDecodeError, ValidationError) as e:
-                logger.error(f"Error parsing LLM response: {str(e)}")
-                logger.error(f"Raw response: {response_text}")
-                return []
+                continue
+            if by_id[packed_record.id] is None:
+                by_id[packed_record.id] = []
+            by_id[packed_record.id].extend(packed_record.criteria)
+
+        missing = [record_id for record_id, criteria in by_id.items() if criteria is None]
+        if missing:
+            logger.warning(f"Packed LLM response omitted records {missing}")
+        return by_id
+
+    def parse_criteria_response(
+        self, response_text: str, kind: str = "criteria"
+    ) -> List[ExtractedCriterion]:
+        """
+        Достаёт JSON с критериями из ответа LLM и валидирует его.
+        Неразобранный ответ - сбой извлечения, а не страница без критериев,
+        поэтому бросается CriteriaParseError
+        """
+        json_match = re.search(r"```json\s*({.*?})\s*```", response_text, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(1)
+        else:
+            json_str = re.sub(r"^[^{]*", "", response_text, flags=re.DOTALL)
+            json_str = re.sub(r"[^}]*$", "", json_str, flags=re.DOTALL)
+
+        try:
+            parsed_data = json.loads(json_str)
+            validation_result = CriteriaExtractionResult(**parsed_data)
+            logger.info(
+                f"Successfully extracted {len(validation_result.criteria)} {kind}"
+            )
+            return validation_result.criteria
+        except (json.JSONDecodeError, ValidationError) as e:
+            logger.error(f"Error parsing LLM response for {kind}: {str(e)}")
+            logger.error(f"Raw response: {response_text}")
+            raise CriteriaParseError(str(e)) from e
+
+    def extract_criteria_from_text(
+        self, raw_str, bank_name: str, product_name: str
+    ) -> List[ExtractedCriterion]:
+        """
+        Извлекает атомарные критерии из сырого текста с помощью LLM
+        """
+        try:
+            messages = self.build_criteria_messages(raw_str, bank_name, product_name)
+            response = self.llm.invoke(messages)
+            return self.parse_criteria_response(response.content.strip())
 
         except Exception as e:
             logger.error(f"Error extracting criteria: {str(e)}")
             return []
 
+    async def aextract_criteria_from_text(
+        self, raw_str, bank_name: str, product_name: str
+    ) -> List[ExtractedCriterion]:
+        """
+        Асинхронная версия extract_criteria_from_text (через llm.ainvoke).
+        Ошибки обращения к LLM и разбора ответа пробрасываются, чтобы запись
+        не считалась обработанной
+        """
+        messages = self.build_criteria_messages(raw_str, bank_name, product_name)
+        response = await self.llm.ainvoke(messages)
+        return self.parse_criteria_response(response.content.strip())
+
     def extract_specific_criteria_from_text(
         self, raw_str, bank_name: str, product_name: str, criteria_list: List[str]
     ) -> List[ExtractedCriterion]:
@@ -232,89 +561,102 @@ class DataProcessor:
             if not criteria_list:
                 return self.extract_criteria_from_text(raw_str, bank_name, product_name)
 
-            criteria_str = "\n".join([f"- {criterion}" for criterion in criteria_list])
-
-            system_prompt = f"""Вы - эксперт по анализу банковских продуктов. Ваша задача - извлечь ИЗ СПИСКА УКАЗАННЫХ КРИТЕРИЕВ те, которые присутствуют в тексте.
-            
-            СПИСОК КРИТЕРИЕВ ДЛЯ ПОИСКА:
-            {criteria_str}
-            
-            Правила:
-            - Извлекайте ТОЛЬКО критерии из указанного списка
-            - Если критерий из списка отсутствует в тексте - не включайте его в результат
-            - Значение должно быть точным и соответствовать тексту
-            - Все критерии должны быть на русском языке
-            - Верните ТОЛЬКО валидный JSON в формате {{"criteria": [{{"criterion": "название", "value": "значение"}}, ...]}}
-            - Если ни один критерий из списка не найден, верните пустой массив criteria
-            """
-
-            user_prompt = f"""
-            БАНК: {bank_name}
-            ПРОДУКТ: {product_name}
-            
-            ТЕКСТ ДЛЯ АНАЛИЗА:
-            {raw_str}
-            
-            ИЗВЛЕКАЙТЕ ТОЛЬКО КРИТЕРИИ ИЗ УКАЗАННОГО ВЫШЕ СПИСКА.
-            """
-
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt),
-            ]
-
+            messages = self.build_specific_criteria_messages(
+                raw_str, bank_name, product_name, criteria_list
+            )
             response = self.llm.invoke(messages)
-            response_text = response.content.strip()
-
-
-            json_match = re.search(r"```json\s*({.*?})\s*```", response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-           
-                json_str = re.sub(r"^[^{]*", "", response_text, flags=re.DOTALL)
-                json_str = re.sub(r"[^}]*$", "", json_str, flags=re.DOTALL)
-
-            try:
-                parsed_data = json.loads(json_str)
-                validation_result = CriteriaExtractionResult(**parsed_data)
-                logger.info(
-                    f"Successfully extracted {len(validation_result.criteria)} specific criteria"
-                )
-                return validation_result.criteria
-            except (json.JSONDecodeError, ValidationError) as e:
-                logger.error(
-                    f"Error parsing LLM response for specific criteria: {str(e)}"
-                )
-                logger.error(f"Raw response: {response_text}")
-                return []
+            return self.parse_criteria_response(
+                response.content.strip(), kind="specific criteria"
+            )
 
         except Exception as e:
             logger.error(f"Error extracting specific criteria: {str(e)}")
             return []
 
-    def process_single_record(
-        self, record: Dict[str, Any]
+    async def aextract_specific_criteria_from_text(
+        self, raw_str, bank_name: str, product_name: str, criteria_list: List[str]
+    ) -> List[ExtractedCriterion]:
+        """
+        Асинхронная версия extract_specific_criteria_from_text
+        """
+        if not criteria_list:
+            return await self.aextract_criteria_from_text(
+                raw_str, bank_name, product_name
+            )
+
+        messages = self.build_specific_criteria_messages(
+            raw_str, bank_name, product_name, criteria_list
+        )
+        response = await self.llm.ainvoke(messages)
+        return self.parse_criteria_response(
+            response.content.strip(), kind="specific criteria"
+        )
+
+    def embed_criteria(
+        self, record: Dict[str, Any], criteria: List[ExtractedCriterion]
     ) -> List[CriterionWithEmbedding]:
-        """Обрабатывает одну запись из bank_buffer"""
+        """Получает эмбеддинги критериев и связывает их с исходной записью"""
+        return self.embed_records_criteria([(record, criteria)])
+
+    def embed_records_criteria(
+        self, extracted: List[Tuple[Dict[str, Any], List[ExtractedCriterion]]]
+    ) -> List[CriterionWithEmbedding]:
+        """
+        Получает эмбеддинги для критериев сразу нескольких записей
+        одним набором пакетных запросов к сервису эмбеддингов
+        """
+        texts = self._criteria_texts(extracted)
+        if not texts:
+            return []
+
         try:
-            bank_name, product_name = self.get_bank_and_product_names(
-                record["bank_id"], record["product_id"]
+            embeddings = get_embeddings(texts)
+        except Exception as e:
+            logger.error(
+                f"Error getting embeddings for {len(texts)} criteria: {str(e)}"
             )
+            return []
 
-         
-            criteria = self.extract_criteria_from_text(
-                record["raw_data"], bank_name, product_name
+        return self._attach_embeddings(extracted, embeddings)
+
+    async def aembed_records_criteria(
+        self, extracted: List[Tuple[Dict[str, Any], List[ExtractedCriterion]]]
+    ) -> List[CriterionWithEmbedding]:
+        """Асинхронная версия embed_records_criteria"""
+        texts = self._criteria_texts(extracted)
+        if not texts:
+            return []
+
+        try:
+            embeddings = await aget_embeddings(texts)
+        except Exception as e:
+            logger.error(
+                f"Error getting embeddings for {len(texts)} criteria: {str(e)}"
             )
+            return []
+
+        return self._attach_embeddings(extracted, embeddings)
 
-            processed_criteria = []
+    def _criteria_texts(
+        self, extracted: List[Tuple[Dict[str, Any], List[ExtractedCriterion]]]
+    ) -> List[str]:
+        return [
+            criterion.criterion for _, criteria in extracted for criterion in criteria
+        ]
 
+    def _attach_embeddings(
+        self,
+        extracted: List[Tuple[Dict[str, Any], List[ExtractedCriterion]]],
+        embeddings: List[List[float]],
+    ) -> List[CriterionWithEmbedding]:
+        """Связывает критерии с эмбеддингами и исходными записями"""
+        embeddings = iter(embeddings)
+        processed_criteria = []
+
+        for record, criteria in extracted:
             for criterion in criteria:
+                embedding = next(embeddings)
                 try:
-       
-                    embedding = get_embedding(criterion.criterion)
-
-         
                     processed_criteria.append(
                         CriterionWithEmbedding(
                             bank_id=record["bank_id"],
@@ -326,13 +668,30 @@ class DataProcessor:
                             ts=record["ts"],
                         )
                     )
-
                 except Exception as e:
                     logger.error(
                         f"Error processing criterion '{criterion.criterion}': {str(e)}"
                     )
                     continue
 
+        return processed_criteria
+
+    def process_single_record(
+        self, record: Dict[str, Any]
+    ) -> List[CriterionWithEmbedding]:
+        """Обрабатывает одну запись из bank_buffer"""
+        try:
+            bank_name, product_name = self.get_bank_and_product_names(
+                record["bank_id"], record["product_id"]
+            )
+
+         
+            criteria = self.extract_criteria_from_text(
+                record["raw_data"], bank_name, product_name
+            )
+
+            processed_criteria = self.embed_criteria(record, criteria)
+
             logger.info(
                 f"Processed {len(processed_criteria)} criteria for record ID {record['id']}"
             )
@@ -362,69 +721,371 @@ class DataProcessor:
                     record["raw_data"], bank_name, product_name
                 )
 
-            processed_criteria = []
+            processed_criteria = self.embed_criteria(record, criteria)
 
-            for criterion in criteria:
-                try:
-                    embedding = get_embedding(criterion.criterion)
-                    processed_criteria.append(
-                        CriterionWithEmbedding(
-                            bank_id=record["bank_id"],
-                            product_id=record["product_id"],
-                            criterion=criterion.criterion,
-                            criterion_embed=embedding,
-                            source=record["source"],
-                            data=criterion.value,
-                            ts=record["ts"],
-                        )
+            return processed_criteria
+
+        except Exception as e:
+            logger.error(f"Ошибка обработки записи {record['id']}: {str(e)}")
+            return []
+
+    async def _aextract_text(
+        self,
+        text: str,
+        bank_name: str,
+        product_name: str,
+        criteria_list: Optional[List[str]] = None,
+    ) -> List[ExtractedCriterion]:
+        if criteria_list:
+            return await self.aextract_specific_criteria_from_text(
+                text, bank_name, product_name, criteria_list
+            )
+        return await self.aextract_criteria_from_text(text, bank_name, product_name)
+
+    async def aextract_record_criteria(
+        self,
+        record: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+        criteria_list: Optional[List[str]] = None,
+    ) -> Optional[List[ExtractedCriterion]]:
+        """
+        Асинхронно извлекает критерии из одной записи; число одновременных
+        запросов к LLM ограничивается семафором. Возвращает None, если
+        извлечение не удалось и запись нужно будет обработать повторно
+
+        Длинный текст режется на фрагменты по структурным границам, фрагменты
+        обрабатываются параллельно, а их критерии объединяются без дублей.
+        Ошибка LLM или неразобранный ответ хотя бы в одном фрагменте делают
+        неудачной всю запись: processed_at не ставится, и на следующем прогоне
+        она извлекается заново.
+        """
+        try:
+            bank_name, product_name = self.get_bank_and_product_names(
+                record["bank_id"], record["product_id"]
+            )
+
+            chunks = split_text_into_chunks(
+                record["raw_data"] or "", self.chunk_chars
+            )
+            if not chunks:
+                return []
+
+            async def extract_chunk(chunk: str) -> List[ExtractedCriterion]:
+                async with semaphore:
+                    return await self._aextract_text(
+                        chunk, bank_name, product_name, criteria_list
                     )
-                except Exception as e:
+
+            results = await asyncio.gather(
+                *(extract_chunk(chunk) for chunk in chunks), return_exceptions=True
+            )
+
+            chunk_criteria = []
+            for i, result in enumerate(results, 1):
+                if isinstance(result, BaseException):
                     logger.error(
-                        f"Ошибка обработки критерия '{criterion.criterion}': {str(e)}"
+                        f"Error extracting chunk {i}/{len(chunks)} of record {record['id']}: {str(result)}"
                     )
-                    continue
+                else:
+                    chunk_criteria.append(result)
 
-            return processed_criteria
+            if len(chunk_criteria) < len(chunks):
+                return None
+
+            criteria = merge_criteria(chunk_criteria)
+            logger.info(
+                f"Extracted {len(criteria)} criteria from {len(chunks)} chunk(s) for record ID {record['id']}"
+            )
+            return criteria
 
         except Exception as e:
-            logger.error(f"Ошибка обработки записи {record['id']}: {str(e)}")
-            return []
+            logger.error(f"Error processing record {record['id']}: {str(e)}")
+            return None
 
-    def process_all_today_data(self) -> bool:
-        """Основная функция обработки всех данных за сегодня"""
+    def plan_packs(
+        self, records: List[Dict[str, Any]]
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Группирует короткие записи одной пары банк-продукт в пакеты
+        в пределах бюджета pack_tokens
+
+        Returns:
+            Tuple: (пакеты из двух и более записей, записи для обычной обработки)
+        """
+        if self.pack_tokens <= 0:
+            return [], list(records)
+
+        max_record_tokens = self.pack_tokens // 2
+        packs: List[List[Dict[str, Any]]] = []
+        singles: List[Dict[str, Any]] = []
+        by_pair: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+
+        for record in records:
+            tokens = estimate_tokens(record["raw_data"] or "")
+            if tokens > max_record_tokens:
+                singles.append(record)
+            else:
+                by_pair.setdefault(
+                    (record["bank_id"], record["product_id"]), []
+                ).append(record)
+
+        for pair_records in by_pair.values():
+            current: List[Dict[str, Any]] = []
+            current_tokens = 0
+            for record in pair_records:
+                tokens = estimate_tokens(record["raw_data"] or "")
+                if current and current_tokens + tokens > self.pack_tokens:
+                    packs.append(current)
+                    current, current_tokens = [], 0
+                current.append(record)
+                current_tokens += tokens
+            if current:
+                packs.append(current)
+
+        singles.extend(pack[0] for pack in packs if len(pack) == 1)
+        return [pack for pack in packs if len(pack) > 1], singles
+
+    async def aextract_packed_criteria(
+        self,
+        records: List[Dict[str, Any]],
+        semaphore: asyncio.Semaphore,
+    ) -> Dict[int, Optional[List[ExtractedCriterion]]]:
+        """
+        Извлекает критерии сразу из нескольких коротких записей одним запросом.
+        Если ответ не удалось разобрать, записи обрабатываются по одной;
+        так же обрабатываются записи, пропущенные в ответе
+        """
+        record_ids = [record["id"] for record in records]
+        by_id: Optional[Dict[int, Optional[List[ExtractedCriterion]]]] = None
         try:
-       
-            raw_data_records = self.get_today_raw_data()
+            bank_name, product_name = self.get_bank_and_product_names(
+                records[0]["bank_id"], records[0]["product_id"]
+            )
+            messages = self.build_packed_criteria_messages(
+                records, bank_name, product_name
+            )
+            async with semaphore:
+                response = await self.llm.ainvoke(messages)
+
+            by_id = self.parse_packed_criteria_response(
+                response.content.strip(), record_ids
+            )
+        except Exception as e:
+            logger.error(f"Error extracting packed records {record_ids}: {str(e)}")
+
+        if by_id is None:
+            by_id = {record_id: None for record_id in record_ids}
+        else:
+            logger.info(
+                f"Extracted criteria for packed records "
+                f"{[record_id for record_id in record_ids if by_id[record_id] is not None]}"
+            )
 
-            if not raw_data_records:
-                logger.info("No raw data found for today. Nothing to process.")
-                return True
+        retry = [record for record in records if by_id[record["id"]] is None]
+        if retry:
+            logger.info(
+                f"Falling back to per-record extraction for "
+                f"{[record['id'] for record in retry]}"
+            )
+            results = await asyncio.gather(
+                *(self.aextract_record_criteria(record, semaphore) for record in retry)
+            )
+            for record, criteria in zip(retry, results):
+                by_id[record["id"]] = criteria
+        return by_id
 
-            all_processed_criteria = []
+    async def aprocess_records(
+        self,
+        records: List[Dict[str, Any]],
+        criteria_list: Optional[List[str]] = None,
+    ) -> Tuple[List[CriterionWithEmbedding], List[int]]:
+        """
+        Параллельно извлекает критерии из списка записей bank_buffer,
+        держа в полёте не более max_concurrency запросов к LLM, после чего
+        получает эмбеддинги для всего прогона пакетными запросами.
+        Короткие записи одной пары банк-продукт упаковываются в общий запрос
 
-     
-            for i, record in enumerate(raw_data_records, 1):
-                logger.info(
-                    f"Processing record {i}/{len(raw_data_records)} (ID: {record['id']})"
+        Returns:
+            Tuple: (критерии с эмбеддингами, id успешно обработанных записей)
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Упаковка применяется только к полному извлечению критериев
+        if criteria_list:
+            packs, singles = [], list(records)
+        else:
+            packs, singles = self.plan_packs(records)
+
+        single_results, packed_results = await asyncio.gather(
+            asyncio.gather(
+                *(
+                    self.aextract_record_criteria(record, semaphore, criteria_list)
+                    for record in singles
                 )
-                processed_criteria = self.process_single_record(record)
-                all_processed_criteria.extend(processed_criteria)
+            ),
+            asyncio.gather(
+                *(self.aextract_packed_criteria(pack, semaphore) for pack in packs)
+            ),
+        )
 
-            if not all_processed_criteria:
-                logger.warning("No criteria were extracted from any records")
-                return False
+        results: Dict[int, Optional[List[ExtractedCriterion]]] = {
+            record["id"]: criteria for record, criteria in zip(singles, single_results)
+        }
+        for by_id in packed_results:
+            results.update(by_id)
 
-         
-            success = save_processed_data(all_processed_criteria)
+        if packs:
+            logger.info(
+                f"Packed {sum(len(pack) for pack in packs)} short records into {len(packs)} LLM requests"
+            )
+
+        extracted = [
+            (record, results[record["id"]])
+            for record in records
+            if results.get(record["id"]) is not None
+        ]
+
+        texts = self._criteria_texts(extracted)
+        if not texts:
+            return [], [record["id"] for record, _ in extracted]
+
+        processed_criteria = await self.aembed_records_criteria(extracted)
+        if not processed_criteria:
+            # Эмбеддинги получить не удалось - записи остаются необработанными
+            return [], []
+        return processed_criteria, [record["id"] for record, _ in extracted]
+
+    @staticmethod
+    async def _in_embedder_session(coro: Awaitable[T]) -> T:
+        """Выполняет прогон, закрывая async-клиент эмбеддингов до конца цикла"""
+        async with async_embedder_session():
+            return await coro
+
+    def process_records(
+        self,
+        records: List[Dict[str, Any]],
+        criteria_list: Optional[List[str]] = None,
+    ) -> Tuple[List[CriterionWithEmbedding], List[int]]:
+        """Синхронная обёртка над aprocess_records"""
+        logger.info(
+            f"Processing {len(records)} records with up to {self.max_concurrency} concurrent LLM requests"
+        )
+        return asyncio.run(
+            self._in_embedder_session(self.aprocess_records(records, criteria_list))
+        )
+
+    async def aprocess_filtered_records(
+        self,
+        bank_id: Optional[int] = None,
+        product_id: Optional[int] = None,
+        criteria_list: Optional[List[str]] = None,
+        force_today: bool = True,
+        reprocess: bool = False,
+    ) -> Tuple[int, int]:
+        """
+        Извлекает критерии из ещё не обработанных записей bank_buffer,
+        сохраняет их в bank_analysis и помечает записи обработанными
+
+        Записи читаются потоком порциями по read_batch_size: обработка первой
+        порции начинается сразу, а в памяти одновременно находится не больше
+        одной порции сырых текстов.
+
+        Args:
+            bank_id: ID банка для фильтрации
+            product_id: ID продукта для фильтрации
+            criteria_list: Список конкретных критериев для извлечения
+            force_today: Обрабатывать только сегодняшние данные
+            reprocess: Обработать записи повторно, даже если они уже обработаны
+                (для backfill)
+
+        Returns:
+            Tuple[int, int]: (число обработанных записей, число сохранённых критериев)
+        """
+        batches = self.iter_raw_record_batches(
+            bank_id=bank_id,
+            product_id=product_id,
+            force_today=force_today,
+            reprocess=reprocess,
+        )
+
+        total_records = 0
+        total_processed = 0
+        total_criteria = 0
+
+        while True:
+            # Чтение с сервера блокирующее, поэтому уводим его из цикла событий
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+
+            total_records += len(batch)
+            logger.info(
+                f"Processing batch of {len(batch)} records ({total_records} read so far)"
+            )
+
+            processed_criteria, processed_ids = await self.aprocess_records(
+                batch, criteria_list
+            )
+
+            if processed_criteria and not save_processed_data(processed_criteria):
+                raise RuntimeError("Failed to save processed data")
 
-            if success:
-                logger.info(
-                    f"Successfully processed {len(all_processed_criteria)} criteria from {len(raw_data_records)} records"
+            # Выборочное извлечение по списку критериев не заменяет полного,
+            # поэтому такие прогоны записи обработанными не помечают
+            if not criteria_list:
+                self.mark_records_processed(processed_ids)
+
+            total_processed += len(processed_ids)
+            total_criteria += len(processed_criteria)
+
+        if not total_records:
+            logger.info(
+                f"No records to process with filters: bank_id={bank_id}, product_id={product_id}, today_only={force_today}, reprocess={reprocess}"
+            )
+            return 0, 0
+
+        failed = total_records - total_processed
+        if failed:
+            logger.warning(f"{failed} records failed and will be retried on next run")
+
+        return total_processed, total_criteria
+
+    def process_filtered_records(
+        self,
+        bank_id: Optional[int] = None,
+        product_id: Optional[int] = None,
+        criteria_list: Optional[List[str]] = None,
+        force_today: bool = True,
+        reprocess: bool = False,
+    ) -> Tuple[int, int]:
+        """Синхронная обёртка над aprocess_filtered_records"""
+        return asyncio.run(
+            self._in_embedder_session(
+                self.aprocess_filtered_records(
+                    bank_id=bank_id,
+                    product_id=product_id,
+                    criteria_list=criteria_list,
+                    force_today=force_today,
+                    reprocess=reprocess,
                 )
-            else:
-                logger.error("Failed to save processed data")
+            )
+        )
+
+    def process_all_today_data(self, reprocess: bool = False) -> bool:
+        """Основная функция обработки всех данных за сегодня"""
+        try:
+            processed_records, total_criteria = self.process_filtered_records(
+                force_today=True, reprocess=reprocess
+            )
+
+            if processed_records and not total_criteria:
+                logger.warning("No criteria were extracted from any records")
+                return False
 
-            return success
+            logger.info(
+                f"Successfully processed {total_criteria} criteria from {processed_records} records"
+            )
+            return True
 
         except Exception as e:
             logger.error(f"Critical error in data processing: {str(e)}")
@@ -436,89 +1097,28 @@ class DataProcessor:
         product_id: Optional[int] = None,
         criteria_list: Optional[List[str]] = None,
         force_today: bool = True,
+        reprocess: bool = False,
     ) -> bool:
         """
         Обрабатывает данные с фильтрацией по банку, продукту и списку критериев
         """
         try:
-            conn = get_connection()
-            all_processed_criteria = []
-
-            with conn.cursor() as cursor:
-            
-                query = """
-                    SELECT id, bank_id, product_id, raw_data, source, ts
-                    FROM bank_buffer
-                    WHERE 1=1
-                """
-                params = []
-
-                if force_today:
-                    today_date = datetime.now(timezone.utc).date()
-                    today_start = datetime.combine(
-                        today_date, datetime.min.time(), tzinfo=timezone.utc
-                    )
-                    today_end = datetime.combine(
-                        today_date, datetime.max.time(), tzinfo=timezone.utc
-                    )
-                    query += " AND ts >= %s AND ts <= %s"
-                    params.extend([today_start, today_end])
-
-                if bank_id is not None:
-                    query += " AND bank_id = %s"
-                    params.append(bank_id)
-
-                if product_id is not None:
-                    query += " AND product_id = %s"
-                    params.append(product_id)
-
-                query += " ORDER BY bank_id, product_id, id"
-
-                cursor.execute(query, params)
-                records = cursor.fetchall()
-
-                if not records:
-                    logger.info(
-                        f"No records found with filters: bank_id={bank_id}, product_id={product_id}, today_only={force_today}"
-                    )
-                    return True
-
-                logger.info(f"Found {len(records)} records for processing with filters")
-
-           
-                for i, record in enumerate(records, 1):
-                    record_data = {
-                        "id": record[0],
-                        "bank_id": record[1],
-                        "product_id": record[2],
-                        "raw_data": record[3],
-                        "source": record[4],
-                        "ts": record[5],
-                    }
-
-                    logger.info(
-                        f"Processing filtered record {i}/{len(records)} (ID: {record[0]})"
-                    )
-                    processed_criteria = self.process_single_record_with_criteria(
-                        record_data, criteria_list
-                    )
-                    all_processed_criteria.extend(processed_criteria)
+            processed_records, total_criteria = self.process_filtered_records(
+                bank_id=bank_id,
+                product_id=product_id,
+                criteria_list=criteria_list,
+                force_today=force_today,
+                reprocess=reprocess,
+            )
 
-            if not all_processed_criteria:
+            if processed_records and not total_criteria:
                 logger.warning("No criteria were extracted from any filtered records")
                 return False
 
-    
-            success = save_processed_data(all_processed_criteria)
-
-            if success:
-                logger.info(
-                    f"Successfully processed {len(all_processed_criteria)} criteria from filtered records"
-                )
-            else:
-                logger.error("Failed to save processed data from filtered records")
-
-            return success
+            logger.info(
+                f"Successfully processed {total_criteria} criteria from {processed_records} filtered records"
+            )
+            return True
 
         except Exception as e:
             logger.error(f"Error in filtered data processing: {str(e)}")
@@ -535,6 +1135,8 @@ class DataProcessor:
 
         success = self.process_all_today_data()
 
+        logger.info(f"Embedder stats: {get_embedder().stats()}")
+
         end_time = datetime.now()
         duration = end_time - start_time
         logger.info(
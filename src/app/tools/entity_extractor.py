@@ -0,0 +1,353 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.app.infra.db.pool import connection
+from src.app.infra.db.reference_cache import ReferenceData
+from src.app.tools.entity_matcher import BANK_ALIASES, PRODUCT_ALIASES
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+BANK, PRODUCT, CRITERION = "bank", "product", "criterion"
+
+# Частые формулировки критериев в запросах; дополняются названиями
+# канонических критериев из criterion_canon
+CRITERIA_TERMS = [
+    "ставка",
+    "процентная ставка",
+    "доходность",
+    "кэшбэк",
+    "кешбэк",
+    "комиссия",
+    "стоимость обслуживания",
+    "обслуживание",
+    "льготный период",
+    "грейс период",
+    "кредитный лимит",
+    "лимит",
+    "срок",
+    "минимальная сумма",
+    "максимальная сумма",
+    "сумма кредита",
+    "первоначальный взнос",
+    "пополнение",
+    "частичное снятие",
+    "капитализация",
+    "досрочное погашение",
+    "полная стоимость кредита",
+    "пск",
+    "страховка",
+    "бонусы",
+    "условия",
+]
+
+# Слова, которые не несут сущностей и не снижают уверенность
+STOP_WORDS = {
+    "а", "в", "во", "и", "или", "к", "на", "о", "об", "от", "по", "при", "с",
+    "со", "у", "за", "для", "между", "из", "то", "же", "ли", "не", "но", "как",
+    "какая", "какой", "какие", "каких", "какую", "что", "где", "чем", "кто",
+    "сравни", "сравнить", "сравнение", "сравните", "покажи", "показать",
+    "найди", "найти", "подскажи", "расскажи", "дай", "нужно", "хочу",
+    "мне", "нам", "их", "его", "это", "эти", "этих", "все", "всех",
+    "лучше", "лучший", "выгоднее", "выгодный", "больше", "меньше",
+    "сейчас", "сегодня", "текущая", "текущие", "актуальная", "актуальные",
+    "банк", "банка", "банке", "банков", "банки", "банкам", "банками",
+    "пожалуйста", "таблица", "таблицу", "данные",
+}
+
+# Окончания, которые срезаются при сравнении ("вкладам" / "вклады" -> "вклад");
+# длинные проверяются первыми
+ENDINGS = sorted(
+    """
+    ами ями ого его ому ему ыми ими ых их ым им ой ей ый ий ая яя ое ее ые ие
+    ую юю ам ям ах ях ом ем ов ев а я о е ы и у ю ь й
+    """.split(),
+    key=len,
+    reverse=True,
+)
+MIN_STEM = 3
+
+
+def stem(word: str) -> str:
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[: -len(ending)]
+    return word
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит запрос и словарные фразы к одному виду: нижний регистр, е вместо
+    ё, без кавычек и повторных пробелов, слова без окончаний
+    """
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[«»\"']", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return re.sub(r"\w+", lambda match: stem(match.group()), text)
+
+
+STOP_STEMS = {stem(word) for word in STOP_WORDS}
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: поиск всех словарных фраз за один проход по тексту"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.patterns: List[Tuple[str, str, str]] = []
+
+    def add(self, pattern: str, kind: str, value: str):
+        """pattern - нормализованная фраза, value - название для UserRequest"""
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = next_node
+        self._out[node].append(len(self.patterns))
+        self.patterns.append((pattern, kind, value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """(начало, конец, номер фразы) для всех вхождений"""
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for index in self._out[node]:
+                end = position + 1
+                yield end - len(self.patterns[index][0]), end, index
+
+
+@dataclass
+class Extraction:
+    bank_names: List[str] = field(default_factory=list)
+    products: List[str] = field(default_factory=list)
+    criteria: List[str] = field(default_factory=list)
+    coverage: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.bank_names and self.products and self.criteria)
+
+
+class EntityExtractor:
+    """
+    Извлечение банков, продуктов и критериев из запроса по словарям, без LLM.
+
+    Словари (справочники banks/products с алиасами, CRITERIA_TERMS и
+    названия из criterion_canon) собираются в один автомат Ахо-Корасик;
+    автомат пересобирается при обновлении reference_cache. Из пересекающихся
+    совпадений берётся самое левое и длинное. Совпадение должно начинаться
+    на границе слова, а после него допускается короткое окончание.
+
+    Результат считается надёжным, если найдены банк, продукт и критерий, а
+    доля значимых слов запроса, покрытых словарём, не ниже
+    ENTITY_EXTRACTOR_MIN_COVERAGE. Иначе запрос уходит в LLM.
+    """
+
+    def __init__(self, min_coverage: Optional[float] = None):
+        self.enabled = getenv("ENTITY_EXTRACTOR_ENABLED", "1") == "1"
+        self.min_coverage = (
+            min_coverage
+            if min_coverage is not None
+            else float(getenv("ENTITY_EXTRACTOR_MIN_COVERAGE", "0.6"))
+        )
+        self._automaton: Optional[AhoCorasick] = None
+        # Канонический критерий -> продукт, к которому он относится
+        self._criterion_products: Dict[str, str] = {}
+        self._built_for: Optional[float] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self._extract_ms = 0.0
+        self._llm_ms = 0.0
+        self._llm_calls = 0
+
+    def _canonical_criteria(self) -> List[Tuple[str, int]]:
+        try:
+            with connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT name, product_id FROM criterion_canon")
+                return cursor.fetchall()
+        except Exception as e:
+            logger.warning(f"Canonical criteria unavailable for extractor: {e}")
+            return []
+
+    def _build(self, reference: ReferenceData) -> AhoCorasick:
+        automaton = AhoCorasick()
+        self._criterion_products = {}
+        seen = set()
+
+        def add(phrase: str, kind: str, value: str):
+            pattern = normalize_text(phrase)
+            if pattern and (pattern, kind) not in seen:
+                seen.add((pattern, kind))
+                automaton.add(pattern, kind, value)
+
+        bank_names = set(reference.banks.values())
+        product_names = set(reference.products.values())
+        for name in bank_names:
+            add(name, BANK, name)
+        for alias, name in BANK_ALIASES.items():
+            if name in bank_names:
+                add(alias, BANK, name)
+        for name in product_names:
+            add(name, PRODUCT, name)
+        for alias, name in PRODUCT_ALIASES.items():
+            if name in product_names:
+                add(alias, PRODUCT, name)
+        for term in CRITERIA_TERMS:
+            add(term, CRITERION, term)
+        for name, product_id in self._canonical_criteria():
+            add(name, CRITERION, name)
+            if product_id in reference.products:
+                self._criterion_products[name] = reference.products[product_id]
+
+        automaton.build()
+        logger.info(f"Entity extractor built with {len(automaton.patterns)} phrases")
+        return automaton
+
+    def _get(self, reference: ReferenceData) -> AhoCorasick:
+        with self._lock:
+            if self._automaton is None or self._built_for != reference.loaded_at:
+                self._automaton = self._build(reference)
+                self._built_for = reference.loaded_at
+            return self._automaton
+
+    @staticmethod
+    def _on_boundaries(text: str, start: int, end: int) -> bool:
+        """Совпадение занимает целые слова, а не часть слова"""
+        if start > 0 and text[start - 1].isalnum():
+            return False
+        return end == len(text) or not text[end].isalnum()
+
+    def extract(self, user_text: str, reference: ReferenceData) -> Extraction:
+        automaton = self._get(reference)
+        text = normalize_text(user_text)
+
+        matches = [
+            match
+            for match in automaton.iter_matches(text)
+            if self._on_boundaries(text, match[0], match[1])
+        ]
+        matches.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+
+        extraction = Extraction()
+        covered: List[Tuple[int, int]] = []
+        last_end = -1
+        for start, end, index in matches:
+            if start < last_end:
+                continue
+            last_end = end
+            covered.append((start, end))
+            _, kind, value = automaton.patterns[index]
+            target = {
+                BANK: extraction.bank_names,
+                PRODUCT: extraction.products,
+                CRITERION: extraction.criteria,
+            }[kind]
+            if value not in target:
+                target.append(value)
+
+        # "ставка по накопительному счету" уже называет продукт
+        if not extraction.products:
+            for criterion in extraction.criteria:
+                product_name = self._criterion_products.get(criterion)
+                if product_name and product_name not in extraction.products:
+                    extraction.products.append(product_name)
+
+        words = [
+            word
+            for word in re.finditer(r"\w+", text)
+            if word.group() not in STOP_STEMS and not word.group().isdigit()
+        ]
+        if words:
+            inside = sum(
+                any(start <= word.start() and word.end() <= end for start, end in covered)
+                for word in words
+            )
+            extraction.coverage = inside / len(words)
+        return extraction
+
+    def try_extract(self, user_text: str, reference: ReferenceData) -> Optional[Extraction]:
+        """Результат словарного разбора, если он надёжен, иначе None"""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        try:
+            extraction = self.extract(user_text, reference)
+        except Exception as e:
+            logger.error(f"Entity extractor failed: {e}")
+            return None
+        elapsed = (time.perf_counter() - start) * 1000
+        self._extract_ms += elapsed
+
+        if extraction.complete and extraction.coverage >= self.min_coverage:
+            self.hits += 1
+            logger.info(
+                f"Entity extractor hit in {elapsed:.2f} ms "
+                f"(coverage {extraction.coverage:.2f}, saved ~"
+                f"{max(self.average_llm_ms - elapsed, 0):.0f} ms); {self.stats()}"
+            )
+            return extraction
+
+        self.misses += 1
+        logger.info(
+            f"Entity extractor miss (coverage {extraction.coverage:.2f}, "
+            f"banks {len(extraction.bank_names)}, products "
+            f"{len(extraction.products)}, criteria {len(extraction.criteria)})"
+        )
+        return None
+
+    def record_llm(self, elapsed_ms: float):
+        """Время LLM-разбора: по нему оценивается сэкономленное время"""
+        self._llm_ms += elapsed_ms
+        self._llm_calls += 1
+
+    @property
+    def average_llm_ms(self) -> float:
+        return self._llm_ms / self._llm_calls if self._llm_calls else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "saved_ms": round(
+                max(self.hits * self.average_llm_ms - self._extract_ms, 0.0)
+            ),
+        }
+
+
+entity_extractor = EntityExtractor()
@@ -0,0 +1,194 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+# Разговорные и сокращённые названия -> название в справочнике banks
+BANK_ALIASES: Dict[str, str] = {
+    "сбер": "Сбербанк",
+    "сбербанк россии": "Сбербанк",
+    "пао сбербанк": "Сбербанк",
+    "втб банк": "ВТБ",
+    "газпром": "Газпромбанк",
+    "гпб": "Газпромбанк",
+    "альфа": "Альфа-Банк",
+    "альфа банк": "Альфа-Банк",
+    "альфабанк": "Альфа-Банк",
+    "рсхб": "Россельхозбанк",
+    "мкб": "Московский кредитный банк (МКБ)",
+    "тинькофф": "Т-Банк",
+    "тинькофф банк": "Т-Банк",
+    "тинька": "Т-Банк",
+    "т банк": "Т-Банк",
+    "тбанк": "Т-Банк",
+    "совком": "Совкомбанк",
+    "дом.рф": "Банк ДОМ.РФ",
+    "дом рф": "Банк ДОМ.РФ",
+    "райффайзен": "Райффайзен Банк",
+    "райф": "Райффайзен Банк",
+    "бспб": "Банк «Санкт-Петербург»",
+    "банк санкт-петербург": "Банк «Санкт-Петербург»",
+    "мтс": "МТС Банк",
+    "юникредит": "ЮниКредит Банк",
+    "отп": "ОТП Банк",
+    "озон банк": "Ozon Банк",
+    "озон": "Ozon Банк",
+    "почта": "Почта Банк",
+    "атб": "Азиатско-Тихоокеанский банк (АТБ)",
+    "убрир": "Уральский банк реконструкции и развития (УБРиР)",
+    "зенит": "Банк ЗЕНИТ",
+    "яндекс": "Яндекс Банк",
+    "синара": "Банк Синара",
+    "локо": "Локо-Банк",
+}
+
+# Формы, в которых продукты обычно называют в запросах -> справочник products
+PRODUCT_ALIASES: Dict[str, str] = {
+    "вклад": "вклады",
+    "депозит": "вклады",
+    "депозиты": "вклады",
+    "накопительный счет": "накопительные счета",
+    "накопительный счёт": "накопительные счета",
+    "накопительные счёта": "накопительные счета",
+    "потребительский кредит": "потребительские кредиты",
+    "потреб": "потребительские кредиты",
+    "автокредит": "автокредиты",
+    "микрозайм": "микрозаймы",
+    "кредитная карта": "кредитные карты",
+    "кредитка": "кредитные карты",
+    "дебетовая карта": "дебетовые карты",
+    "дебетовка": "дебетовые карты",
+    "карта рассрочки": "карты рассрочки",
+    "ипотека": "ипотечные кредиты",
+    "ипотечный кредит": "ипотечные кредиты",
+    "облигация": "облигации",
+}
+
+
+def normalize_name(value: str) -> str:
+    """Ключ для поиска по алиасам: регистр, ё, кавычки и лишние пробелы"""
+    value = value.lower().replace("ё", "е")
+    value = re.sub(r"[«»\"']", "", value)
+    return re.sub(r"\s+", " ", value).strip()
+
+
+class EntityMatcher:
+    """
+    Сопоставление названий из запроса со справочником (название -> id).
+
+    Результат совпадает с полным перебором по fuzz.ratio на строках в нижнем
+    регистре (при равенстве побеждает кандидат, идущий раньше в справочнике),
+    но fuzz.ratio считается только для короткого списка кандидатов.
+
+    Индекс - матрица количеств символов (униграмм) всех кандидатов. Общих
+    символов у двух строк не меньше, чем совпадений в любом выравнивании,
+    поэтому 2 * |общие символы| / (len(a) + len(b)) - верхняя граница ratio.
+    Границы для всех кандидатов считаются одной векторной операцией, дальше
+    кандидаты проверяются по убыванию границы до первого, чья граница ниже
+    лучшего найденного результата или порога.
+
+    Алиасы проверяются до нечёткого поиска и дают точное совпадение, если
+    целевое название есть в справочнике.
+    """
+
+    def __init__(
+        self, candidates: Dict[str, int], aliases: Optional[Dict[str, str]] = None
+    ):
+        self.names = list(candidates.keys())
+        self.ids = list(candidates.values())
+        self.lowered = [name.lower() for name in self.names]
+
+        positions = {name: i for i, name in enumerate(self.names)}
+        self.aliases: Dict[str, int] = {}
+        for i, name in enumerate(self.names):
+            self.aliases.setdefault(normalize_name(name), i)
+        for alias, target in (aliases or {}).items():
+            if target in positions:
+                self.aliases.setdefault(normalize_name(alias), positions[target])
+
+        alphabet = sorted({char for name in self.lowered for char in name})
+        self.alphabet = {char: i for i, char in enumerate(alphabet)}
+        self.counts = np.zeros((len(self.names), len(alphabet)), dtype=np.int32)
+        for row, name in enumerate(self.lowered):
+            for char in name:
+                self.counts[row, self.alphabet[char]] += 1
+        self.lengths = np.array([len(name) for name in self.lowered], dtype=np.int32)
+
+    def _upper_bounds(self, value: str) -> np.ndarray:
+        profile = np.zeros(len(self.alphabet), dtype=np.int32)
+        for char in value:
+            position = self.alphabet.get(char)
+            if position is not None:
+                profile[position] += 1
+        common = np.minimum(self.counts, profile).sum(axis=1)
+        total = self.lengths + len(value)
+        bounds = np.where(total > 0, 200.0 * common / np.maximum(total, 1), 100.0)
+        # ratio округляется до целого: граница тоже должна быть не меньше
+        return np.ceil(bounds - 1e-9).astype(np.int32)
+
+    def best(self, value: str, threshold: int = 0) -> Optional[Tuple[int, int]]:
+        """
+        Лучший кандидат для строки: (индекс в справочнике, fuzz.ratio) или
+        None, если ни один кандидат не набирает threshold
+        """
+        if not self.names:
+            return None
+
+        alias = self.aliases.get(normalize_name(value))
+        if alias is not None:
+            return alias, 100
+
+        lowered = value.lower()
+        bounds = self._upper_bounds(lowered)
+        order = np.lexsort((np.arange(len(bounds)), -bounds))
+
+        best_index, best_score = None, -1
+        for index in order:
+            bound = bounds[index]
+            if bound < threshold or bound < best_score:
+                break
+            score = fuzz.ratio(lowered, self.lowered[index])
+            if score > best_score or (score == best_score and index < best_index):
+                best_index, best_score = int(index), score
+
+        if best_index is None or best_score < threshold:
+            return None
+        return best_index, best_score
+
+    def match_ids(self, values: List[str], threshold: int = 80) -> List[int]:
+        """Как normalize_value_to_ids: id найденных значений, пустые пропускаются"""
+        result_ids = []
+        for value in values:
+            if not value.strip():
+                continue
+            found = self.best(value, threshold)
+            if found is not None:
+                result_ids.append(self.ids[found[0]])
+        return result_ids
+
+    def normalize(self, values: List[str], threshold: int = 80) -> List[str]:
+        """Как normalize_value: название из справочника или исходная строка"""
+        new_values = []
+        for value in values:
+            found = self.best(value, threshold)
+            new_values.append(self.names[found[0]] if found is not None else value)
+        return new_values
+
+
+@lru_cache(maxsize=16)
+def _cached_matcher(
+    candidates: Tuple[Tuple[str, int], ...],
+    aliases: Optional[Tuple[Tuple[str, str], ...]],
+) -> EntityMatcher:
+    return EntityMatcher(dict(candidates), dict(aliases) if aliases else None)
+
+
+def get_matcher(
+    candidates: Dict[str, int], aliases: Optional[Dict[str, str]] = None
+) -> EntityMatcher:
+    """Матчер для справочника; строится один раз, пока справочник не меняется"""
+    return _cached_matcher(
+        tuple(candidates.items()), tuple(aliases.items()) if aliases else None
+    )
@@ -0,0 +1,314 @@
+import logging
+import re
+from abc import ABC, abstractmethod
+from os import getenv
+from typing import Callable, Dict, List, Optional, Type, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Элементы, которые никогда не содержат полезного текста страницы
+BOILERPLATE_TAGS = (
+    "script",
+    "style",
+    "nav",
+    "header",
+    "footer",
+    "iframe",
+    "noscript",
+    "aside",
+    "form",
+    "svg",
+    "template",
+    "button",
+)
+
+# Служебные блоки, размеченные классом или id (cookie-баннеры, крошки, попапы)
+BOILERPLATE_ATTR_PATTERN = re.compile(
+    r"(^|[\s_-])(cookies?|breadcrumbs?|popup|modal|share|social|subscribe)([\s_-]|$)",
+    re.I,
+)
+# Эти контейнеры не удаляются, даже если их класс похож на служебный
+PROTECTED_TAGS = ("html", "body", "main", "article")
+
+MAIN_CONTENT_PATTERN = "content|main|article"
+# Блок по id/class считается основным, только если в нём не меньше этой доли
+# текста страницы (иначе это подсказка вроде "tooltip-content")
+MAIN_CONTENT_MIN_SHARE = 0.5
+
+# Блочные элементы: их содержимое выводится с новой строки
+BLOCK_TAGS = (
+    "p",
+    "div",
+    "section",
+    "article",
+    "main",
+    "ul",
+    "ol",
+    "li",
+    "dl",
+    "dt",
+    "dd",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "blockquote",
+    "pre",
+    "table",
+    "tr",
+)
+
+
+def is_boilerplate(tag: str, attrs: Dict[str, str]) -> bool:
+    """Определяет служебный блок по атрибутам class, id, hidden и aria-hidden"""
+    if tag in PROTECTED_TAGS:
+        return False
+    if "hidden" in attrs or attrs.get("aria-hidden") == "true":
+        return True
+    marker = f"{attrs.get('id') or ''} {attrs.get('class') or ''}"
+    return bool(BOILERPLATE_ATTR_PATTERN.search(marker))
+
+
+def choose_main_content(
+    candidates: List[T], body: T, text_length: Callable[[T], int]
+) -> T:
+    """
+    Из блоков, подошедших по id/class, выбирает самый объёмный; если и в нём
+    меньше MAIN_CONTENT_MIN_SHARE текста страницы, возвращает body
+    """
+    best = max(candidates, key=text_length, default=None)
+    if best is None or text_length(best) < MAIN_CONTENT_MIN_SHARE * text_length(body):
+        return body
+    return best
+
+
+def table_to_lines(rows: List[List[str]]) -> List[str]:
+    """
+    Сворачивает таблицу в компактные строки "ключ: значение".
+
+    Таблица из двух колонок превращается в пары "параметр: значение"; если у
+    широкой таблицы есть строка заголовков, каждая строка данных выводится
+    как "заголовок: ячейка; ...".
+    """
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return []
+
+    width = max(len(row) for row in rows)
+    header: Optional[List[str]] = None
+    if width > 2 and len(rows) > 1 and len(rows[0]) == width:
+        header, rows = rows[0], rows[1:]
+
+    lines = []
+    for row in rows:
+        if header:
+            pairs = [
+                f"{name}: {value}" if name else value
+                for name, value in zip(header, row)
+                if value
+            ]
+            lines.append("; ".join(pairs))
+        elif len(row) == 1:
+            lines.append(row[0])
+        else:
+            lines.append(f"{row[0]}: {' | '.join(cell for cell in row[1:] if cell)}")
+    return lines
+
+
+def clean_text(text: str) -> str:
+    """Схлопывает пробелы внутри строк и убирает пустые и повторяющиеся строки"""
+    lines = []
+    for line in text.split("\n"):
+        line = " ".join(line.split())
+        if line and (not lines or lines[-1] != line):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class HtmlExtractor(ABC):
+    """Базовый класс движка извлечения текста из HTML"""
+
+    name = "base"
+
+    @abstractmethod
+    def extract(self, html: str) -> str:
+        """Очищенный текст страницы (пустая строка для пустого HTML)"""
+
+
+class LxmlExtractor(HtmlExtractor):
+    """Быстрый движок на lxml (libxml2)"""
+
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree, html as lxml_html
+
+        self._etree = etree
+        self._html = lxml_html
+        self._regex_ns = {"re": "http://exslt.org/regular-expressions"}
+
+    def _parse(self, html: str):
+        try:
+            return self._html.document_fromstring(html)
+        except ValueError:
+            # Строка с объявлением кодировки: lxml принимает её только байтами
+            return self._html.document_fromstring(html.encode("utf-8"))
+
+    def _main_content(self, root):
+        for path in ("//main", "//article"):
+            found = root.xpath(path)
+            if found:
+                return found[0]
+
+        body = root.find("body")
+        candidates = root.xpath(
+            f"//*[re:test(@id, '{MAIN_CONTENT_PATTERN}', 'i') "
+            f"or re:test(@class, '{MAIN_CONTENT_PATTERN}', 'i')]",
+            namespaces=self._regex_ns,
+        )
+        return choose_main_content(
+            candidates,
+            body if body is not None else root,
+            lambda element: len("".join(element.text_content().split())),
+        )
+
+    def extract(self, html: str) -> str:
+        if not html or not html.strip():
+            return ""
+        try:
+            root = self._parse(html)
+        except self._etree.ParserError:
+            return ""
+
+        self._etree.strip_elements(
+            root, self._etree.Comment, *BOILERPLATE_TAGS, with_tail=False
+        )
+        for element in list(root.iter(self._etree.Element)):
+            if element.getparent() is not None and is_boilerplate(
+                element.tag, element.attrib
+            ):
+                element.drop_tree()
+
+        content = self._main_content(root)
+
+        # Вложенные таблицы обрабатываются раньше внешних
+        for table in reversed(list(content.iter("table"))):
+            rows = [
+                [" ".join(cell.text_content().split()) for cell in row.xpath("./th|./td")]
+                for row in table.xpath(".//tr")
+            ]
+            replacement = self._etree.Element("div")
+            replacement.text = "\n".join(table_to_lines(rows))
+            replacement.tail = table.tail
+            if table is content:
+                content = replacement
+            else:
+                table.getparent().replace(table, replacement)
+
+        for element in content.iter("br"):
+            element.tail = "\n" + (element.tail or "")
+        for element in content.iter(*BLOCK_TAGS):
+            element.text = "\n" + (element.text or "")
+            element.tail = "\n" + (element.tail or "")
+
+        return clean_text(content.text_content())
+
+
+class SoupExtractor(HtmlExtractor):
+    """Запасной движок на BeautifulSoup (парсер lxml, если установлен)"""
+
+    name = "bs4"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+
+        self._soup = BeautifulSoup
+        try:
+            import lxml  # noqa: F401
+
+            self._parser = "lxml"
+        except ImportError:
+            self._parser = "html.parser"
+
+    def extract(self, html: str) -> str:
+        if not html or not html.strip():
+            return ""
+
+        soup = self._soup(html, self._parser)
+
+        for element in soup(BOILERPLATE_TAGS):
+            element.decompose()
+        for element in soup.find_all(
+            lambda tag: is_boilerplate(
+                tag.name,
+                {
+                    key: " ".join(value) if isinstance(value, list) else value
+                    for key, value in tag.attrs.items()
+                },
+            )
+        ):
+            if not element.decomposed:
+                element.decompose()
+
+        content = soup.find("main") or soup.find("article")
+        if content is None:
+            pattern = re.compile(MAIN_CONTENT_PATTERN, re.I)
+            content = choose_main_content(
+                soup.find_all(id=pattern) + soup.find_all(class_=pattern),
+                soup.body or soup,
+                lambda tag: len("".join(tag.get_text().split())),
+            )
+
+        for table in reversed(content.find_all("table")):
+            rows = [
+                [
+                    " ".join(cell.get_text(" ").split())
+                    for cell in row.find_all(["th", "td"], recursive=False)
+                ]
+                for row in table.find_all("tr")
+            ]
+            table.replace_with("\n" + "\n".join(table_to_lines(rows)) + "\n")
+
+        for element in content.find_all("br"):
+            element.replace_with("\n")
+        for element in content.find_all(BLOCK_TAGS):
+            element.insert_before("\n")
+            element.insert_after("\n")
+
+        return clean_text(content.get_text())
+
+
+EXTRACTORS: Dict[str, Type[HtmlExtractor]] = {
+    LxmlExtractor.name: LxmlExtractor,
+    SoupExtractor.name: SoupExtractor,
+}
+
+_extractors: Dict[str, HtmlExtractor] = {}
+
+
+def get_extractor(name: Optional[str] = None) -> HtmlExtractor:
+    """
+    Возвращает движок извлечения текста по имени (HTML_EXTRACTOR, по умолчанию
+    lxml). Если lxml не установлен, используется bs4.
+    """
+    name = name or getenv("HTML_EXTRACTOR", "lxml")
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor: {name}")
+
+    if name not in _extractors:
+        try:
+            _extractors[name] = EXTRACTORS[name]()
+        except ImportError as e:
+            if name == SoupExtractor.name:
+                raise
+            logger.warning(f"HTML extractor '{name}' is unavailable ({e}), using bs4")
+            return get_extractor(SoupExtractor.name)
+    return _extractors[name]
+
+
+def extract_text(html: str) -> str:
+    return get_extractor().extract(html)
@@ -1,11 +1,18 @@
-from pydantic import BaseModel, Field
-from fuzzywuzzy import fuzz
-import psycopg2
-from os import getenv
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict, Tuple, Any
+from src.app.infra.db.criterion_canon import criterion_canonicalizer
+from src.app.infra.db.criterion_search import criterion_search
+from src.app.infra.db.migrations import apply_search_settings
+from src.app.infra.db.pool import connection
+from src.app.infra.db.reference_cache import reference_cache
+from src.app.infra.db.vector_snapshot import vector_snapshot
 from src.app.infra.llm.client import llm
-from src.app.infra.embedder.get_embedding import get_embedding
+from src.app.infra.embedder.get_embedding import get_embeddings
+from src.app.tools.entity_extractor import entity_extractor
+from src.app.tools.entity_matcher import BANK_ALIASES, PRODUCT_ALIASES, get_matcher
 from itertools import product
+import re
+import time
 from langchain_core.tools import tool
 
 from langchain_core.runnables import RunnableConfig
@@ -14,10 +21,19 @@ from langchain_core.runnables import RunnableConfig
 class UserRequest(BaseModel):
     bank_names: List[str] = Field(description="Список банков")
     products: List[str] = Field(description="Услуги для сравнения")
-    criteria: Optional[str] = Field(
+    criteria: Optional[List[str]] = Field(
         description="Критерии сравнения услуг и банков", default=None
     )
 
+    @field_validator("criteria", mode="before")
+    def split_criteria(cls, v):
+        # Раньше критерии приходили одной строкой через запятую
+        if isinstance(v, str):
+            v = re.split(r"[,;\n]", v)
+        if v is None:
+            return v
+        return [criterion.strip() for criterion in v if criterion and criterion.strip()]
+
 
 class ResultRequest(BaseModel):
     table: List[str] = Field(description="Данные csv таблицы")
@@ -25,27 +41,17 @@ class ResultRequest(BaseModel):
 
 
 def get_data_list(query):
-    connection = psycopg2.connect(
-        host=getenv("DATABASE_HOST"),
-        port=getenv("DATABASE_PORT"),
-        database=getenv("DATABASE"),
-        user=getenv("DATABASE_LOGIN"),
-        password=getenv("DATABASE_PASSWORD"),
-    )
-
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            return {vals: keys for keys, vals in rows}
-    finally:
-        connection.close()
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        return {vals: keys for keys, vals in rows}
 
 
 def normalize_value_to_ids(
     values: List[str],
     candidates: Dict[str, int],
     threshold: int = 80,
+    aliases: Optional[Dict[str, str]] = None,
 ) -> List[int]:
     """
     Для каждого значения из `values` находит наиболее похожий ключ в `candidates`.
@@ -56,35 +62,17 @@ def normalize_value_to_ids(
         values: Список строк для нормализации (например, названия банков от пользователя).
         candidates: Словарь {название: id}.
         threshold: Порог схожести (0–100).
+        aliases: Словарь {сокращение: название из candidates}.
 
     Returns:
         Список соответствующих значений (например, id), для которых найдено совпадение.
     """
     if not candidates:
         return []
-
-    result_ids = []
-    candidate_names = list(candidates.keys())
-
-    for value in values:
-        if not value.strip():
-            continue
-        best_match = max(
-            candidate_names, key=lambda name: fuzz.ratio(value.lower(), name.lower())
-        )
-        if fuzz.ratio(value.lower(), best_match.lower()) >= threshold:
-            result_ids.append(candidates[best_match])
-    return result_ids
+    return get_matcher(candidates, aliases).match_ids(values, threshold)
 
 
 def get_criterion_data(bank_id: int, product_id: int, embedding):
-    connection = psycopg2.connect(
-        host=getenv("DATABASE_HOST"),
-        port=getenv("DATABASE_PORT"),
-        database=getenv("DATABASE"),
-        user=getenv("DATABASE_LOGIN"),
-        password=getenv("DATABASE_PASSWORD"),
-    )
     query = """
         SELECT
             id,
@@ -103,33 +91,27 @@ def get_criterion_data(bank_id: int, product_id: int, embedding):
             criterion_embed <=> %s::vector
         LIMIT 1;
     """
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute(query, (embedding, bank_id, product_id, embedding))
-            row = cursor.fetchone()
-            print(row)
-            return row
-    finally:
-        connection.close()
+    with connection() as conn, conn.cursor() as cursor:
+        apply_search_settings(cursor)
+        cursor.execute(query, (embedding, bank_id, product_id, embedding))
+        row = cursor.fetchone()
+        print(row)
+        return row
 
 
 def normalize_value(
-    values: List[str], candidates: Dict[str, id], threshold: int = 80
+    values: List[str],
+    candidates: Dict[str, id],
+    threshold: int = 80,
+    aliases: Optional[Dict[str, str]] = None,
 ) -> str:
     """
     Приводит строку к ближайшему значению из списка вариантов, если схожесть >= threshold.
     Иначе возвращает исходную строку.
     """
-    new_values = []
     if not candidates:
         return values
-    for value in values:
-        best_match = max(candidates, key=lambda x: fuzz.ratio(value.lower(), x.lower()))
-        if fuzz.ratio(value.lower(), best_match.lower()) >= threshold:
-            new_values.append(best_match)
-        else:
-            new_values.append(value)
-    return new_values
+    return get_matcher(candidates, aliases).normalize(values, threshold)
 
 
 def validate_result(query_entities: List[str], bd_entities: List[int]) -> bool:
@@ -140,11 +122,65 @@ def validate_result(query_entities: List[str], bd_entities: List[int]) -> bool:
     return len(query_entities) == len(bd_entities)
 
 
+def find_canonical_id(product_id: int, embedding: List[float]) -> Optional[int]:
+    """
+    Канонический критерий продукта, ближайший к критерию из запроса.
+    Если он найден, поиск идёт по canonical_id, а не по всем векторам пары.
+    """
+    if not criterion_canonicalizer.enabled:
+        return None
+    try:
+        return criterion_canonicalizer.match(product_id, embedding)
+    except Exception as e:
+        print(f"Error matching canonical criterion: {e}")
+        return None
+
+
+def get_criteria_data(
+    criteria_embeddings: List[List[float]],
+    pairs: List[Tuple[int, int]],
+) -> List[List[Tuple[Any, ...]]]:
+    """
+    Получает top-k актуальных записей из bank_analysis для каждого критерия
+    по всем парам (bank_id, product_id) одним запросом.
+
+    Каждый вектор передаётся в подготовленный запрос один раз, тройки
+    (критерий, банк, продукт) ссылаются на него по номеру. Если загружен
+    снимок в памяти (VECTOR_SNAPSHOT_ENABLED), поиск идёт по нему без
+    обращения к БД.
+
+    Args:
+        criteria_embeddings: эмбеддинги различных критериев
+        pairs: список вида [(bank_id, product_id), ...]
+
+    Returns:
+        Для каждого критерия - строки (bank, product, criterion, data, source, ts)
+    """
+    grouped: List[List[Tuple[Any, ...]]] = [[] for _ in criteria_embeddings]
+    if not criteria_embeddings or not pairs:
+        return grouped
+
+    product_ids = {product_id for _, product_id in pairs}
+    items, canonical_ids = [], []
+    for criterion_no, emb in enumerate(criteria_embeddings):
+        canonical_by_product = {
+            product_id: find_canonical_id(product_id, emb) for product_id in product_ids
+        }
+        for bank_id, product_id in pairs:
+            items.append((criterion_no, bank_id, product_id))
+            canonical_ids.append(canonical_by_product[product_id])
+
+    engine = vector_snapshot if vector_snapshot.loaded else criterion_search
+    for row in engine.search_many(criteria_embeddings, items, canonical_ids):
+        grouped[row[0]].append(row[1:])
+    return grouped
+
+
 def get_criterion_data_for_all(
     bank_product_embeddings: List[Tuple[int, int, List[float]]],
 ) -> List[Tuple[Any, ...]]:
     """
-    Получает наиболее релевантную запись из bank_analysis
+    Получает top-k актуальных записей из bank_analysis
     для каждой тройки (bank_id, product_id, embedding).
 
     Args:
@@ -153,50 +189,20 @@ def get_criterion_data_for_all(
     if not bank_product_embeddings:
         return []
 
-    connection = psycopg2.connect(
-        host=getenv("DATABASE_HOST"),
-        port=getenv("DATABASE_PORT"),
-        database=getenv("DATABASE"),
-        user=getenv("DATABASE_LOGIN"),
-        password=getenv("DATABASE_PASSWORD"),
-    )
+    embeddings: Dict[Tuple[float, ...], int] = {}
+    items = []
+    for bank_id, product_id, emb in bank_product_embeddings:
+        criterion_no = embeddings.setdefault(tuple(emb), len(embeddings))
+        items.append((criterion_no, bank_id, product_id))
 
-    try:
-        with connection.cursor() as cursor:
-            values_parts = []
-            for bank_id, product_id, emb in bank_product_embeddings:
-                emb_str = "[" + ",".join(str(x) for x in emb) + "]"
-                values_parts.append(f"({bank_id}, {product_id}, '{emb_str}'::vector)")
-
-            values_clause = ", ".join(values_parts)
-
-            query = f"""
-                SELECT
-                    b.bank AS bank_name,
-                    p.product AS product_name,
-                    ba.criterion,
-                    ba.data,
-                    ba."source",
-                    ba.ts
-                FROM
-                    (VALUES {values_clause}) AS input(bank_id, product_id, embedding)
-                LEFT JOIN LATERAL (
-                    SELECT *
-                    FROM public.bank_analysis ba2
-                    WHERE ba2.bank_id = input.bank_id
-                    AND ba2.product_id = input.product_id
-                    AND (ba2.criterion_embed <=> input.embedding) < 0.4
-                    ORDER BY ba2.criterion_embed <=> input.embedding
-                ) AS ba ON true
-                LEFT JOIN public.banks b ON b.id = input.bank_id
-                LEFT JOIN public.products p ON p.id = input.product_id
-                ORDER BY input.bank_id, input.product_id;
-            """
-            cursor.execute(query)
-            return cursor.fetchall()
-
-    finally:
-        connection.close()
+    criteria_embeddings = [list(emb) for emb in embeddings]
+    canonical_ids = [
+        find_canonical_id(product_id, criteria_embeddings[criterion_no])
+        for criterion_no, _, product_id in items
+    ]
+    engine = vector_snapshot if vector_snapshot.loaded else criterion_search
+    rows = engine.search_many(criteria_embeddings, items, canonical_ids)
+    return [row[1:] for row in rows]
 
 
 @tool(parse_docstring=True)
@@ -209,24 +215,36 @@ def get_user_request_data_from_db(
     Args:
         user_text: Фраза пользователя.
     """
-    reference_banks = get_data_list("SELECT * FROM banks;")
-    reference_products = get_data_list("SELECT id, product FROM products;")
+    reference = reference_cache.get()
+    reference_banks = reference.bank_ids_by_name
+    reference_products = reference.product_ids_by_name
     structured_llm = llm.with_structured_output(UserRequest)
 
     prompt = f"Извлеки из запроса пользователя: {user_text} нужные поля для поиска информации о банках"
 
     try:
-        result: UserRequest = structured_llm.invoke(prompt)
-        banks = normalize_value_to_ids(result.bank_names, reference_banks)
-        products = normalize_value_to_ids(result.products, reference_products)
-        criterias = [result.criteria]
-        results = []
-        for criteria in criterias:
-            bank_product_embeddings = [
-                (bank, product, get_embedding(criteria))
-                for bank, product in product(banks, products)
-            ]
-            results.append(get_criterion_data_for_all(bank_product_embeddings))
+        extraction = entity_extractor.try_extract(user_text, reference)
+        if extraction is not None:
+            result = UserRequest(
+                bank_names=extraction.bank_names,
+                products=extraction.products,
+                criteria=extraction.criteria,
+            )
+        else:
+            start = time.perf_counter()
+            result: UserRequest = structured_llm.invoke(prompt)
+            entity_extractor.record_llm((time.perf_counter() - start) * 1000)
+        banks = normalize_value_to_ids(
+            result.bank_names, reference_banks, aliases=BANK_ALIASES
+        )
+        products = normalize_value_to_ids(
+            result.products, reference_products, aliases=PRODUCT_ALIASES
+        )
+        criterias = list(dict.fromkeys(result.criteria or []))
+        results = get_criteria_data(
+            get_embeddings(criterias) if criterias else [],
+            list(product(banks, products)),
+        )
         import pandas as pd
 
         all_rows = []
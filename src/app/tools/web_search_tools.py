@@ -1,16 +1,21 @@
+import asyncio
 import os
-import re
 import sys
+import threading
 import time
 import traceback
-from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import List
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
 
 import httpx
-from bs4 import BeautifulSoup
 from langchain_core.tools import tool
 
+from src.app.infra.cache.fetch_cache import CachedPage, FetchCache, get_fetch_cache
+from src.app.infra.cache.search_cache import SearchCache, get_search_cache
+from src.app.infra.db.pool import connection
+from src.app.tools.html_extractor import get_extractor
+
 
 @dataclass
 class SearchResult:
@@ -21,40 +26,96 @@ class SearchResult:
 
 
 class RateLimiter:
-    def __init__(self, requests_per_minute: int = 30):
-        self.requests_per_minute = requests_per_minute
-        self.requests = []
-
-    def acquire(self):
-        now = datetime.now()
-   
-        self.requests = [
-            req for req in self.requests if now - req < timedelta(minutes=1)
-        ]
+    """
+    Token bucket: в среднем requests_per_minute запросов в минуту и не более
+    burst запросов подряд (по умолчанию burst = requests_per_minute).
 
-        if len(self.requests) >= self.requests_per_minute:
+    Потокобезопасен. acquire() ждёт через time.sleep, aacquire() - через
+    asyncio.sleep и не блокирует event loop. Если задан name и
+    RATE_LIMIT_BACKEND=postgres, корзина хранится в таблице rate_limits и
+    общая для всех процессов; при недоступности БД используется локальная.
+    """
 
-            oldest_request = self.requests[0]
-            wait_time = (oldest_request + timedelta(minutes=1) - now).total_seconds()
-            if wait_time > 0:
-                time.sleep(wait_time)  
+    def __init__(
+        self,
+        requests_per_minute: int = 30,
+        burst: Optional[int] = None,
+        name: Optional[str] = None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or requests_per_minute)
+        self.name = name
+        self.shared = (
+            name is not None and os.getenv("RATE_LIMIT_BACKEND", "local") == "postgres"
+        )
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve_local(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def _reserve_shared(self) -> float:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT rate_limit_acquire(%s, %s, %s)",
+                (self.name, self.rate, self.capacity),
+            )
+            return float(cursor.fetchone()[0])
+
+    def _reserve(self) -> float:
+        """Пытается взять токен: 0 - получен, иначе сколько секунд подождать"""
+        if self.shared:
+            try:
+                return self._reserve_shared()
+            except Exception as e:
+                print(
+                    f"Shared rate limit '{self.name}' unavailable, using local bucket: {str(e)}",
+                    file=sys.stderr,
+                )
+        return self._reserve_local()
 
-        self.requests.append(now)
+    def acquire(self):
+        while True:
+            wait_time = self._reserve()
+            if wait_time <= 0:
+                return
+            time.sleep(wait_time)
+
+    async def aacquire(self):
+        while True:
+            if self.shared:
+                wait_time = await asyncio.to_thread(self._reserve)
+            else:
+                wait_time = self._reserve()
+            if wait_time <= 0:
+                return
+            await asyncio.sleep(wait_time)
 
 
 class SerperSearcher:
     BASE_URL = "https://google.serper.dev/search"
 
-    def __init__(self):
+    def __init__(self, cache: Optional[SearchCache] = None):
         self.api_key = os.getenv("SERPER_API_KEY")
         if not self.api_key:
             raise ValueError("SERPER_API_KEY environment variable is not set")
 
         self.headers = {"X-API-KEY": self.api_key, "Content-Type": "application/json"}
+        self.client = httpx.Client(headers=self.headers, timeout=30.0)
     
-        self.rate_limiter = RateLimiter(
-            requests_per_minute=5
-        )  
+        self.rate_limiter = RateLimiter(requests_per_minute=5, name="serper")
+        self.cache = cache if cache is not None else get_search_cache()
 
     def format_results_for_llm(self, results: List[SearchResult]) -> str:
         """Format results in a natural language style that's easier for LLMs to process"""
@@ -73,18 +134,19 @@ class SerperSearcher:
         return "\n".join(output)
 
     def search(self, query: str, max_results: int = 10) -> List[SearchResult]:
+        if self.cache is not None:
+            cached = self.cache.get(query, max_results)
+            if cached is not None:
+                return [SearchResult(**result) for result in cached]
+
         try:
-    
             self.rate_limiter.acquire()
 
             payload = {"q": query, "num": max_results}
 
-            with httpx.Client() as client:
-                response = client.post(
-                    self.BASE_URL, json=payload, headers=self.headers, timeout=30.0
-                )
-                response.raise_for_status()
-                data = response.json()
+            response = self.client.post(self.BASE_URL, json=payload)
+            response.raise_for_status()
+            data = response.json()
 
   
             if "error" in data:
@@ -104,6 +166,12 @@ class SerperSearcher:
                     )
                 )
 
+            # Пустой ответ не кешируем: он может быть следствием сбоя API
+            if results and self.cache is not None:
+                self.cache.set(
+                    query, max_results, [asdict(result) for result in results]
+                )
+
             return results
 
         except httpx.TimeoutException:
@@ -121,61 +189,91 @@ class SerperSearcher:
 
 
 class WebContentFetcher:
-    def __init__(self):
-        self.rate_limiter = RateLimiter(requests_per_minute=20)
+    USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+    def __init__(self, cache: Optional[FetchCache] = None):
+        self.rate_limiter = RateLimiter(requests_per_minute=20, name="fetch")
+        self.cache = cache if cache is not None else get_fetch_cache()
+        self.extractor = get_extractor()
+        self.client = httpx.Client(
+            headers={"User-Agent": self.USER_AGENT},
+            follow_redirects=True,
+            timeout=30.0,
+        )
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    def parse_html(self, html: str) -> str:
+        """Extract readable text from a webpage"""
+        text = self.extractor.extract(html)
+
+        if len(text) > 10000:
+            text = text[:10000] + "... [content truncated]"
+
+        return text
 
     def fetch_and_parse(self, url: str) -> str:
-        """Fetch and parse content from a webpage"""
-        try:
-            self.rate_limiter.acquire()
+        """
+        Fetch and parse content from a webpage.
 
-            with httpx.Client() as client:
-                response = client.get(
-                    url,
-                    headers={
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                    },
-                    follow_redirects=True,
-                    timeout=30.0,
-                )
-                response.raise_for_status()
-
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            for element in soup(
-                [
-                    "script",
-                    "style",
-                    "nav",
-                    "header",
-                    "footer",
-                    "iframe",
-                    "noscript",
-                    "aside",
-                    "form",
-                ]
-            ):
-                element.decompose()
-
-            main_content = (
-                soup.find("main")
-                or soup.find("article")
-                or soup.find(id=re.compile("content|main|article", re.I))
-                or soup.find(class_=re.compile("content|main|article", re.I))
-                or soup.body
-            )
+        Concurrent calls for the same URL share a single download.
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[url] = future
 
-            if main_content:
-                text = main_content.get_text(separator=" ", strip=True)
-            else:
-                text = soup.get_text(separator=" ", strip=True)
+        if not owner:
+            return future.result()
 
-            text = re.sub(r"\s+", " ", text).strip()
-            text = re.sub(r"[^\x00-\x7F]+", " ", text)
+        try:
+            text = self._fetch_and_parse(url)
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(url, None)
+
+    def _fetch_and_parse(self, url: str) -> str:
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and cached.extractor != self.extractor.name:
+            # Текст извлечён другим движком: перекачиваем страницу целиком
+            cached = None
+        if cached is not None and self.cache.is_fresh(cached):
+            self.cache.record("fresh_hits")
+            return cached.text
 
-            if len(text) > 10000:
-                text = text[:10000] + "... [content truncated]"
+        try:
+            self.rate_limiter.acquire()
 
+            response = self.client.get(
+                url, headers=cached.conditional_headers() if cached else None
+            )
+            if response.status_code == 304 and cached is not None:
+                # Страница не изменилась: повторный парсинг не нужен
+                self.cache.record("revalidated")
+                self.cache.put(cached)
+                return cached.text
+            response.raise_for_status()
+
+            text = self.parse_html(response.text)
+
+            if self.cache is not None:
+                self.cache.record("misses")
+                self.cache.put(
+                    CachedPage(
+                        url=url,
+                        text=text,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                        extractor=self.extractor.name,
+                    )
+                )
             return text
 
         except httpx.TimeoutException:
@@ -202,7 +300,7 @@ class DuckDuckGoSearcher:
     }
 
     def __init__(self):
-        self.rate_limiter = RateLimiter()
+        self.rate_limiter = RateLimiter(name="duckduckgo")
 
     def format_results_for_llm(self, results: List[SearchResult]) -> str:
         """Format results in a natural language style that's easier for LLMs to process"""
@@ -0,0 +1,6 @@
+import os
+
+# src.app.infra.llm.client создаёт клиентов ChatOpenAI при импорте, а им нужно
+# имя модели; тесты не обращаются к LLM, поэтому подойдут заглушки
+os.environ.setdefault("MODEL", "test-model")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from os import getenv
+
+import pytest
+
+from src.app.infra.db import criterion_search as search_module
+from src.app.infra.db.criterion_canon import to_vector_literal
+from src.app.infra.db.criterion_search import CriterionSearchEngine
+from src.app.infra.embedder.client import EMBEDDING_DIM
+
+pytestmark = pytest.mark.skipif(
+    not getenv("DATABASE_HOST"), reason="нужна PostgreSQL с pgvector (DATABASE_HOST)"
+)
+
+
+def unit_vector(position: int):
+    vector = [0.0] * EMBEDDING_DIM
+    vector[position] = 1.0
+    return vector
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Соединение, все изменения которого откатываются после теста"""
+    from src.app.infra.db.connection import create_connection
+
+    conn = create_connection()
+
+    @contextmanager
+    def connection(timeout=None):
+        yield conn
+
+    monkeypatch.setattr(search_module, "connection", connection)
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("DEALLOCATE ALL")
+        conn.close()
+
+
+def insert_pair(cursor):
+    cursor.execute(
+        "INSERT INTO banks (bank) VALUES (%s) RETURNING id",
+        (f"test-bank-{datetime.now().timestamp()}",),
+    )
+    bank_id = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO products (product) VALUES ('test') RETURNING id")
+    return bank_id, cursor.fetchone()[0]
+
+
+def insert_row(cursor, bank_id, product_id, criterion, data, ts, vector):
+    cursor.execute(
+        """
+        INSERT INTO bank_analysis
+            (bank_id, product_id, criterion, criterion_embed, "source", data, ts)
+        VALUES (%s, %s, %s, %s::vector, 'https://bank.example', %s, %s)
+        """,
+        (bank_id, product_id, criterion, to_vector_literal(vector), data, ts),
+    )
+
+
+def test_returns_newest_value_of_same_named_rows(db):
+    with db.cursor() as cursor:
+        bank_id, product_id = insert_pair(cursor)
+        day = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # Один и тот же критерий извлекался каждый день с одинаковым вектором
+        for offset in range(10):
+            insert_row(
+                cursor,
+                bank_id,
+                product_id,
+                "ставка",
+                f"{offset}%",
+                day + timedelta(days=offset),
+                unit_vector(0),
+            )
+        insert_row(cursor, bank_id, product_id, "срок", "1 год", day, unit_vector(1))
+
+    engine = CriterionSearchEngine(k=1, max_distance=0.4, overfetch=1)
+    rows = engine.search(unit_vector(0), [(bank_id, product_id)])
+
+    assert [(row[2], row[3]) for row in rows] == [("ставка", "9%")]
+    assert rows[0][5] == day + timedelta(days=9)
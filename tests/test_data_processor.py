@@ -0,0 +1,137 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from src.app.tools.data_processor import DataProcessor, ExtractedCriterion
+
+
+class FakeLLM:
+    def __init__(self, content: str):
+        self.content = content
+
+    async def ainvoke(self, messages):
+        return SimpleNamespace(content=self.content)
+
+
+def make_record(record_id: int) -> dict:
+    return {
+        "id": record_id,
+        "bank_id": 1,
+        "product_id": 1,
+        "raw_data": f"Ставка по вкладу {record_id}%",
+    }
+
+
+def make_processor(response: dict) -> DataProcessor:
+    processor = DataProcessor(max_concurrency=2)
+    processor.llm = FakeLLM(json.dumps(response, ensure_ascii=False))
+    processor.get_bank_and_product_names = lambda bank_id, product_id: (
+        "Банк",
+        "вклады",
+    )
+    return processor
+
+
+def test_parse_packed_response_marks_omitted_records_as_failed():
+    processor = DataProcessor(max_concurrency=1)
+    response = {
+        "records": [
+            {"id": 1, "criteria": [{"criterion": "ставка", "value": "1%"}]},
+            {"id": 3, "criteria": []},
+        ]
+    }
+
+    by_id = processor.parse_packed_criteria_response(json.dumps(response), [1, 2, 3])
+
+    assert [c.value for c in by_id[1]] == ["1%"]
+    assert by_id[2] is None
+    assert by_id[3] == []
+
+
+def test_packed_extraction_retries_omitted_record_individually():
+    processor = make_processor(
+        {
+            "records": [
+                {"id": 1, "criteria": [{"criterion": "ставка", "value": "1%"}]},
+                {"id": 3, "criteria": [{"criterion": "ставка", "value": "3%"}]},
+            ]
+        }
+    )
+    retried = []
+
+    async def fake_single(record, semaphore, criteria_list=None):
+        retried.append(record["id"])
+        return [ExtractedCriterion(criterion="ставка", value="2%")]
+
+    processor.aextract_record_criteria = fake_single
+
+    by_id = asyncio.run(
+        processor.aextract_packed_criteria(
+            [make_record(1), make_record(2), make_record(3)], asyncio.Semaphore(2)
+        )
+    )
+
+    assert retried == [2]
+    assert {record_id: [c.value for c in criteria] for record_id, criteria in by_id.items()} == {
+        1: ["1%"],
+        2: ["2%"],
+        3: ["3%"],
+    }
+
+
+def test_omitted_record_stays_unprocessed_when_retry_fails():
+    processor = make_processor(
+        {"records": [{"id": 1, "criteria": [{"criterion": "ставка", "value": "1%"}]}]}
+    )
+
+    async def failing_single(record, semaphore, criteria_list=None):
+        return None
+
+    processor.aextract_record_criteria = failing_single
+
+    by_id = asyncio.run(
+        processor.aextract_packed_criteria(
+            [make_record(1), make_record(2)], asyncio.Semaphore(2)
+        )
+    )
+
+    assert by_id[2] is None
+
+
+class PerRecordLLM:
+    """Отвечает по маркеру записи в тексте запроса"""
+
+    def __init__(self, responses: dict):
+        self.responses = responses
+
+    async def ainvoke(self, messages):
+        prompt = messages[-1].content
+        for marker, content in self.responses.items():
+            if marker in prompt:
+                return SimpleNamespace(content=content)
+        raise AssertionError("unexpected prompt")
+
+
+def test_malformed_response_leaves_record_unprocessed():
+    processor = DataProcessor(max_concurrency=2)
+    processor.pack_tokens = 0
+    processor.get_bank_and_product_names = lambda bank_id, product_id: (
+        "Банк",
+        "вклады",
+    )
+    processor.llm = PerRecordLLM(
+        {
+            "запись-1": "Извините, не могу ответить",
+            "запись-2": '{"criteria": []}',
+        }
+    )
+    records = [
+        {"id": 1, "bank_id": 1, "product_id": 1, "raw_data": "запись-1"},
+        {"id": 2, "bank_id": 1, "product_id": 1, "raw_data": "запись-2"},
+    ]
+
+    criteria, processed_ids = asyncio.run(processor.aprocess_records(records))
+
+    # Страница без критериев обработана, сбой разбора - нет
+    assert criteria == []
+    assert processed_ids == [2]
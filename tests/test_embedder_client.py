@@ -0,0 +1,19 @@
+import asyncio
+
+from src.app.infra.embedder import client as client_module
+from src.app.infra.embedder.client import EmbedderClient, async_embedder_session
+
+
+def test_session_closes_async_client_before_loop_ends(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_ENABLED", "0")
+    embedder = EmbedderClient(base_url="http://embedder.test", model="test")
+    monkeypatch.setattr(client_module, "_embedder", embedder)
+
+    async def run():
+        async with async_embedder_session():
+            return embedder._get_async_client()
+
+    async_client = asyncio.run(run())
+
+    assert async_client.is_closed
+    assert embedder._async_clients == {}
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from src.app.infra.embedder.cache import EmbeddingCache
+
+
+def make_cache(tmp_path) -> EmbeddingCache:
+    return EmbeddingCache("test-model", path=str(tmp_path / "embeddings.sqlite3"))
+
+
+def test_async_path_dedups_normalized_texts(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    async def compute(texts):
+        calls.append(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    result = asyncio.run(
+        cache.aget_or_compute(["Ставка", " ставка ", "Срок", "Ставка"], compute)
+    )
+
+    assert calls == [["Ставка", "Срок"]]
+    assert result[0] == result[1] == result[3]
+
+
+def test_async_path_does_not_cache_zero_vectors(tmp_path):
+    cache = make_cache(tmp_path)
+
+    async def compute(texts):
+        return [[0.0, 0.0] for _ in texts]
+
+    asyncio.run(cache.aget_or_compute(["ставка"], compute))
+
+    assert cache.get_many(["ставка"]) == {}
+
+
+def test_async_path_rejects_wrong_number_of_embeddings(tmp_path):
+    cache = make_cache(tmp_path)
+
+    async def compute(texts):
+        return [[1.0]]
+
+    with pytest.raises(ValueError):
+        asyncio.run(cache.aget_or_compute(["ставка", "срок"], compute))
@@ -0,0 +1,53 @@
+import pytest
+
+from src.app.tools.html_extractor import LxmlExtractor, SoupExtractor
+
+RATES_TABLE = """
+<table>
+  <tr><td>Срок</td><td>Ставка</td></tr>
+  <tr><td>3 месяца</td><td>18%</td></tr>
+  <tr><td>1 год</td><td>16%</td></tr>
+</table>
+"""
+
+TOOLTIP_BEFORE_PRODUCT = f"""
+<html><body>
+  <span class="tooltip-content">Подсказка</span>
+  <div class="product">
+    <h1>Вклад «Надёжный»</h1>
+    {RATES_TABLE}
+  </div>
+</body></html>
+"""
+
+TOOLTIP_BEFORE_MAIN_CONTENT = f"""
+<html><body>
+  <span class="tooltip-content">Подсказка</span>
+  <div id="sidebar">Курсы валют</div>
+  <div class="main-content">
+    <h1>Вклад «Надёжный»</h1>
+    {RATES_TABLE}
+  </div>
+</body></html>
+"""
+
+
+@pytest.fixture(params=[LxmlExtractor, SoupExtractor], ids=["lxml", "bs4"])
+def extractor(request):
+    return request.param()
+
+
+def test_small_matching_block_does_not_replace_page(extractor):
+    text = extractor.extract(TOOLTIP_BEFORE_PRODUCT)
+
+    assert "Вклад «Надёжный»" in text
+    assert "3 месяца: 18%" in text
+    assert "1 год: 16%" in text
+
+
+def test_largest_matching_block_is_main_content(extractor):
+    text = extractor.extract(TOOLTIP_BEFORE_MAIN_CONTENT)
+
+    assert "3 месяца: 18%" in text
+    assert "Подсказка" not in text
+    assert "Курсы валют" not in text
@@ -0,0 +1,44 @@
+from src.app.infra.cache.sqlite_store import SqliteStore
+
+
+def make_store(tmp_path, max_entries=None) -> SqliteStore:
+    return SqliteStore(str(tmp_path / "store.sqlite3"), "items", max_entries)
+
+
+def stored_keys(store: SqliteStore) -> set:
+    rows = store._conn.execute(f"SELECT key FROM {store.table}").fetchall()
+    return {row[0] for row in rows}
+
+
+def test_row_count_tracks_inserts_replaces_and_deletes(tmp_path):
+    store = make_store(tmp_path)
+    store.set_many([("a", b"1"), ("b", b"2"), ("a", b"3")])
+    store.set("b", b"4")
+    store.delete("a")
+    store.delete("missing")
+
+    assert len(store) == 1
+    assert len(make_store(tmp_path)) == 1
+
+
+def test_reads_do_not_write_until_flush(tmp_path):
+    store = make_store(tmp_path)
+    store.set("a", b"1")
+    before = store._conn.total_changes
+
+    assert store.get("a")[0] == b"1"
+    assert store._conn.total_changes == before
+
+    store.flush()
+    assert store._conn.total_changes == before + 1
+
+
+def test_eviction_keeps_recently_read_entries(tmp_path):
+    store = make_store(tmp_path, max_entries=3)
+    for key in "abc":
+        store.set(key, key.encode())
+    store.get("a")
+    store.set("d", b"d")
+
+    assert stored_keys(store) == {"a", "c", "d"}
+    assert len(store) == 3
@@ -0,0 +1,63 @@
+import struct
+import time
+from datetime import datetime, timezone
+
+from src.app.domain.models import CriterionWithEmbedding
+from src.app.infra.db import vector_snapshot as snapshot_module
+from src.app.infra.db.reference_cache import ReferenceData
+from src.app.infra.db.vector_snapshot import VectorSnapshot, parse_vector
+
+
+def test_parse_vector_reads_pgvector_binary_format():
+    value = memoryview(struct.pack(">hh3f", 3, 0, 1.5, -2.0, 0.25))
+
+    assert parse_vector(value).tolist() == [1.5, -2.0, 0.25]
+
+
+def test_search_does_not_reload_inline(monkeypatch):
+    monkeypatch.setattr(
+        snapshot_module.reference_cache,
+        "get",
+        lambda: ReferenceData(banks={1: "Банк"}, products={2: "вклады"}),
+    )
+    snapshot = VectorSnapshot(k=5, max_distance=0.4, refresh_interval=0, reload_interval=0)
+    snapshot._loaded = True
+    snapshot.add(
+        [
+            CriterionWithEmbedding(
+                bank_id=1,
+                product_id=2,
+                criterion="ставка",
+                criterion_embed=[1.0, 0.0],
+                source="https://bank.example",
+                data="18%",
+                ts=datetime(2026, 1, 1, tzinfo=timezone.utc),
+            )
+        ]
+    )
+
+    def fail():
+        raise AssertionError("reload must not run inside search")
+
+    monkeypatch.setattr(snapshot, "load", fail)
+    monkeypatch.setattr(snapshot, "refresh", fail)
+
+    rows = snapshot.search([1.0, 0.0], [(1, 2)])
+
+    assert [row[2:4] for row in rows] == [("ставка", "18%")]
+
+
+def test_background_thread_reloads_snapshot(monkeypatch):
+    snapshot = VectorSnapshot(refresh_interval=0.01, reload_interval=0.01)
+    loads = []
+    monkeypatch.setattr(snapshot, "load", lambda: loads.append(time.monotonic()))
+
+    snapshot.start()
+    try:
+        deadline = time.monotonic() + 2
+        while len(loads) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        snapshot.stop(timeout=1)
+
+    assert len(loads) >= 2